@@ -0,0 +1,95 @@
+import argparse
+import base64
+import json
+import math
+import sys
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import List, Optional, Dict, Any, AsyncIterator, Awaitable, Callable
+
+api_prefix = '/api/v1/depot'
+
+
+def auth_headers(sub: str, roles: List[str] = None) -> Dict[str, str]:
+    """Returns the headers to authenticate as the given user with the mock authentication of the tests."""
+    token = base64.urlsafe_b64encode(json.dumps({'sub': sub, 'roles': roles or [], 'teams': []}).encode()).decode()
+    return {'authorization': f"Bearer {token}"}
+
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '--mock', action='store_true',
+        help="Run against the mongomock stand-in of the tests instead of the configured mongo",
+    )
+    parser.add_argument('--output', default=None, help="Write the JSON report to this file instead of stdout")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the generated data")
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return math.nan
+    idx = min(len(sorted_samples) - 1, max(0, math.ceil(q * len(sorted_samples)) - 1))
+    return sorted_samples[idx]
+
+
+def summarize(samples: List[float], duration: Optional[float] = None) -> Dict[str, float]:
+    """Summarizes latencies given in seconds, the result is in milliseconds."""
+    sorted_samples = sorted(samples)
+    result = {
+        'count': len(samples),
+        'mean_ms': sum(samples) / len(samples) * 1000 if samples else math.nan,
+        'p50_ms': percentile(sorted_samples, 0.5) * 1000,
+        'p95_ms': percentile(sorted_samples, 0.95) * 1000,
+        'p99_ms': percentile(sorted_samples, 0.99) * 1000,
+        'max_ms': sorted_samples[-1] * 1000 if sorted_samples else math.nan,
+    }
+    if duration is not None:
+        result['throughput_per_s'] = len(samples) / duration if duration > 0 else math.nan
+    return result
+
+
+async def measure(fn: Callable[[], Awaitable[Any]], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        start = perf_counter()
+        await fn()
+        samples.append(perf_counter() - start)
+    return samples
+
+
+def write_report(report: Dict[str, Any], output: Optional[str]):
+    if output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+@asynccontextmanager
+async def database(mock: bool) -> AsyncIterator[None]:
+    """
+    Starts the database collections. Without `mock`, this connects to the configured mongo (use
+    `API_CONFIG_MONGO_URI` to point it to a scratch database, whose name must contain "bench", as the benchmarks
+    overwrite data).
+    """
+    mp = None
+    if mock:
+        from tests.motor_mock import patch_motor
+        mp = patch_motor()
+    from depot_server.db import connection, startup, shutdown
+    from depot_server.db.collections import wait_for_indexes
+    await startup()
+    try:
+        await wait_for_indexes()
+        if not mock:
+            assert connection.async_db is not None
+            if 'bench' not in connection.async_db.name:
+                raise RuntimeError(
+                    f"Refusing to overwrite database {connection.async_db.name}, use a database named *bench*"
+                )
+        yield
+    finally:
+        await shutdown()
+        if mp is not None:
+            mp.undo()
@@ -0,0 +1,155 @@
+"""
+Generates a synthetic depot: bays, items, item history and reservations.
+
+Item popularity is skewed: with `skew` = 1 all items are equally likely to be reserved and changed, larger values
+concentrate reservations and history on few items (item `i` is picked with `int(n * random() ** skew)`).
+"""
+import random
+import sys
+from dataclasses import dataclass, field
+from datetime import date, timedelta, datetime
+from typing import List
+from uuid import UUID, uuid4
+
+import pytz
+
+_batch_size = 5000
+
+
+@dataclass
+class DepotSpec:
+    bays: int = 200
+    items: int = 100_000
+    history: int = 1_000_000
+    reservations: int = 200_000
+    # Reservations are spread over this many days around today
+    days: int = 730
+    users: int = 2000
+    skew: float = 2.0
+
+    def scaled(self, scale: float) -> 'DepotSpec':
+        return DepotSpec(
+            bays=max(1, int(self.bays * scale)),
+            items=max(1, int(self.items * scale)),
+            history=int(self.history * scale),
+            reservations=int(self.reservations * scale),
+            days=self.days,
+            users=max(1, int(self.users * scale)),
+            skew=self.skew,
+        )
+
+
+@dataclass
+class Depot:
+    spec: DepotSpec
+    bay_ids: List[UUID] = field(default_factory=list)
+    item_ids: List[UUID] = field(default_factory=list)
+    group_ids: List[str] = field(default_factory=list)
+
+    def pick_item(self, rng: random.Random) -> UUID:
+        return self.item_ids[int(len(self.item_ids) * rng.random() ** self.spec.skew)]
+
+
+def _progress(name: str, done: int, total: int):
+    sys.stderr.write(f"\rGenerating {name}: {done}/{total}")
+    if done >= total:
+        sys.stderr.write('\n')
+    sys.stderr.flush()
+
+
+async def _insert_batched(collection, name: str, total: int, make_document):
+    for offset in range(0, total, _batch_size):
+        await collection.insert_many([make_document(idx) for idx in range(offset, min(total, offset + _batch_size))])
+        _progress(name, min(total, offset + _batch_size), total)
+
+
+async def generate(rng: random.Random, spec: DepotSpec) -> Depot:
+    """Replaces the bays, items, item history and reservations by generated ones."""
+    from depot_server.db import collections, DbBay, DbItem, DbItemState, DbReservation, DbItemStateChanges, \
+        DbStrChange, DbItemConditionChange
+    from depot_server.helper.item_reservation_status import task_sweep_item_reservation_status
+    from depot_server.helper.utilization import task_rebuild_utilization
+    from depot_server.model import ItemCondition, ReservationType
+
+    for collection in (
+            collections.bay_collection, collections.item_collection, collections.item_state_collection,
+            collections.reservation_collection, collections.item_utilization_collection,
+    ):
+        await collection.delete_many({})
+
+    depot = Depot(spec)
+    depot.bay_ids = [uuid4() for _ in range(spec.bays)]
+    depot.item_ids = [uuid4() for _ in range(spec.items)]
+    depot.group_ids = [f'group_{idx}' for idx in range(max(1, spec.items // 10))]
+    conditions = [ItemCondition.Good, ItemCondition.Good, ItemCondition.Good, ItemCondition.Ok, ItemCondition.Bad]
+    today = date.today()
+    now = datetime.now(pytz.UTC)
+
+    await _insert_batched(collections.bay_collection, 'bays', spec.bays, lambda idx: DbBay(
+        id=depot.bay_ids[idx], external_id=f'bay_{idx}', name=f"Bay {idx}", description=f"Bay number {idx}",
+    ))
+    await _insert_batched(collections.item_collection, 'items', spec.items, lambda idx: DbItem(
+        id=depot.item_ids[idx],
+        external_id=f'item_{idx}',
+        name=f"Item {idx}",
+        description=f"Generated item {idx}",
+        condition=ItemCondition.Gone if rng.random() < 0.02 else rng.choice(conditions),
+        purchase_date=today - timedelta(days=rng.randrange(3650)),
+        group_id=rng.choice(depot.group_ids) if rng.random() < 0.5 else None,
+        tags=rng.sample(['rope', 'tent', 'stove', 'helmet', 'harness', 'lamp', 'bag'], rng.randrange(4)),
+        bay_id=rng.choice(depot.bay_ids),
+    ))
+
+    def make_state(idx: int) -> DbItemState:
+        changes = DbItemStateChanges()
+        if rng.random() < 0.5:
+            changes.condition = DbItemConditionChange(previous=rng.choice(conditions), next=rng.choice(conditions))
+        else:
+            changes.description = DbStrChange(previous=f"Description {idx - 1}", next=f"Description {idx}")
+        return DbItemState(
+            id=uuid4(),
+            item_id=depot.pick_item(rng),
+            timestamp=now - timedelta(minutes=rng.randrange(spec.days * 24 * 60)),
+            changes=changes,
+            user_id=f'user{rng.randrange(spec.users)}',
+            comment=f"Change {idx}",
+        )
+
+    await _insert_batched(collections.item_state_collection, 'history', spec.history, make_state)
+
+    def make_reservation(idx: int) -> DbReservation:
+        start = today + timedelta(days=rng.randrange(-spec.days // 2, spec.days // 2))
+        item_count = min(spec.items, 1 + int(rng.expovariate(0.3)))
+        return DbReservation(
+            id=uuid4(),
+            type=ReservationType.PRIVATE,
+            name=f"Reservation {idx}",
+            start=start,
+            end=start + timedelta(days=rng.randrange(0, 7)),
+            user_id=f'user{rng.randrange(spec.users)}',
+            contact="12345",
+            items=list({depot.pick_item(rng) for _ in range(item_count)}),
+            returned=start < today and rng.random() < 0.95,
+        )
+
+    # The generated reservations may overlap, this is only about the query load
+    await _insert_batched(
+        collections.reservation_collection, 'reservations', spec.reservations, make_reservation
+    )
+    sys.stderr.write("Updating denormalized item status and utilization\n")
+    await task_sweep_item_reservation_status()
+    await task_rebuild_utilization()
+    return depot
+
+
+async def load(spec: DepotSpec) -> Depot:
+    """Loads the ids of an existing (generated) depot, e.g. to rerun a benchmark without generating again."""
+    from depot_server.db import collections
+
+    depot = Depot(spec)
+    depot.bay_ids = [bay['_id'] async for bay in collections.bay_collection.collection.find({}, projection={'_id': 1})]
+    depot.item_ids = [
+        item['_id'] async for item in collections.item_collection.collection.find({}, projection={'_id': 1})
+    ]
+    depot.group_ids = await collections.item_collection.collection.distinct('group_id')
+    return depot
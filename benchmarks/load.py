@@ -0,0 +1,201 @@
+"""
+End-to-end load benchmark: drives the FastAPI app in-process with concurrent async clients against a generated depot
+(see `benchmarks.generator`) and reports throughput and latency percentiles per endpoint.
+
+    python -m benchmarks.load --mock --scale 0.01
+    API_CONFIG_MONGO_URI=mongodb://127.0.0.1:27017/depot_bench python -m benchmarks.load --output load.json
+    API_CONFIG_MONGO_URI=mongodb://127.0.0.1:27017/depot_bench python -m benchmarks.load --skip-generate
+
+Requests are authenticated with the mock authentication of the tests, so no OAuth server is needed.
+"""
+import argparse
+import asyncio
+import random
+import subprocess
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.common import add_common_arguments, api_prefix, auth_headers, database, summarize, write_report
+from benchmarks.generator import Depot, DepotSpec, generate, load
+
+
+@dataclass
+class Scenario:
+    name: str
+    weight: float
+    request: Callable[[httpx.AsyncClient, random.Random, Depot], Awaitable[httpx.Response]]
+
+
+def _random_window(rng: random.Random, depot: Depot, max_days: int) -> Tuple[date, date]:
+    start = date.today() + timedelta(days=rng.randrange(-depot.spec.days // 2, depot.spec.days // 2))
+    return start, start + timedelta(days=rng.randrange(max_days))
+
+
+async def _get_items(client: httpx.AsyncClient, rng: random.Random, depot: Depot) -> httpx.Response:
+    return await client.get(f'{api_prefix}/items', headers=auth_headers(f'user{rng.randrange(depot.spec.users)}'))
+
+
+async def _get_items_available(client: httpx.AsyncClient, rng: random.Random, depot: Depot) -> httpx.Response:
+    return await client.get(
+        f'{api_prefix}/items', params={'available': 'true'},
+        headers=auth_headers(f'user{rng.randrange(depot.spec.users)}'),
+    )
+
+
+async def _get_item_history(client: httpx.AsyncClient, rng: random.Random, depot: Depot) -> httpx.Response:
+    return await client.get(
+        f'{api_prefix}/items/{depot.pick_item(rng)}/history', params={'limit': 50},
+        headers=auth_headers(f'user{rng.randrange(depot.spec.users)}'),
+    )
+
+
+async def _get_reservations_items(client: httpx.AsyncClient, rng: random.Random, depot: Depot) -> httpx.Response:
+    start, end = _random_window(rng, depot, 7)
+    return await client.get(
+        f'{api_prefix}/reservations/items', params={'start': start.isoformat(), 'end': end.isoformat()},
+        headers=auth_headers(f'user{rng.randrange(depot.spec.users)}'),
+    )
+
+
+async def _get_reservations_window(client: httpx.AsyncClient, rng: random.Random, depot: Depot) -> httpx.Response:
+    start, end = _random_window(rng, depot, 42)
+    return await client.get(
+        f'{api_prefix}/reservations',
+        params={
+            'start': start.isoformat(), 'end': end.isoformat(), 'item_id': str(depot.pick_item(rng)),
+            'limit_before_start': 5, 'limit_after_end': 5,
+        },
+        headers=auth_headers(f'user{rng.randrange(depot.spec.users)}'),
+    )
+
+
+async def _create_reservation(client: httpx.AsyncClient, rng: random.Random, depot: Depot) -> httpx.Response:
+    # Exercises _check_items, conflicts (400) are expected with skewed items
+    start = date.today() + timedelta(days=rng.randrange(1, depot.spec.days // 2))
+    return await client.post(
+        f'{api_prefix}/reservations',
+        json={
+            'type': 'private',
+            'name': "Load Reservation",
+            'start': start.isoformat(),
+            'end': (start + timedelta(days=rng.randrange(7))).isoformat(),
+            'contact': "12345",
+            'items': [str(item_id) for item_id in {depot.pick_item(rng) for _ in range(rng.randrange(1, 6))}],
+        },
+        headers=auth_headers(f'user{rng.randrange(depot.spec.users)}'),
+    )
+
+
+scenarios = [
+    Scenario('get_items', 1, _get_items),
+    Scenario('get_items_available', 1, _get_items_available),
+    Scenario('get_item_history', 10, _get_item_history),
+    Scenario('get_reservations_items', 5, _get_reservations_items),
+    Scenario('get_reservations_window', 10, _get_reservations_window),
+    Scenario('create_reservation', 3, _create_reservation),
+]
+
+
+async def _run_load(
+        client: httpx.AsyncClient, rng: random.Random, depot: Depot, selected: List[Scenario], requests: int,
+        concurrency: int,
+) -> Dict[str, dict]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    remaining = [requests]
+    weights = [scenario.weight for scenario in selected]
+
+    async def worker(worker_rng: random.Random):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            scenario = worker_rng.choices(selected, weights)[0]
+            start = perf_counter()
+            resp = await scenario.request(client, worker_rng, depot)
+            latencies[scenario.name].append(perf_counter() - start)
+            statuses[scenario.name][resp.status_code] += 1
+
+    start = perf_counter()
+    await asyncio.gather(*[worker(random.Random(rng.random())) for _ in range(concurrency)])
+    duration = perf_counter() - start
+    return {
+        name: {**summarize(samples, duration), 'status': dict(statuses[name])}
+        for name, samples in latencies.items()
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from depot_server.api import app
+    from depot_server.helper.auth import Authentication
+    from tests.mock_auth import MockAuthentication
+
+    spec = DepotSpec(skew=args.skew).scaled(args.scale)
+    # mongomock is not thread safe, but the stand-in runs its commands in executor threads
+    concurrency = 1 if args.mock else args.concurrency
+    selected = [scenario for scenario in scenarios if args.scenarios is None or scenario.name in args.scenarios]
+    rng = random.Random(args.seed)
+    mp = MonkeyPatch()
+    mp.setattr(Authentication, '__call__', MockAuthentication.__call__)
+    try:
+        async with database(args.mock):
+            generate_start = perf_counter()
+            depot = await (load(spec) if args.skip_generate else generate(rng, spec))
+            generate_duration = perf_counter() - generate_start
+            async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+                await _run_load(client, rng, depot, selected, args.warmup, concurrency)
+                results = await _run_load(client, rng, depot, selected, args.requests, concurrency)
+    finally:
+        mp.undo()
+    return {
+        'benchmark': 'load',
+        'mock': args.mock,
+        'revision': _git_revision(),
+        'parameters': {
+            'spec': spec.__dict__, 'requests': args.requests, 'concurrency': concurrency,
+            'warmup': args.warmup, 'generated': not args.skip_generate,
+        },
+        'generate_duration_s': generate_duration,
+        'endpoints': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_common_arguments(parser)
+    parser.add_argument(
+        '--scale', type=float, default=1.0,
+        help="Scales the depot (1.0 = 100k items, 1M history entries, 200k reservations)",
+    )
+    parser.add_argument('--skew', type=float, default=2.0, help="Item popularity skew, 1 = uniform")
+    parser.add_argument('--skip-generate', action='store_true', help="Reuse the depot of a previous run")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument(
+        '--concurrency', type=int, default=16,
+        help="Number of concurrent clients, always 1 with --mock (mongomock is not thread safe)",
+    )
+    parser.add_argument(
+        '--scenarios', type=lambda value: value.split(','), default=None,
+        help=f"Comma separated subset of: {', '.join(scenario.name for scenario in scenarios)}",
+    )
+    args = parser.parse_args()
+    write_report(asyncio.get_event_loop().run_until_complete(run(args)), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Microbenchmarks of the document model layer (`depot_server.db.model.base`), which runs for every document read or
+written.
+
+For every `Db*` model and a small (required fields only), typical and worst case payload, this measures:
+
+* `document`: `BaseDocument.document()` (model -> mongo document)
+* `safe_document`: `_safe_document` of the model dict alone
+* `validate_document`: `BaseDocument.validate_document` (mongo document -> model)
+* `validate_raw`: `_validate_document` alone
+* `validate_override`: `BaseDocument.validate_override` from a model instance with an overridden field
+
+and reports the time per document (median of the repeats) and the memory allocated per document (peak traced by
+`tracemalloc` while converting one document).
+
+    python -m benchmarks.model_layer
+    python -m benchmarks.model_layer --models DbItem,DbReservation --repeat 7 --output model_layer.json
+"""
+import argparse
+import statistics
+import tracemalloc
+from datetime import date, datetime, timedelta
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Tuple
+from uuid import uuid4
+
+import pytz
+
+from benchmarks.common import write_report
+
+_cases = ('small', 'typical', 'worst')
+
+
+def _payloads() -> Dict[str, Dict[str, Any]]:
+    """Returns the model instances by model name and case."""
+    from depot_server.db import DbBay, DbItem, DbItemState, DbReservation, DbReportElement, DbReportProfile, \
+        DbMailOutbox, DbScheduledJob, DbItemUtilization, DbItemStateChanges, DbStrChange, DbIdChange, DbDateChange, \
+        DbTagsChange, DbTotalReportStateChange, DbItemConditionChange, DbItemReport
+    from depot_server.model import ItemCondition, TotalReportState, ReportState, ReservationType, MailOutboxState
+
+    now = datetime(2021, 6, 1, 12, 0, tzinfo=pytz.UTC)
+    today = date(2021, 6, 1)
+    long_text = "Lorem ipsum dolor sit amet. " * 40
+
+    def full_changes() -> DbItemStateChanges:
+        return DbItemStateChanges(
+            external_id=DbStrChange(previous='item_1', next='item_2'),
+            name=DbStrChange(previous="Item 1", next="Item 2"),
+            description=DbStrChange(previous=long_text, next=long_text + "!"),
+            report_profile_id=DbIdChange(previous=uuid4(), next=uuid4()),
+            total_report_state=DbTotalReportStateChange(previous=TotalReportState.Fit, next=TotalReportState.Unfit),
+            condition=DbItemConditionChange(previous=ItemCondition.Good, next=ItemCondition.Bad),
+            condition_comment=DbStrChange(previous="Fine", next="Broken"),
+            purchase_date=DbDateChange(previous=today, next=today - timedelta(days=1)),
+            last_service=DbDateChange(previous=today, next=today + timedelta(days=1)),
+            picture_id=DbIdChange(previous=uuid4(), next=uuid4()),
+            group_id=DbStrChange(previous='group_1', next='group_2'),
+            tags=DbTagsChange(
+                previous=[f'tag_{idx}' for idx in range(200)], next=[f'tag_{idx}' for idx in range(1, 201)]
+            ),
+            bay_id=DbIdChange(previous=uuid4(), next=uuid4()),
+            change_comment=DbStrChange(previous="Before", next="After"),
+        )
+
+    def item(case: str) -> DbItem:
+        if case == 'small':
+            return DbItem(id=uuid4(), name="Item")
+        return DbItem(
+            id=uuid4(),
+            external_id='item_1',
+            manufacturer="Manufacturer",
+            model="Model",
+            serial_number="SN-1234",
+            manufacture_date=today,
+            purchase_date=today,
+            first_use_date=today,
+            name="Item 1",
+            description=long_text if case == 'worst' else "A typical item",
+            report_profile_id=uuid4(),
+            total_report_state=TotalReportState.Fit,
+            condition=ItemCondition.Good,
+            condition_comment="Good",
+            last_service=today,
+            picture_id='picture',
+            group_id='group_1',
+            tags=[f'tag_{idx}' for idx in range(200 if case == 'worst' else 3)],
+            bay_id=uuid4(),
+            current_reservation_id=uuid4(),
+            next_reservation_start=today,
+        )
+
+    def item_state(case: str) -> DbItemState:
+        if case == 'small':
+            changes = DbItemStateChanges()
+        elif case == 'typical':
+            changes = DbItemStateChanges(
+                condition=DbItemConditionChange(previous=ItemCondition.Good, next=ItemCondition.Ok),
+                condition_comment=DbStrChange(previous=None, next="Scratched"),
+            )
+        else:
+            changes = full_changes()
+        return DbItemState(
+            id=uuid4(),
+            item_id=uuid4(),
+            timestamp=now,
+            changes=changes,
+            report=None if case == 'small' else [
+                DbItemReport(report_element_id=uuid4(), state=ReportState.Good, comment="Checked")
+                for _ in range(50 if case == 'worst' else 5)
+            ],
+            user_id='user1',
+            comment="Change",
+        )
+
+    def reservation(case: str) -> DbReservation:
+        return DbReservation(
+            id=uuid4(),
+            type=ReservationType.PRIVATE,
+            name="Reservation",
+            start=today,
+            end=today + timedelta(days=3),
+            user_id='user1',
+            team_id=None if case == 'small' else 'team1',
+            contact="12345",
+            items=[uuid4() for _ in range({'small': 1, 'typical': 5, 'worst': 500}[case])],
+        )
+
+    def report_profile(case: str) -> DbReportProfile:
+        return DbReportProfile(
+            id=uuid4(), name="Profile", description=long_text if case == 'worst' else "Profile",
+            elements=[uuid4() for _ in range({'small': 0, 'typical': 8, 'worst': 200}[case])],
+        )
+
+    def mail_outbox(case: str) -> DbMailOutbox:
+        params = {
+            'small': {'reservation_id': uuid4()},
+            'typical': {'sender': {'sub': 'user1', 'name': "User 1"}, 'item_id': uuid4(), 'reservation_id': uuid4()},
+            'worst': {
+                'sender': {'sub': 'user1', 'name': "User 1"},
+                'items': [{'item_id': uuid4(), 'problem': True, 'comment': long_text} for _ in range(50)],
+                'reservation_id': uuid4(),
+            },
+        }[case]
+        mail = DbMailOutbox(id=uuid4(), name='manager_item_problem', params=params, created=now, next_attempt=now)
+        if case != 'small':
+            mail.state = MailOutboxState.Sending
+            mail.attempts = 2
+            mail.lease_owner = 'host:1:0'
+            mail.lease_until = now
+            mail.last_error = "SMTPServerDisconnected('Connection lost')"
+            mail.sent_to = [f'manager{idx}@localhost' for idx in range(20 if case == 'worst' else 1)]
+        return mail
+
+    def scheduled_job(case: str) -> DbScheduledJob:
+        if case == 'small':
+            return DbScheduledJob(id='job', completed_slot=now)
+        return DbScheduledJob(
+            id='job', completed_slot=now, last_run_start=now, last_run_duration=1.5, last_run_error=None,
+            last_run_result={f'stat_{idx}': idx for idx in range(100 if case == 'worst' else 6)},
+        )
+
+    def item_utilization(case: str) -> DbItemUtilization:
+        return DbItemUtilization(
+            id='item/2021-06-01', item_id=uuid4(), month=today.replace(day=1),
+            days=[today.toordinal() + idx for idx in range({'small': 0, 'typical': 7, 'worst': 30}[case])],
+        )
+
+    factories: Dict[str, Callable[[str], Any]] = {
+        'DbBay': lambda case: DbBay(
+            id=uuid4(), name="Bay", **({} if case == 'small' else {
+                'external_id': 'bay_1', 'description': long_text if case == 'worst' else "Top left",
+            })
+        ),
+        'DbItem': item,
+        'DbItemState': item_state,
+        'DbReservation': reservation,
+        'DbReportElement': lambda case: DbReportElement(
+            id=uuid4(), title="Element", description=long_text if case == 'worst' else "Check it",
+        ),
+        'DbReportProfile': report_profile,
+        'DbMailOutbox': mail_outbox,
+        'DbScheduledJob': scheduled_job,
+        'DbItemUtilization': item_utilization,
+    }
+    return {name: {case: factory(case) for case in _cases} for name, factory in factories.items()}
+
+
+def _operations(model: Any) -> Dict[str, Callable[[], Any]]:
+    from depot_server.db.model.base import _safe_document, _validate_document
+
+    model_type = type(model)
+    document = model.document()
+    model_dict = model.dict(exclude_none=True, by_alias=True)
+    # Some field to override, as the API does for the id
+    override_key = next(iter(model_type.__fields__))
+    override_value = getattr(model, override_key)
+    return {
+        'document': model.document,
+        'safe_document': lambda: _safe_document(model_dict),
+        'validate_document': lambda: model_type.validate_document(dict(document)),
+        'validate_raw': lambda: _validate_document(document, model_type),
+        'validate_override': lambda: model_type.validate_override(model, **{override_key: override_value}),
+    }
+
+
+def _time_ns(operation: Callable[[], Any], number: int, repeat: int) -> Tuple[float, float]:
+    """Returns the median and minimum ns per call over `repeat` runs of `number` calls."""
+    per_call = []
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        for _ in range(number):
+            operation()
+        per_call.append((perf_counter_ns() - start) / number)
+    return statistics.median(per_call), min(per_call)
+
+
+def _allocated_bytes(operation: Callable[[], Any], samples: int = 5) -> int:
+    """Returns the peak memory traced while running the operation once (minimum of `samples` runs)."""
+    peaks = []
+    for _ in range(samples):
+        tracemalloc.start()
+        operation()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return min(peaks)
+
+
+def _calibrate(operation: Callable[[], Any], target_ns: float = 50_000_000) -> int:
+    """Number of calls for one repeat to take about `target_ns`."""
+    start = perf_counter_ns()
+    operation()
+    elapsed = max(perf_counter_ns() - start, 1)
+    return max(10, min(100_000, int(target_ns / elapsed)))
+
+
+def run(args) -> dict:
+    payloads = _payloads()
+    results: Dict[str, Dict[str, Dict[str, Dict[str, float]]]] = {}
+    for model_name, cases in payloads.items():
+        if args.models is not None and model_name not in args.models:
+            continue
+        results[model_name] = {}
+        for case, model in cases.items():
+            results[model_name][case] = {}
+            for operation_name, operation in _operations(model).items():
+                if args.operations is not None and operation_name not in args.operations:
+                    continue
+                # Warm up caches of pydantic and typing
+                operation()
+                number = args.number or _calibrate(operation)
+                median_ns, min_ns = _time_ns(operation, number, args.repeat)
+                results[model_name][case][operation_name] = {
+                    'ns_per_doc': median_ns,
+                    'min_ns_per_doc': min_ns,
+                    'docs_per_s': 1e9 / median_ns,
+                    'peak_alloc_bytes': _allocated_bytes(operation),
+                }
+    return {
+        'benchmark': 'model_layer',
+        'parameters': {'repeat': args.repeat, 'number': args.number},
+        'models': results,
+    }
+
+
+def _split(value: str) -> List[str]:
+    return value.split(',')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=None, help="Write the JSON report to this file instead of stdout")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=None, help="Calls per repeat (default: calibrated to ~50ms)")
+    parser.add_argument('--models', type=_split, default=None, help="Comma separated model names")
+    parser.add_argument('--operations', type=_split, default=None, help="Comma separated operation names")
+    args = parser.parse_args()
+    write_report(run(args), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Latency of the calendar view query `GET /reservations` with `limit_before_start` and `limit_after_end`.
+
+Compares the concurrent window query against running the before, mid and after queries one after another (as it was
+done before).
+
+    python -m benchmarks.reservation_window --mock
+    API_CONFIG_MONGO_URI=mongodb://127.0.0.1:27017/depot_bench python -m benchmarks.reservation_window
+"""
+import argparse
+import asyncio
+import random
+from datetime import date, timedelta
+from typing import List
+from uuid import uuid4
+
+from pymongo import DESCENDING, ASCENDING
+
+from benchmarks.common import add_common_arguments, database, measure, summarize, write_report
+
+
+async def _generate(rng: random.Random, item_count: int, reservation_count: int, days: int):
+    from depot_server.db import collections, DbReservation
+    from depot_server.model import ReservationType
+
+    await collections.reservation_collection.delete_many({})
+    item_ids = [uuid4() for _ in range(item_count)]
+    today = date.today()
+    reservations = []
+    for idx in range(reservation_count):
+        start = today + timedelta(days=rng.randrange(-days // 2, days // 2))
+        reservations.append(DbReservation(
+            id=uuid4(),
+            type=ReservationType.PRIVATE,
+            name=f"Reservation {idx}",
+            start=start,
+            end=start + timedelta(days=rng.randrange(0, 5)),
+            user_id=f'user{rng.randrange(100)}',
+            contact="12345",
+            items=rng.sample(item_ids, rng.randrange(1, 6)),
+            returned=start < today and rng.random() < 0.9,
+        ))
+    for offset in range(0, len(reservations), 1000):
+        await collections.reservation_collection.insert_many(reservations[offset:offset + 1000])
+
+
+async def _sequential_window(start: date, end: date, limit_before_start: int, limit_after_end: int) -> List:
+    from depot_server.db import collections
+    from depot_server.model import Reservation
+
+    query: dict = {'returned': False}
+    before_start = [
+        Reservation.validate(reservation)
+        async for reservation in collections.reservation_collection.find(
+            {**query, 'end': {'$lt': start.toordinal()}}, limit=limit_before_start, sort=[('start', DESCENDING)]
+        )
+    ]
+    after_end = [
+        Reservation.validate(reservation)
+        async for reservation in collections.reservation_collection.find(
+            {**query, 'start': {'$gt': end.toordinal()}}, limit=limit_after_end, sort=[('start', ASCENDING)]
+        )
+    ]
+    after_end.reverse()
+    query['end'] = {'$gte': start.toordinal()}
+    query['start'] = {'$lte': end.toordinal()}
+    mid = [
+        Reservation.validate(reservation)
+        async for reservation in collections.reservation_collection.find(query, sort=[('start', DESCENDING)])
+    ]
+    return before_start + mid + after_end
+
+
+async def run(args) -> dict:
+    from depot_server.api.reservations import get_reservations
+
+    rng = random.Random(args.seed)
+    async with database(args.mock):
+        await _generate(rng, args.items, args.reservations, args.days)
+        windows = [
+            date.today() + timedelta(days=rng.randrange(-args.days // 2, args.days // 2))
+            for _ in range(args.iterations)
+        ]
+
+        def windows_iter():
+            while True:
+                yield from windows
+
+        sequential_windows = windows_iter()
+        concurrent_windows = windows_iter()
+
+        async def sequential():
+            start = next(sequential_windows)
+            await _sequential_window(start, start + timedelta(days=args.window), args.limit, args.limit)
+
+        async def concurrent():
+            start = next(concurrent_windows)
+            await get_reservations(
+                for_user=None,
+                all_users=True,
+                start=start,
+                end=start + timedelta(days=args.window),
+                item_id=None,
+                include_returned=False,
+                offset=None,
+                limit=None,
+                limit_before_start=args.limit,
+                limit_after_end=args.limit,
+                fields=None,
+                _user={'sub': 'user1', 'roles': []},
+            )
+
+        # Warm up
+        await measure(sequential, min(10, args.iterations))
+        await measure(concurrent, min(10, args.iterations))
+        sequential_stats = summarize(await measure(sequential, args.iterations))
+        concurrent_stats = summarize(await measure(concurrent, args.iterations))
+    return {
+        'benchmark': 'reservation_window',
+        'mock': args.mock,
+        'parameters': {
+            'items': args.items, 'reservations': args.reservations, 'days': args.days, 'window': args.window,
+            'limit': args.limit, 'iterations': args.iterations,
+        },
+        'sequential': sequential_stats,
+        'concurrent': concurrent_stats,
+        'p50_speedup': sequential_stats['p50_ms'] / concurrent_stats['p50_ms'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_common_arguments(parser)
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--reservations', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=730, help="Reservations are spread over this many days")
+    parser.add_argument('--window', type=int, default=42, help="Days shown in the calendar view")
+    parser.add_argument('--limit', type=int, default=5, help="limit_before_start and limit_after_end")
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+    write_report(asyncio.get_event_loop().run_until_complete(run(args)), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Response serialization and compression benchmark.
+
+* `serialize`: Serializing a list of `Item` models through FastAPI's default path (validation against the
+  `response_model`, `jsonable_encoder`, stdlib `json`) vs. `models_response` (orjson if installed).
+* `wire`: Bytes on the wire and CPU time per request of the large list endpoints on a generated depot (see
+  `benchmarks.generator`), for every content encoding (identity, gzip and br if the brotli package is installed).
+
+    python -m benchmarks.responses --mock
+    python -m benchmarks.responses --mock --items 5000 --requests 50 --output responses.json
+"""
+import argparse
+import asyncio
+import random
+from time import perf_counter, process_time
+from typing import Dict, List, Any
+
+import httpx
+
+from benchmarks.common import add_common_arguments, api_prefix, auth_headers, database, write_report
+from benchmarks.generator import DepotSpec, generate
+
+
+async def _serialize(items: List, iterations: int) -> Dict[str, dict]:
+    from fastapi.routing import APIRoute, serialize_response
+    from starlette.responses import JSONResponse
+
+    from depot_server.api import app
+    from depot_server.helper.response import models_response, orjson
+
+    route = next(
+        route for route in app.routes
+        if isinstance(route, APIRoute) and route.path == f'{api_prefix}/items' and 'GET' in route.methods
+    )
+
+    async def default_path() -> bytes:
+        content = await serialize_response(field=route.response_field, response_content=items)
+        return JSONResponse(content).body
+
+    async def fast_path() -> bytes:
+        return models_response(items).body
+
+    results: Dict[str, Any] = {}
+    for name, path in (('default', default_path), ('fast', fast_path)):
+        body = await path()
+        start = process_time()
+        for _ in range(iterations):
+            await path()
+        results[name] = {
+            'cpu_ms_per_request': (process_time() - start) / iterations * 1000,
+            'bytes': len(body),
+        }
+    results['fast']['orjson'] = orjson is not None
+    results['speedup'] = results['default']['cpu_ms_per_request'] / results['fast']['cpu_ms_per_request']
+    return results
+
+
+async def _wire(client: httpx.AsyncClient, paths: Dict[str, str], encodings: List[str], requests: int) -> dict:
+    results: Dict[str, Dict[str, dict]] = {}
+    for name, path in paths.items():
+        results[name] = {}
+        for encoding in encodings:
+            headers = {**auth_headers('user1'), 'accept-encoding': encoding}
+            wire_bytes = 0
+            start_cpu = process_time()
+            start = perf_counter()
+            for _ in range(requests):
+                async with client.stream('GET', path, headers=headers) as resp:
+                    async for chunk in resp.aiter_raw():
+                        wire_bytes += len(chunk)
+            results[name][encoding] = {
+                'bytes_per_request': wire_bytes / requests,
+                'cpu_ms_per_request': (process_time() - start_cpu) / requests * 1000,
+                'wall_ms_per_request': (perf_counter() - start) / requests * 1000,
+            }
+        identity = results[name]['identity']['bytes_per_request']
+        for encoding in encodings:
+            results[name][encoding]['ratio'] = identity / max(results[name][encoding]['bytes_per_request'], 1)
+    return results
+
+
+async def run(args) -> dict:
+    from _pytest.monkeypatch import MonkeyPatch
+
+    from depot_server.api import app
+    from depot_server.api.compression import brotli
+    from depot_server.db import collections
+    from depot_server.helper.auth import Authentication
+    from depot_server.model import Item
+    from tests.mock_auth import MockAuthentication
+
+    spec = DepotSpec(
+        bays=max(1, args.items // 500), items=args.items, history=args.items * 10, reservations=args.items * 2,
+        users=100, skew=2.0,
+    )
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    rng = random.Random(args.seed)
+    mp = MonkeyPatch()
+    mp.setattr(Authentication, '__call__', MockAuthentication.__call__)
+    try:
+        async with database(args.mock):
+            depot = await generate(rng, spec)
+            items = [Item.validate(item) async for item in collections.item_collection.find({})]
+            serialize = await _serialize(items, args.requests)
+            paths = {
+                'get_items': f'{api_prefix}/items',
+                'get_item_history': f'{api_prefix}/items/{depot.item_ids[0]}/history',
+                'get_reservations': f'{api_prefix}/reservations?all_users=true',
+            }
+            async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+                await _wire(client, paths, encodings, 1)
+                wire = await _wire(client, paths, encodings, args.requests)
+    finally:
+        mp.undo()
+    return {
+        'benchmark': 'responses',
+        'mock': args.mock,
+        'parameters': {'items': args.items, 'requests': args.requests},
+        'serialize': serialize,
+        'wire': wire,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_common_arguments(parser)
+    parser.add_argument('--items', type=int, default=2000, help="Number of generated items")
+    parser.add_argument('--requests', type=int, default=20, help="Requests per endpoint and encoding")
+    args = parser.parse_args()
+    write_report(asyncio.get_event_loop().run_until_complete(run(args)), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,34 @@
 from fastapi import FastAPI, APIRouter
 from starlette.middleware.cors import CORSMiddleware
 
+from .analytics import router as analytics_router
 from .bays import router as bays_router
+from .cascade_jobs import router as cascade_jobs_router
+from .compression import CompressionMiddleware
+from .events import router as events_router
+from .health import router as health_router
 from .items import router as items_router
+from .mail_outbox import router as mail_outbox_router
+from .metrics import router as metrics_router, MetricsMiddleware
 from .report_elements import router as report_elements_router
 from .report_profiles import router as report_profiles_router
 from .reservations import router as reservations_router
+from .scheduler import router as scheduler_router
 from .pictures import router as pictures_router
 from .users import router as users_router
 from depot_server.config import config
 from depot_server.db import startup as db_startup, shutdown as db_shutdown
 
-from depot_server.mail.return_reservation_mail import startup as mail_cron_startup, shutdown as mail_cron_shutdown
+from depot_server.mail.mailer import startup as mailer_startup, shutdown as mailer_shutdown
+from depot_server.mail.outbox import startup as mail_outbox_startup, shutdown as mail_outbox_shutdown
+from depot_server.helper.response import FastJSONResponse
+from depot_server.helper.change_feed import startup as change_feed_startup, shutdown as change_feed_shutdown
+from depot_server.helper.cascade_jobs import startup as cascade_jobs_startup, shutdown as cascade_jobs_shutdown
+from depot_server.helper.manager_roster import startup as manager_roster_startup, \
+    shutdown as manager_roster_shutdown
+from depot_server.helper.scheduler import startup as scheduler_startup, shutdown as scheduler_shutdown
+# Registers the reminder job
+import depot_server.mail.return_reservation_mail  # noqa: F401
 
 router = APIRouter()
 router.include_router(bays_router, prefix='/api/v1/depot')
@@ -21,21 +38,38 @@ router.include_router(report_profiles_router, prefix='/api/v1/depot')
 router.include_router(reservations_router, prefix='/api/v1/depot')
 router.include_router(pictures_router, prefix='/api/v1/depot')
 router.include_router(users_router, prefix='/api/v1/depot')
+router.include_router(mail_outbox_router, prefix='/api/v1/depot')
+router.include_router(scheduler_router, prefix='/api/v1/depot')
+router.include_router(analytics_router, prefix='/api/v1/depot')
+router.include_router(cascade_jobs_router, prefix='/api/v1/depot')
+router.include_router(events_router, prefix='/api/v1/depot')
+router.include_router(metrics_router)
+router.include_router(health_router)
 
 
 @router.on_event('startup')
 async def startup():
     await db_startup()
-    await mail_cron_startup()
+    await mailer_startup()
+    await mail_outbox_startup()
+    await cascade_jobs_startup()
+    await change_feed_startup()
+    await manager_roster_startup()
+    await scheduler_startup()
 
 
 @router.on_event('shutdown')
 async def shutdown():
-    await mail_cron_shutdown()
+    await scheduler_shutdown()
+    await manager_roster_shutdown()
+    await change_feed_shutdown()
+    await cascade_jobs_shutdown()
+    await mail_outbox_shutdown()
+    await mailer_shutdown()
     await db_shutdown()
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=config.allow_origins,
@@ -43,5 +77,12 @@ app.add_middleware(
     allow_methods=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'],
     allow_headers=['*'],
 )
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=config.compression.minimum_size,
+    gzip_level=config.compression.gzip_level,
+    brotli_quality=config.compression.brotli_quality,
+)
+app.add_middleware(MetricsMiddleware, routes=app.routes)
 
 app.include_router(router)
@@ -0,0 +1,77 @@
+from authlib.oidc.core import UserInfo
+from collections import defaultdict
+from datetime import date
+from fastapi import APIRouter, Depends, Query, HTTPException
+from typing import List, Dict, Optional
+
+from depot_server.db import collections
+from depot_server.helper.auth import Authentication
+from depot_server.helper.scheduler import scheduler
+from depot_server.helper.utilization import get_reserved_days, utilization_rebuild_job
+from depot_server.model import Utilization, UtilizationGroupBy, ItemCondition, ScheduledJob
+
+router = APIRouter()
+
+
+@router.get(
+    '/analytics/utilization',
+    tags=['Analytics'],
+    response_model=List[Utilization],
+)
+async def get_utilization(
+        start: date = Query(...),
+        end: date = Query(...),
+        group_by: UtilizationGroupBy = Query(UtilizationGroupBy.Item),
+        _user: UserInfo = Depends(Authentication(require_manager=True)),
+) -> List[Utilization]:
+    if end < start:
+        raise HTTPException(400, "end must not be before start")
+    period_days = end.toordinal() - start.toordinal() + 1
+    reserved_days = await get_reserved_days(start, end)
+
+    item_counts: Dict[Optional[str], int] = defaultdict(int)
+    reserved_days_by_key: Dict[Optional[str], int] = defaultdict(int)
+    async for item in collections.item_collection.read_only.collection.find(
+            {'condition': {'$ne': ItemCondition.Gone.value}}, projection={'_id': 1, 'group_id': 1, 'bay_id': 1}
+    ):
+        if group_by == UtilizationGroupBy.Item:
+            key = item['_id']
+        elif group_by == UtilizationGroupBy.Group:
+            key = item.get('group_id')
+        else:
+            key = item.get('bay_id')
+        if key is not None:
+            key = str(key)
+        item_counts[key] += 1
+        reserved_days_by_key[key] += reserved_days.get(item['_id'], 0)
+
+    return [
+        Utilization(
+            key=key,
+            item_count=item_count,
+            reserved_days=reserved_days_by_key[key],
+            available_days=item_count * period_days,
+            utilization=reserved_days_by_key[key] / (item_count * period_days),
+        )
+        for key, item_count in item_counts.items()
+    ]
+
+
+@router.post(
+    '/analytics/utilization/rebuild',
+    tags=['Analytics'],
+    status_code=202,
+    response_model=ScheduledJob,
+)
+async def rebuild_utilization(
+        _user: UserInfo = Depends(Authentication(require_admin=True)),
+) -> ScheduledJob:
+    """
+    Starts a rebuild of the utilization rollups in the background by triggering the scheduled job. Its status can be
+    polled at `GET /scheduler/jobs/utilization_rebuild`: the rebuild finished when `completedSlot` moved forward (the
+    stats are in `lastRunResult`).
+    """
+    job = await scheduler.trigger(utilization_rebuild_job)
+    if job is None:
+        raise HTTPException(404, f"No scheduled job {utilization_rebuild_job}")
+    return ScheduledJob.validate(job)
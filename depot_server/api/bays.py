@@ -1,12 +1,17 @@
-from typing import List
+from typing import List, Optional
 from uuid import UUID, uuid4
 
 from authlib.oidc.core import UserInfo
-from fastapi import APIRouter, Depends, Body, HTTPException
+from fastapi import APIRouter, Depends, Body, HTTPException, Query
+from starlette.responses import Response
 
 from depot_server.db import DbBay, collections
-from depot_server.model import Bay, BayInWrite
+from depot_server.model import Bay, BayInWrite, CascadeJob, CascadeKind, Batch
 from depot_server.helper.auth import Authentication
+from depot_server.helper.batch import batch_response
+from depot_server.helper.cascade_jobs import cascade_jobs
+from depot_server.helper.fields import parse_fields, partial_response
+from depot_server.helper.response import models_response
 
 router = APIRouter()
 
@@ -17,9 +22,29 @@ router = APIRouter()
     response_model=List[Bay],
 )
 async def get_bays(
+        fields: Optional[str] = Query(None, description="Comma separated fields to return"),
         _user: UserInfo = Depends(Authentication()),
-) -> List[Bay]:
-    return [Bay.validate(bay) async for bay in collections.bay_collection.find({})]
+) -> Response:
+    field_names = parse_fields(fields, Bay)
+    if field_names is not None:
+        return partial_response([
+            bay async for bay in collections.bay_collection.read_only.find({}, fields=field_names)
+        ])
+    return models_response([Bay.validate(bay) async for bay in collections.bay_collection.read_only.find({})])
+
+
+@router.get(
+    '/bays/batch',
+    tags=['Bay'],
+    response_model=Batch[Bay],
+)
+async def get_bays_batch(
+        ids: List[UUID] = Query(..., description="Ids of the bays, the results keep their order"),
+        fields: Optional[str] = Query(None, description="Comma separated fields to return"),
+        _user: UserInfo = Depends(Authentication()),
+) -> Response:
+    """Returns the bays of `ids` with one query. Ids which do not exist are listed in `missing`."""
+    return await batch_response(collections.bay_collection.read_only, Bay, ids, fields)
 
 
 @router.get(
@@ -77,11 +102,13 @@ async def update_bay(
 @router.delete(
     '/bays/{bay_id}',
     tags=['Bay'],
+    response_model=CascadeJob,
 )
 async def delete_bay(
         bay_id: UUID,
         _user: UserInfo = Depends(Authentication(require_admin=True)),
-) -> None:
+) -> CascadeJob:
+    """Deletes the bay. The items are removed from the bay by the returned background job."""
     if not await collections.bay_collection.delete_one({'_id': bay_id}):
         raise HTTPException(404, f"No bay for id {bay_id}")
-    await collections.item_collection.update_many({'bay_id': bay_id}, {'$unset': {'bay_id': 1}})
+    return CascadeJob.validate(await cascade_jobs.enqueue(CascadeKind.Bay, bay_id))
@@ -0,0 +1,24 @@
+from authlib.oidc.core import UserInfo
+from fastapi import APIRouter, Depends, HTTPException
+from uuid import UUID
+
+from depot_server.db import collections
+from depot_server.helper.auth import Authentication
+from depot_server.model import CascadeJob
+
+router = APIRouter()
+
+
+@router.get(
+    '/cascade-jobs/{job_id}',
+    tags=['Cascade Job'],
+    response_model=CascadeJob,
+)
+async def get_cascade_job(
+        job_id: UUID,
+        _user: UserInfo = Depends(Authentication(require_admin=True)),
+) -> CascadeJob:
+    job = await collections.cascade_job_collection.find_one({'_id': job_id})
+    if job is None:
+        raise HTTPException(404, f"No cascade job for id {job_id}")
+    return CascadeJob.validate(job)
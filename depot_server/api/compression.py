@@ -0,0 +1,158 @@
+import zlib
+from typing import Callable, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+_Compressor = Tuple[Callable[[bytes], bytes], Callable[[], bytes], Callable[[], bytes]]
+
+# Streamed for live updates, or already compressed (pictures)
+_skipped_content_types = (
+    'text/event-stream', 'image/', 'video/', 'audio/', 'application/zip', 'application/gzip',
+)
+_compressed_content_types = ('image/svg+xml',)
+
+
+def _is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    return content_type.startswith(_compressed_content_types) or not content_type.startswith(_skipped_content_types)
+
+
+def _accepted_encodings(accept_encoding: str) -> List[str]:
+    """Returns the encodings of an Accept-Encoding header which are not disabled by `q=0`."""
+    encodings = []
+    for part in accept_encoding.split(','):
+        encoding, *params = (value.strip() for value in part.split(';'))
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    pass
+        if encoding and quality > 0:
+            encodings.append(encoding.lower())
+    return encodings
+
+
+def _gzip_compressor(level: int) -> _Compressor:
+    # wbits 16 + 15 writes the gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def _brotli_compressor(quality: int) -> _Compressor:
+    compressor = brotli.Compressor(quality=quality)
+    return compressor.process, compressor.flush, compressor.finish
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of at least `minimum_size` bytes with brotli (if the `brotli` package is installed) or gzip,
+    depending on the Accept-Encoding of the request.
+
+    Streamed responses are compressed chunk by chunk, every chunk is flushed so clients receive it right away. Responses
+    which already have a Content-Encoding, are event streams or have an already compressed content type (e.g. images)
+    are passed through.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _select_encoding(self, scope: Scope) -> Optional[str]:
+        encodings = _accepted_encodings(Headers(scope=scope).get('accept-encoding', ''))
+        if brotli is not None and 'br' in encodings:
+            return 'br'
+        if 'gzip' in encodings:
+            return 'gzip'
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = self._select_encoding(scope)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressionResponder(self, encoding, send)(scope, receive)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.app = middleware.app
+        self.encoding = encoding
+        self.send = send
+        self.start_message: Optional[Message] = None
+        # None: not decided yet, False: pass through, True: compressing
+        self.compressing: Optional[bool] = None
+        self.compress: Optional[Callable[[bytes], bytes]] = None
+        self.flush: Optional[Callable[[], bytes]] = None
+        self.finish: Optional[Callable[[], bytes]] = None
+
+    async def __call__(self, scope: Scope, receive: Receive):
+        await self.app(scope, receive, self.send_compressed)
+
+    def _start_compression(self, headers: MutableHeaders) -> _Compressor:
+        if self.encoding == 'br':
+            compressor = _brotli_compressor(self.middleware.brotli_quality)
+        else:
+            compressor = _gzip_compressor(self.middleware.gzip_level)
+        self.compress, self.flush, self.finish = compressor
+        headers['Content-Encoding'] = self.encoding
+        headers.add_vary_header('Accept-Encoding')
+        self.compressing = True
+        return compressor
+
+    async def send_compressed(self, message: Message):
+        if message['type'] == 'http.response.start':
+            # Decided with the first body message
+            self.start_message = message
+            return
+        if message['type'] != 'http.response.body':
+            await self.send(message)
+            return
+
+        assert self.start_message is not None
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self.compressing is None:
+            headers = MutableHeaders(raw=self.start_message['headers'])
+            if (
+                    'content-encoding' in headers
+                    or not _is_compressible(headers.get('content-type', ''))
+                    or (not more_body and len(body) < self.middleware.minimum_size)
+            ):
+                self.compressing = False
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+            compress, _, finish = self._start_compression(headers)
+            if more_body:
+                del headers['Content-Length']
+                await self.send(self.start_message)
+            else:
+                body = compress(body) + finish()
+                headers['Content-Length'] = str(len(body))
+                await self.send(self.start_message)
+                await self.send({'type': 'http.response.body', 'body': body})
+                return
+        elif not self.compressing:
+            await self.send(message)
+            return
+
+        assert self.compress is not None and self.flush is not None and self.finish is not None
+        if more_body:
+            body = self.compress(body) + self.flush()
+        else:
+            body = self.compress(body) + self.finish()
+        await self.send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
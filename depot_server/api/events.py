@@ -0,0 +1,62 @@
+import asyncio
+from typing import Optional, AsyncIterator
+from uuid import UUID
+
+from authlib.oidc.core import UserInfo
+from fastapi import APIRouter, Depends, Query
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from depot_server.config import config
+from depot_server.helper.auth import Authentication
+from depot_server.helper.change_feed import change_feed, Subscription
+from depot_server.helper.response import dumps
+from depot_server.model import ChangeEvent, ChangeEventType
+
+router = APIRouter()
+
+
+def format_event(event: ChangeEvent) -> bytes:
+    return b'event: ' + event.type.value.encode() + b'\ndata: ' + dumps(
+        event.dict(by_alias=True, exclude_none=True)
+    ) + b'\n\n'
+
+
+async def _stream(request: Request, subscription: Subscription) -> AsyncIterator[bytes]:
+    try:
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), config.events.keepalive_interval)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing the connection
+                yield b': keepalive\n\n'
+                continue
+            yield format_event(event)
+            if event.type == ChangeEventType.Overflow:
+                break
+    finally:
+        change_feed.unsubscribe(subscription)
+
+
+@router.get(
+    '/events',
+    tags=['Events'],
+    response_class=StreamingResponse,
+)
+async def get_events(
+        request: Request,
+        item_id: Optional[UUID] = Query(None),
+        bay_id: Optional[UUID] = Query(None),
+        user_id: Optional[str] = Query(None),
+        _user: UserInfo = Depends(Authentication()),
+) -> StreamingResponse:
+    """
+    Server-sent events of item and reservation changes, optionally only for an item, bay or user. Each event has the
+    change type as event name and a `ChangeEvent` as data.
+    """
+    subscription = change_feed.subscribe(item_id=item_id, bay_id=bay_id, user_id=user_id)
+    return StreamingResponse(
+        _stream(request, subscription),
+        media_type='text/event-stream',
+        headers={'cache-control': 'no-cache', 'x-accel-buffering': 'no'},
+    )
@@ -0,0 +1,68 @@
+import asyncio
+from typing import Dict
+
+from fastapi import APIRouter
+from starlette.responses import Response
+
+from depot_server.db import collections, connection
+from depot_server.model import IndexBuildState, Readiness
+
+router = APIRouter()
+
+# Seconds to wait for the ping of mongo
+_ping_timeout = 2
+
+
+@router.get('/healthz', include_in_schema=False)
+async def get_healthz() -> dict:
+    """Liveness: the server is running, dependencies are not checked."""
+    return {'status': 'ok'}
+
+
+async def _mongo_ready() -> bool:
+    if connection.async_db is None:
+        return False
+    try:
+        await asyncio.wait_for(connection.async_db.command('ping'), _ping_timeout)
+    except Exception:
+        return False
+    return True
+
+
+async def _index_build_progress() -> Dict[str, str]:
+    """Returns the progress messages of running index builds by collection name."""
+    if connection.async_db is None:
+        return {}
+    try:
+        result = await connection.async_db.client.admin.command(
+            'currentOp', {'command.createIndexes': {'$exists': True}}
+        )
+    except Exception:
+        # Needs privileges which the user may not have, and is not supported by all deployments
+        return {}
+    return {
+        op['ns'].split('.', 1)[1]: op['msg']
+        for op in result.get('inprog', [])
+        if 'msg' in op and '.' in op.get('ns', '')
+    }
+
+
+@router.get('/readyz', include_in_schema=False, response_model=Readiness)
+async def get_readyz(response: Response) -> Readiness:
+    """
+    Readiness: mongo answers and the indexes are reconciled. Failed index builds are reported, but do not make the
+    server unready.
+    """
+    mongo = await _mongo_ready()
+    indexes = [status.copy() for status in collections.index_status.values()]
+    if mongo and any(status.state == IndexBuildState.Building for status in indexes):
+        progress = await _index_build_progress()
+        for status in indexes:
+            if status.state == IndexBuildState.Building:
+                status.progress = progress.get(status.collection)
+    ready = mongo and all(
+        status.state in (IndexBuildState.Ready, IndexBuildState.Failed) for status in indexes
+    )
+    if not ready:
+        response.status_code = 503
+    return Readiness(ready=ready, mongo=mongo, indexes=indexes)
@@ -1,16 +1,24 @@
 from authlib.oidc.core import UserInfo
 from datetime import date
-from fastapi import APIRouter, Depends, Body, Query, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, Body, Query, HTTPException
 from pymongo import DESCENDING
+from starlette.responses import Response
 from typing import List, Optional, Dict
 from uuid import UUID, uuid4
 
 from depot_server.db import collections, DbItem, DbItemState, DbStrChange, \
     DbItemStateChanges, DbItemConditionChange, DbDateChange, DbIdChange, DbTagsChange, DbTotalReportStateChange, \
     DbItemReport
-from depot_server.model import Item, ItemInWrite, ItemState, ReportItemInWrite, ItemCondition
+from depot_server.model import Item, ItemInWrite, ItemState, ReportItemInWrite, ItemCondition, ChangeEventType, \
+    Batch
 from depot_server.helper.auth import Authentication
+from depot_server.helper.batch import batch_response
+from depot_server.helper.change_feed import change_feed, item_event
+from depot_server.helper.fields import parse_fields, partial_response
+from depot_server.helper.item_reservation_status import reservation_status_fields
+from depot_server.helper.response import models_response
 from depot_server.helper.util import utc_now
+from ..db.cache import report_profile_cache, report_element_cache
 from ..db.model import DbReportElement
 from ..mail.reservation_item_removed import send_reservation_item_removed
 from ..model.item_state import ItemReport
@@ -18,6 +26,26 @@ from ..model.item_state import ItemReport
 router = APIRouter()
 
 
+async def _write_item(db_item: DbItem) -> bool:
+    """
+    Writes the item without its reservation status, so a reservation changed while the request ran is not overwritten
+    with the status read at its start.
+    """
+    doc = db_item.document()
+    del doc['_id']
+    for field in reservation_status_fields:
+        doc.pop(field, None)
+    unset = {
+        field.alias: 1
+        for field in DbItem.__fields__.values()
+        if field.alias != '_id' and field.alias not in doc and field.alias not in reservation_status_fields
+    }
+    update = {'$set': doc}
+    if unset:
+        update['$unset'] = unset
+    return await collections.item_collection.update_one({'_id': db_item.id}, update)
+
+
 async def _save_state(
         prev_item: DbItem,
         new_item: DbItem,
@@ -79,12 +107,10 @@ async def _get_report(report_profile_id: Optional[UUID], report: List[ItemReport
         if report:
             raise HTTPException(404, f"Report profile not set, but report is set")
         return None
-    report_profile = await collections.report_profile_collection.find_one(report_profile_id)
+    report_profile = await report_profile_cache.get(report_profile_id)
     if report_profile is None:
         raise HTTPException(404, f"Report profile {report_profile_id} not found")
-    report_elements_by_id: Dict[UUID, DbReportElement] = {
-        el.id: el async for el in collections.report_element_collection.find({'_id': {'$in': report_profile.elements}})
-    }
+    report_elements_by_id: Dict[UUID, DbReportElement] = await report_element_cache.get_many(report_profile.elements)
     if len(report_elements_by_id) != len(report_profile.elements):
         raise ValueError("Internal error: Report elements do not match")
 
@@ -101,12 +127,41 @@ async def _get_report(report_profile_id: Optional[UUID], report: List[ItemReport
 )
 async def get_items(
         all: bool = Query(False),
+        available: Optional[bool] = Query(None),
+        available_until: Optional[date] = Query(None),
+        fields: Optional[str] = Query(None, description="Comma separated fields to return"),
         _user: UserInfo = Depends(Authentication()),
-) -> List[Item]:
-    return [
-        Item.validate(item)
-        async for item in collections.item_collection.find({} if all else {'condition': {'$ne': 'gone'}})
-    ]
+) -> Response:
+    query: dict = {} if all else {'condition': {'$ne': 'gone'}}
+    if available is not None:
+        query['current_reservation_id'] = None if available else {'$ne': None}
+    if available_until is not None:
+        # Available now and not reserved until (including) available_until
+        query['current_reservation_id'] = None
+        query['$or'] = [
+            {'next_reservation_start': None},
+            {'next_reservation_start': {'$gt': available_until.toordinal()}},
+        ]
+    field_names = parse_fields(fields, Item)
+    if field_names is not None:
+        return partial_response([
+            item async for item in collections.item_collection.read_only.find(query, fields=field_names)
+        ])
+    return models_response([Item.validate(item) async for item in collections.item_collection.read_only.find(query)])
+
+
+@router.get(
+    '/items/batch',
+    tags=['Item'],
+    response_model=Batch[Item],
+)
+async def get_items_batch(
+        ids: List[UUID] = Query(..., description="Ids of the items, the results keep their order"),
+        fields: Optional[str] = Query(None, description="Comma separated fields to return"),
+        _user: UserInfo = Depends(Authentication()),
+) -> Response:
+    """Returns the items of `ids` with one query. Ids which do not exist are listed in `missing`."""
+    return await batch_response(collections.item_collection.read_only, Item, ids, fields)
 
 
 @router.get(
@@ -142,6 +197,7 @@ async def create_item(
     report = await _get_report(db_item.report_profile_id, item.report)
     await collections.item_collection.insert_one(db_item)
     await _save_state(DbItem(id=db_item.id, name=""), db_item, report, change_comment, _user['sub'])
+    change_feed.publish(item_event(ChangeEventType.ItemCreated, db_item))
     return Item.validate(db_item)
 
 
@@ -152,7 +208,6 @@ async def create_item(
 )
 async def update_item(
         item_id: UUID,
-        background_tasks: BackgroundTasks,
         item: ItemInWrite = Body(...),
         _user: UserInfo = Depends(Authentication(require_manager=True)),
 ) -> Item:
@@ -167,15 +222,23 @@ async def update_item(
         id=item_id,
         total_report_state=item_data.total_report_state,
         last_service=item_data.last_service,
+        current_reservation_id=item_data.current_reservation_id,
+        next_reservation_start=item_data.next_reservation_start,
+        available_until=item_data.available_until,
         **item.dict(exclude_none=True, exclude={'change_comment'})
     )
     await _save_state(item_data, db_item, None, change_comment, _user['sub'])
-    if not await collections.item_collection.replace_one(db_item):
+    if not await _write_item(db_item):
         raise HTTPException(404, f"Item {item_id} not found")
+    change_feed.publish(item_event(ChangeEventType.ItemUpdated, db_item, item_data.bay_id))
     # !Gone -> Gone -> Notify reservations
     if item_data.condition != ItemCondition.Gone and db_item.condition == ItemCondition.Gone:
-        async for reservation in collections.reservation_collection.find({'item_id': item_id, 'returned': False}):
-            background_tasks.add_task(send_reservation_item_removed, _user, db_item, reservation)
+        await send_reservation_item_removed(_user, db_item, [
+            reservation.id
+            async for reservation in collections.reservation_collection.find(
+                {'items': item_id, 'returned': False}, fields={'id'}
+            )
+        ])
     return Item.validate(db_item)
 
 
@@ -198,14 +261,18 @@ async def report_item(
             raise HTTPException(404, f"Bay {item.bay_id} not found")
     db_item = DbItem(
         id=item_id,
+        current_reservation_id=item_data.current_reservation_id,
+        next_reservation_start=item_data.next_reservation_start,
+        available_until=item_data.available_until,
         **item.dict(exclude_none=True, exclude={'change_comment', 'report'})
     )
 
     report = await _get_report(db_item.report_profile_id, item.report)
 
     await _save_state(item_data, db_item, report, change_comment, _user['sub'])
-    if not await collections.item_collection.replace_one(db_item):
+    if not await _write_item(db_item):
         raise HTTPException(404, f"Item {item_id} not found")
+    change_feed.publish(item_event(ChangeEventType.ItemUpdated, db_item, item_data.bay_id))
     return Item.validate(db_item)
 
 
@@ -217,8 +284,10 @@ async def delete_item(
         item_id: UUID,
         _user: UserInfo = Depends(Authentication(require_admin=True)),
 ) -> None:
-    if not await collections.item_collection.delete_one({'_id': item_id}):
+    item_data = await collections.item_collection.find_one_and_delete({'_id': item_id})
+    if item_data is None:
         raise HTTPException(404, f"Item {item_id} not found")
+    change_feed.publish(item_event(ChangeEventType.ItemDeleted, item_data))
 
 
 @router.get(
@@ -233,7 +302,7 @@ async def get_item_history(
         offset: Optional[int] = Query(None),
         limit: Optional[int] = Query(None),
         _user: UserInfo = Depends(Authentication()),
-) -> List[ItemState]:
+) -> Response:
     if not await collections.item_collection.exists({'_id': item_id}):
         raise HTTPException(404, f"Item {item_id} not found")
     query: dict = {'item_id': item_id}
@@ -244,12 +313,12 @@ async def get_item_history(
             query['timestamp']['$lt'] = end
         else:
             query['timestamp'] = {'$lt': end}
-    return [
+    return models_response([
         ItemState.validate(item_state)
-        async for item_state in collections.item_state_collection.find(
+        async for item_state in collections.item_state_collection.read_only.find(
             {'item_id': item_id},
             skip=offset,
             limit=limit,
             sort=[('timestamp', DESCENDING)],
         )
-    ]
+    ])
@@ -0,0 +1,19 @@
+from authlib.oidc.core import UserInfo
+from fastapi import APIRouter, Depends
+
+from depot_server.helper.auth import Authentication
+from depot_server.mail.outbox import outbox
+from depot_server.model import MailOutboxStats
+
+router = APIRouter()
+
+
+@router.get(
+    '/mail-outbox/stats',
+    tags=['Mail'],
+    response_model=MailOutboxStats,
+)
+async def get_mail_outbox_stats(
+        _user: UserInfo = Depends(Authentication(require_admin=True)),
+) -> MailOutboxStats:
+    return await outbox.stats()
@@ -0,0 +1,104 @@
+import secrets
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from starlette.responses import Response
+from starlette.routing import BaseRoute
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from depot_server.config import config
+from depot_server.db.monitoring import current_operation
+from depot_server.helper.metrics import registry, http_request_duration, http_requests, http_requests_in_flight, \
+    Histogram, Counter
+
+router = APIRouter()
+
+_unmatched_route = 'unmatched'
+_methods = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'HEAD')
+
+
+@router.get('/metrics', include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)) -> Response:
+    if config.metrics_token is not None and (
+            authorization is None or not secrets.compare_digest(authorization, f"Bearer {config.metrics_token}")
+    ):
+        raise HTTPException(403, "Invalid metrics token")
+    return Response(registry.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class _RouteMetrics:
+    __slots__ = ('duration', 'status')
+
+    def __init__(self, duration: Histogram, requests: Counter, method: str, route: str):
+        self.duration = duration.labels(method, route)
+        # By status class 1xx to 5xx
+        self.status = [requests.labels(method, route, f'{status_class}xx') for status_class in range(1, 6)]
+
+
+class MetricsMiddleware:
+    """
+    Records the latency and status of every request by route (path template) and the number of requests in flight.
+
+    The metric children of all routes are created once from `routes` on the first call, a request only looks them up
+    by the endpoint which the router stored in the scope.
+    """
+
+    def __init__(self, app: ASGIApp, routes: List[BaseRoute]):
+        self.app = app
+        self.routes = routes
+        self._route_metrics: Optional[Dict[Any, Dict[str, _RouteMetrics]]] = None
+        self._unmatched_metrics: Dict[str, _RouteMetrics] = {}
+        self._in_flight = http_requests_in_flight.labels()
+
+    def _register_routes(self):
+        route_metrics: Dict[Any, Dict[str, _RouteMetrics]] = {}
+        for route in self.routes:
+            endpoint = getattr(route, 'endpoint', None)
+            methods = getattr(route, 'methods', None)
+            if endpoint is None or not methods:
+                continue
+            route_metrics[endpoint] = {
+                method: _RouteMetrics(http_request_duration, http_requests, method, getattr(route, 'path'))
+                for method in methods
+            }
+        self._unmatched_metrics = {
+            method: _RouteMetrics(http_request_duration, http_requests, method, _unmatched_route)
+            for method in _methods + ('other',)
+        }
+        self._route_metrics = route_metrics
+
+    def _get_metrics(self, scope: Scope) -> _RouteMetrics:
+        assert self._route_metrics is not None
+        method = scope['method']
+        metrics = self._route_metrics.get(scope.get('endpoint'), self._unmatched_metrics).get(method)
+        if metrics is None:
+            metrics = self._unmatched_metrics.get(method, self._unmatched_metrics['other'])
+        return metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if self._route_metrics is None:
+            self._register_routes()
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status: List[int] = [500]
+
+        async def send_wrapper(message: Message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        self._in_flight.inc()
+        # Tags the Mongo commands of this request, the router adds the endpoint to the scope
+        operation_token = current_operation.set(scope)
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_operation.reset(operation_token)
+            self._in_flight.dec()
+            metrics = self._get_metrics(scope)
+            metrics.duration.observe(perf_counter() - start)
+            metrics.status[min(max(status[0] // 100, 1), 5) - 1].inc()
@@ -19,7 +19,7 @@ router = APIRouter()
 async def get_pictures(
         _user: UserInfo = Depends(Authentication(require_manager=True)),
 ) -> List[str]:
-    return [picture.id async for picture in collections.item_picture_collection.find({})]
+    return [picture.id async for picture in collections.item_picture_read_only_collection.find({})]
 
 
 @router.get(
@@ -29,7 +29,7 @@ async def get_pictures(
 async def get_picture(picture_id: str):
     """Get picture data."""
     try:
-        stream = await collections.item_picture_collection.open_download_stream(picture_id)
+        stream = await collections.item_picture_read_only_collection.open_download_stream(picture_id)
     except gridfs.errors.NoFile:
         raise HTTPException(404)
 
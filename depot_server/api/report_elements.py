@@ -1,12 +1,15 @@
-from typing import List
+from typing import List, Optional
 from uuid import UUID, uuid4
 
 from authlib.oidc.core import UserInfo
-from fastapi import APIRouter, Depends, Body, HTTPException
+from fastapi import APIRouter, Depends, Body, HTTPException, Query
+from starlette.responses import Response
 
 from depot_server.db import DbReportElement, collections
-from depot_server.model import ReportElement, ReportElementInWrite
+from depot_server.model import ReportElement, ReportElementInWrite, CascadeJob, CascadeKind, Batch
 from depot_server.helper.auth import Authentication
+from depot_server.helper.batch import batch_response
+from depot_server.helper.cascade_jobs import cascade_jobs
 
 router = APIRouter()
 
@@ -21,10 +24,24 @@ async def get_report_elements(
 ) -> List[ReportElement]:
     return [
         ReportElement.validate(report_element)
-        async for report_element in collections.report_element_collection.find({})
+        async for report_element in collections.report_element_collection.read_only.find({})
     ]
 
 
+@router.get(
+    '/report-elements/batch',
+    tags=['Report Element'],
+    response_model=Batch[ReportElement],
+)
+async def get_report_elements_batch(
+        ids: List[UUID] = Query(..., description="Ids of the report elements, the results keep their order"),
+        fields: Optional[str] = Query(None, description="Comma separated fields to return"),
+        _user: UserInfo = Depends(Authentication()),
+) -> Response:
+    """Returns the report elements of `ids` with one query. Ids which do not exist are listed in `missing`."""
+    return await batch_response(collections.report_element_collection.read_only, ReportElement, ids, fields)
+
+
 @router.get(
     '/report-elements/{report_element_id}',
     tags=['Report Element'],
@@ -80,16 +97,16 @@ async def update_report_element(
 @router.delete(
     '/report-elements/{report_element_id}',
     tags=['Report Element'],
+    response_model=CascadeJob,
 )
 async def delete_report_element(
         report_element_id: UUID,
         _user: UserInfo = Depends(Authentication(require_admin=True)),
-) -> None:
+) -> CascadeJob:
+    """
+    Deletes the report element. It is removed from the report profiles and the item history by the returned background
+    job.
+    """
     if not await collections.report_element_collection.delete_one({'_id': report_element_id}):
         raise HTTPException(404, f"No report_element for id {report_element_id}")
-    await collections.report_profile_collection.update_many(
-        {'elements': report_element_id}, {'$pull': {'elements': report_element_id}}
-    )
-    await collections.item_state_collection.update_many(
-        {'report.report_element_id': report_element_id}, {'$pull': {'report': {'report_element_id': report_element_id}}}
-    )
+    return CascadeJob.validate(await cascade_jobs.enqueue(CascadeKind.ReportElement, report_element_id))
@@ -1,12 +1,15 @@
-from typing import List
+from typing import List, Optional
 from uuid import UUID, uuid4
 
 from authlib.oidc.core import UserInfo
-from fastapi import APIRouter, Depends, Body, HTTPException
+from fastapi import APIRouter, Depends, Body, HTTPException, Query
+from starlette.responses import Response
 
 from depot_server.db import DbReportProfile, collections
-from depot_server.model import ReportProfile, ReportProfileInWrite
+from depot_server.model import ReportProfile, ReportProfileInWrite, CascadeJob, CascadeKind, Batch
 from depot_server.helper.auth import Authentication
+from depot_server.helper.batch import batch_response
+from depot_server.helper.cascade_jobs import cascade_jobs
 
 router = APIRouter()
 
@@ -21,10 +24,24 @@ async def get_report_profiles(
 ) -> List[ReportProfile]:
     return [
         ReportProfile.validate(report_profile)
-        async for report_profile in collections.report_profile_collection.find({})
+        async for report_profile in collections.report_profile_collection.read_only.find({})
     ]
 
 
+@router.get(
+    '/report-profiles/batch',
+    tags=['Report Profile'],
+    response_model=Batch[ReportProfile],
+)
+async def get_report_profiles_batch(
+        ids: List[UUID] = Query(..., description="Ids of the report profiles, the results keep their order"),
+        fields: Optional[str] = Query(None, description="Comma separated fields to return"),
+        _user: UserInfo = Depends(Authentication()),
+) -> Response:
+    """Returns the report profiles of `ids` with one query. Ids which do not exist are listed in `missing`."""
+    return await batch_response(collections.report_profile_collection.read_only, ReportProfile, ids, fields)
+
+
 @router.get(
     '/report-profiles/{report_profile_id}',
     tags=['Report Profile'],
@@ -80,13 +97,13 @@ async def update_report_profile(
 @router.delete(
     '/report-profiles/{report_profile_id}',
     tags=['Report Profile'],
+    response_model=CascadeJob,
 )
 async def delete_report_profile(
         report_profile_id: UUID,
         _user: UserInfo = Depends(Authentication(require_admin=True)),
-) -> None:
+) -> CascadeJob:
+    """Deletes the report profile. It is removed from the items by the returned background job."""
     if not await collections.report_profile_collection.delete_one({'_id': report_profile_id}):
         raise HTTPException(404, f"No report_profile for id {report_profile_id}")
-    await collections.item_collection.update_many(
-        {'report_profile_id': report_profile_id}, {'$unset': {'report_profile_id': report_profile_id}}
-    )
+    return CascadeJob.validate(await cascade_jobs.enqueue(CascadeKind.ReportProfile, report_profile_id))
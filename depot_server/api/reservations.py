@@ -1,41 +1,208 @@
+import asyncio
 from authlib.oidc.core import UserInfo
-from datetime import date
-from fastapi import APIRouter, Depends, Body, Query, HTTPException, BackgroundTasks
+from datetime import date, timedelta
+from fastapi import APIRouter, Depends, Body, Query, HTTPException
+from fastapi.encoders import jsonable_encoder
 from pymongo import DESCENDING, ASCENDING
-from typing import List, Optional, Set, Dict
+from starlette.responses import Response
+from typing import List, Optional, Set, Tuple, Union
 from uuid import UUID, uuid4
 
 from depot_server.config import config
-from depot_server.db import collections, DbReservation, DbItem
+from depot_server.db import collections, DbReservation
 from depot_server.helper.auth import Authentication
-from depot_server.mail.manager_item_problem import send_manager_item_problem, ProblemItem
-from depot_server.model import Reservation, ReservationInWrite, ReservationReturnInWrite
+from depot_server.helper.batch import batch_response
+from depot_server.helper.change_feed import change_feed, reservation_event
+from depot_server.helper.fields import parse_fields, partial_response
+from depot_server.helper.availability import busy_intervals, merge_intervals, free_windows
+from depot_server.helper.group_allocation import group_lock, allocate_group_items, group_availability, \
+    group_free_windows
+from depot_server.helper.response import models_response
+from depot_server.helper.item_reservation_status import update_item_reservation_status
+from depot_server.helper.recurrence import expand_recurrence
+from depot_server.helper.utilization import update_reservation_utilization, update_reservations_utilization
+from depot_server.mail.manager_item_problem import send_manager_item_problem
+from depot_server.model import Reservation, ReservationInWrite, ReservationReturnInWrite, ChangeEventType, \
+    Batch, GroupReservationInWrite, GroupDayAvailability, ReservationConflict, ReservationValidation, \
+    FreeWindow
 
 router = APIRouter()
 
+# Allocations of a group reservation which conflicted with concurrent reservations of concrete items
+_group_allocation_attempts = 3
+_max_availability_days = 366
+_max_free_windows = 50
 
-async def _check_items(item_ids: List[UUID], start: date, end: date, skip_reservation_id: UUID = None):
-    if skip_reservation_id is None:
-        skip_id = {}
-    else:
-        skip_id = {
-            '_id': {'$ne': skip_reservation_id}
-        }
-    safe_item_ids = [
-        item['_id']
-        async for item in collections.item_collection.collection.find({'_id': {'$in': item_ids}}, projection={'_id': 1})
-    ]
-    if len(safe_item_ids) != len(item_ids):
-        raise HTTPException(404, "Some items were not found")
-    item_ids_set = set(item_ids)
-    async for reservation in collections.reservation_collection.collection.find({
+
+async def _missing_items(item_ids: List[UUID]) -> List[UUID]:
+    existing_item_ids = {
+        item.id async for item in collections.item_collection.find({'_id': {'$in': item_ids}}, fields={'id'})
+    }
+    return [item_id for item_id in dict.fromkeys(item_ids) if item_id not in existing_item_ids]
+
+
+async def _find_conflicts(
+        item_ids: List[UUID], occurrences: List[Tuple[date, date]], skip_reservation_ids: List[UUID] = None
+) -> List[Tuple[DbReservation, date, date]]:
+    """
+    Finds the reservations of any of the items which overlap one of the occurrences (ordered by start, not
+    overlapping, a single reservation has one occurrence) with one range query. Returns each overlapping reservation
+    and occurrence with the overlapping days.
+
+    The reservations come in start order and are merged with the occurrences (sort-merge), so this is linear in the
+    number of reservations, occurrences and conflicts.
+    """
+    query: dict = {
         'items': {'$in': item_ids},
-        'end': {'$gte': start.toordinal()},
-        'start': {'$lte': end.toordinal()},
-        **skip_id
-    }, projection={'items': 1, '_id': 0}):
-        if not item_ids_set.isdisjoint(reservation['items']):
-            raise HTTPException(400, "Some items are already reserved")
+        'end': {'$gte': occurrences[0][0].toordinal()},
+        'start': {'$lte': occurrences[-1][1].toordinal()},
+    }
+    if skip_reservation_ids:
+        query['_id'] = {'$nin': skip_reservation_ids}
+    conflicts: List[Tuple[DbReservation, date, date]] = []
+    index = 0
+    async for reservation in collections.reservation_collection.find(
+            query, sort=[('start', ASCENDING)], fields={'id', 'start', 'end', 'items', 'user_id', 'team_id'}
+    ):
+        # Later reservations do not start earlier, so occurrences which ended before cannot overlap them either
+        while index < len(occurrences) and occurrences[index][1] < reservation.start:
+            index += 1
+        if index == len(occurrences):
+            break
+        overlap_index = index
+        while overlap_index < len(occurrences) and occurrences[overlap_index][0] <= reservation.end:
+            start, end = occurrences[overlap_index]
+            conflicts.append((reservation, max(start, reservation.start), min(end, reservation.end)))
+            overlap_index += 1
+    return conflicts
+
+
+def _conflict_report(
+        item_ids: List[UUID], conflicts: List[Tuple[DbReservation, date, date]], _user: UserInfo
+) -> List[ReservationConflict]:
+    requested_item_ids = set(item_ids)
+    sees_all_owners = 'admin' in _user['roles'] or 'manager' in _user['roles']
+    report = []
+    for reservation, start, end in conflicts:
+        sees_owner = sees_all_owners or _is_owner(reservation, _user)
+        report.append(ReservationConflict(
+            reservation_id=reservation.id,
+            user_id=reservation.user_id if sees_owner else None,
+            team_id=reservation.team_id if sees_owner else None,
+            item_ids=[item_id for item_id in reservation.items if item_id in requested_item_ids],
+            start=start,
+            end=end,
+        ))
+    return report
+
+
+async def _check_items(
+        item_ids: List[UUID], occurrences: List[Tuple[date, date]], _user: UserInfo,
+        skip_reservation_ids: List[UUID] = None,
+):
+    """Raises 404 for missing items and 400 with the conflict report if any item is already reserved."""
+    if len(set(item_ids)) != len(item_ids):
+        raise HTTPException(400, "Duplicate items")
+    if await _missing_items(item_ids):
+        raise HTTPException(404, "Some items were not found")
+    conflicts = await _find_conflicts(item_ids, occurrences, skip_reservation_ids)
+    if conflicts:
+        raise HTTPException(400, {
+            'message': "Some items are already reserved",
+            'conflicts': jsonable_encoder(_conflict_report(item_ids, conflicts, _user)),
+        })
+
+
+async def _written_concurrently(reservations: List[DbReservation]) -> bool:
+    """
+    Checks after writing the reservations (a single one or occurrences of a series, which share the items) whether
+    another reservation of their items on overlapping days was written since `_check_items`. Every writer checks this
+    after its own write, so of two concurrent writers at least one sees the other and undoes its write.
+    """
+    if not reservations:
+        return False
+    occurrences = sorted((reservation.start, reservation.end) for reservation in reservations)
+    return bool(await _find_conflicts(
+        reservations[0].items, occurrences, [reservation.id for reservation in reservations]
+    ))
+
+
+def _concurrent_write() -> HTTPException:
+    return HTTPException(409, "Some items were reserved concurrently, try again")
+
+
+def _is_owner(reservation: DbReservation, _user: UserInfo) -> bool:
+    """The user made the reservation or is in its team."""
+    return reservation.user_id == _user['sub'] or (
+        reservation.team_id is not None and reservation.team_id in _user.get(config.oauth2.teams_property, [])
+    )
+
+
+def _check_update_user(prev_reservation: DbReservation, reservation: ReservationInWrite, _user: UserInfo):
+    if reservation.team_id is not None and reservation.team_id not in _user.get(config.oauth2.teams_property, []) and \
+            'admin' not in _user['roles']:
+        raise HTTPException(400, f"User is not in team {reservation.team_id}")
+    if reservation.user_id is None:
+        reservation.user_id = _user['sub']
+    elif reservation.user_id != _user['sub'] and reservation.user_id != prev_reservation.user_id and \
+            'admin' not in _user['roles']:
+        raise HTTPException(400, f"Cannot set user {reservation.user_id}")
+
+
+def _check_new_reservation_user(reservation: Union[ReservationInWrite, GroupReservationInWrite], _user: UserInfo):
+    if reservation.team_id is not None and reservation.team_id not in _user.get(config.oauth2.teams_property, []):
+        raise HTTPException(400, f"User is not in team {reservation.team_id}")
+    if reservation.user_id is None:
+        reservation.user_id = _user['sub']
+    elif reservation.user_id != _user['sub'] and 'admin' not in _user['roles']:
+        raise HTTPException(400, f"Cannot set user {reservation.user_id}")
+
+
+async def _created(db_reservation: DbReservation):
+    await asyncio.gather(
+        update_reservation_utilization(None, db_reservation),
+        update_item_reservation_status(db_reservation.items),
+    )
+    change_feed.publish(reservation_event(ChangeEventType.ReservationCreated, db_reservation))
+
+
+async def _series_changed(removed: List[DbReservation], added: List[DbReservation]):
+    await asyncio.gather(
+        update_reservations_utilization(removed, added),
+        update_item_reservation_status(list({
+            item_id for reservation in removed + added for item_id in reservation.items
+        })),
+    )
+    for reservation in removed:
+        change_feed.publish(reservation_event(ChangeEventType.ReservationDeleted, reservation))
+    for reservation in added:
+        change_feed.publish(reservation_event(ChangeEventType.ReservationCreated, reservation))
+
+
+def _series_reservations(
+        reservation: ReservationInWrite, series_id: UUID, occurrences: List[Tuple[date, date]]
+) -> List[DbReservation]:
+    data = reservation.dict(exclude={'recurrence', 'start', 'end'})
+    return [
+        DbReservation(id=uuid4(), start=start, end=end, series_id=series_id, **data)
+        for start, end in occurrences
+    ]
+
+
+async def _find_reservations(
+        query: dict, skip: int = None, limit: int = None, sort: List[Tuple[str, int]] = None,
+        fields: Set[str] = None,
+) -> List[DbReservation]:
+    return [
+        reservation
+        async for reservation in collections.reservation_collection.read_only.find(
+            query, skip=skip, limit=limit, sort=sort, fields=fields
+        )
+    ]
+
+
+async def _no_reservations() -> List[DbReservation]:
+    return []
 
 
 @router.get(
@@ -49,13 +216,16 @@ async def get_reservations(
         start: Optional[date] = Query(None),
         end: Optional[date] = Query(None),
         item_id: Optional[UUID] = Query(None),
+        series_id: Optional[UUID] = Query(None),
         include_returned: Optional[bool] = Query(False),
         offset: Optional[int] = Query(None, ge=0),
         limit: Optional[int] = Query(None, gt=0),
         limit_before_start: Optional[int] = Query(None, gt=0),
         limit_after_end: Optional[int] = Query(None, gt=0),
+        fields: Optional[str] = Query(None, description="Comma separated fields to return"),
         _user: UserInfo = Depends(Authentication()),
-) -> List[Reservation]:
+) -> Response:
+    field_names = parse_fields(fields, Reservation)
     query: dict = {}
     if for_user is not None:
         query['user_id'] = for_user
@@ -63,8 +233,11 @@ async def get_reservations(
         query['user_id'] = _user['sub']
     if item_id is not None:
         query['items'] = item_id
+    if series_id is not None:
+        query['series_id'] = series_id
     if not include_returned:
         query['returned'] = False
+    before_query: Optional[dict] = None
     if limit_before_start is not None:
         if start is None:
             raise HTTPException(400, "Require start for limit_before_start")
@@ -72,14 +245,7 @@ async def get_reservations(
             **query,
             'end': {'$lt': start.toordinal()},
         }
-        before_start = [
-            Reservation.validate(reservation)
-            async for reservation in collections.reservation_collection.find(
-                before_query, limit=limit_before_start, sort=[('start', DESCENDING)]
-            )
-        ]
-    else:
-        before_start = []
+    after_query: Optional[dict] = None
     if limit_after_end is not None:
         if end is None:
             raise HTTPException(400, "Require end for limit_after_end")
@@ -87,32 +253,26 @@ async def get_reservations(
             **query,
             'start': {'$gt': end.toordinal()}
         }
-        after_end = [
-            Reservation.validate(reservation)
-            async for reservation in collections.reservation_collection.find(
-                after_query, limit=limit_after_end, sort=[('start', ASCENDING)]
-            )
-        ]
-        after_end.reverse()
-    else:
-        after_end = []
 
     if start is not None:
         query['end'] = {'$gte': start.toordinal()}
     if end is not None:
         query['start'] = {'$lte': end.toordinal()}
 
-    if (limit is None or limit > 0) and (start is None or end is None or start < end):
-        mid = [
-            Reservation.validate(reservation)
-            async for reservation in collections.reservation_collection.find(
-                query, skip=offset, limit=limit, sort=[('start', DESCENDING)]
-            )
-        ]
-    else:
-        mid = []
+    # The three windows are independent, query them concurrently
+    before_start, mid, after_end = await asyncio.gather(
+        _find_reservations(before_query, limit=limit_before_start, sort=[('start', DESCENDING)], fields=field_names)
+        if before_query is not None else _no_reservations(),
+        _find_reservations(query, skip=offset, limit=limit, sort=[('start', DESCENDING)], fields=field_names)
+        if (limit is None or limit > 0) and (start is None or end is None or start < end) else _no_reservations(),
+        _find_reservations(after_query, limit=limit_after_end, sort=[('start', ASCENDING)], fields=field_names)
+        if after_query is not None else _no_reservations(),
+    )
+    after_end.reverse()
 
-    return before_start + mid + after_end
+    if field_names is not None:
+        return partial_response(before_start + mid + after_end)
+    return models_response([Reservation.validate(reservation) for reservation in before_start + mid + after_end])
 
 
 @router.get(
@@ -133,16 +293,73 @@ async def get_reservations_items(
             '_id': {'$ne': skip_reservation_id}
         }
     item_ids: Set[UUID] = set()
-    async for reservation in collections.reservation_collection.collection.find({
+    async for reservation in collections.reservation_collection.find({
         'end': {'$gte': start.toordinal()},
         'start': {'$lte': end.toordinal()},
         **skip_id
-    }, projection={'items': 1, '_id': 0}):
-        item_ids.update(reservation['items'])
+    }, fields={'items'}):
+        item_ids.update(reservation.items)
 
     return list(item_ids)
 
 
+@router.get(
+    '/reservations/batch',
+    tags=['Reservation'],
+    response_model=Batch[Reservation],
+)
+async def get_reservations_batch(
+        ids: List[UUID] = Query(..., description="Ids of the reservations, the results keep their order"),
+        fields: Optional[str] = Query(None, description="Comma separated fields to return"),
+        _user: UserInfo = Depends(Authentication()),
+) -> Response:
+    """Returns the reservations of `ids` with one query. Ids which do not exist are listed in `missing`."""
+    return await batch_response(collections.reservation_collection.read_only, Reservation, ids, fields)
+
+
+@router.get(
+    '/reservations/free-windows',
+    tags=['Reservation'],
+    response_model=List[FreeWindow],
+)
+async def get_free_windows(
+        duration: int = Query(..., gt=0, description="Days of the reservation"),
+        item_ids: Optional[List[UUID]] = Query(None, description="Items which must all be free"),
+        group_id: Optional[str] = Query(None, description="Group of which `count` items must be free"),
+        count: int = Query(1, gt=0),
+        start: Optional[date] = Query(None, description="First day to search from, defaults to today"),
+        horizon: int = Query(90, gt=0, le=_max_availability_days, description="Days to search"),
+        limit: int = Query(5, gt=0, le=_max_free_windows),
+        _user: UserInfo = Depends(Authentication()),
+) -> Response:
+    """
+    Returns the earliest windows in which a reservation of `duration` days is possible, either for all `item_ids` or
+    for `count` items of the group. The busy intervals of all items are read with one range query and swept for free
+    gaps, instead of probing every candidate day.
+    """
+    if (item_ids is None) == (group_id is None):
+        raise HTTPException(400, "Either item_ids or group_id is required")
+    if start is None:
+        start = date.today()
+    end = start + timedelta(days=horizon - 1)
+    if group_id is not None:
+        windows = await group_free_windows(group_id, count, start, end, duration, limit)
+    else:
+        assert item_ids is not None
+        if await _missing_items(item_ids):
+            raise HTTPException(404, "Some items were not found")
+        busy = await busy_intervals(collections.reservation_collection.read_only, item_ids, start, end)
+        # All items must be free, so their busy intervals are united
+        windows = free_windows(
+            merge_intervals(interval for intervals in busy.values() for interval in intervals),
+            start, end, duration, limit,
+        )
+    return models_response([
+        FreeWindow(start=date.fromordinal(window_start), end=date.fromordinal(window_end))
+        for window_start, window_end in windows
+    ])
+
+
 @router.get(
     '/reservations/{reservation_id}',
     tags=['Reservation'],
@@ -168,21 +385,124 @@ async def create_reservation(
         reservation: ReservationInWrite = Body(...),
         _user: UserInfo = Depends(Authentication(require_userinfo=True)),
 ) -> Reservation:
-    if reservation.team_id is not None and reservation.team_id not in _user.get(config.oauth2.teams_property, []):
-        raise HTTPException(400, f"User is not in team {reservation.team_id}")
-    if reservation.user_id is None:
-        reservation.user_id = _user['sub']
-    elif reservation.user_id != _user['sub'] and 'admin' not in _user['roles']:
-        raise HTTPException(400, f"Cannot set user {reservation.user_id}")
+    """
+    Creates a reservation. With a `recurrence`, all occurrences of the series are created and the first one is
+    returned.
+    """
+    _check_new_reservation_user(reservation, _user)
+    if reservation.recurrence is not None:
+        occurrences = expand_recurrence(reservation.start, reservation.end, reservation.recurrence)
+        await _check_items(reservation.items, occurrences, _user)
+        db_reservations = _series_reservations(reservation, uuid4(), occurrences)
+        await collections.reservation_collection.insert_many(db_reservations)
+        if await _written_concurrently(db_reservations):
+            await collections.reservation_collection.delete_many(
+                {'_id': {'$in': [db_reservation.id for db_reservation in db_reservations]}}
+            )
+            raise _concurrent_write()
+        await _series_changed([], db_reservations)
+        return Reservation.validate(db_reservations[0])
     db_reservation = DbReservation(
         id=uuid4(),
-        **reservation.dict(),
+        **reservation.dict(exclude={'recurrence'}),
     )
-    await _check_items(reservation.items, reservation.start, reservation.end)
+    await _check_items(reservation.items, [(reservation.start, reservation.end)], _user)
     await collections.reservation_collection.insert_one(db_reservation)
+    if await _written_concurrently([db_reservation]):
+        await collections.reservation_collection.delete_one({'_id': db_reservation.id})
+        raise _concurrent_write()
+    await _created(db_reservation)
     return Reservation.validate(db_reservation)
 
 
+@router.post(
+    '/reservations/validate',
+    tags=['Reservation'],
+    response_model=ReservationValidation,
+)
+async def validate_reservation(
+        reservation: ReservationInWrite = Body(...),
+        skip_reservation_id: Optional[UUID] = Query(None, description="Reservation which is updated"),
+        skip_series_id: Optional[UUID] = Query(None, description="Series which is updated"),
+        _user: UserInfo = Depends(Authentication(require_userinfo=True)),
+) -> ReservationValidation:
+    """
+    Checks the items of a reservation (or of all occurrences of its recurrence) without saving anything. Reports all
+    missing items and all conflicts with other reservations.
+    """
+    if reservation.recurrence is not None:
+        occurrences = expand_recurrence(reservation.start, reservation.end, reservation.recurrence)
+    else:
+        occurrences = [(reservation.start, reservation.end)]
+    skip_reservation_ids = [] if skip_reservation_id is None else [skip_reservation_id]
+    if skip_series_id is not None:
+        # Like updating the series, which replaces the occurrences which did not start yet
+        skip_reservation_ids += [
+            occurrence.id
+            async for occurrence in collections.reservation_collection.find(
+                {'series_id': skip_series_id, 'start': {'$gt': date.today().toordinal()}}, fields={'id'}
+            )
+        ]
+        occurrences = [(start, end) for start, end in occurrences if start > date.today()]
+    missing_items = await _missing_items(reservation.items)
+    conflicts = await _find_conflicts(reservation.items, occurrences, skip_reservation_ids) if occurrences else []
+    report = _conflict_report(reservation.items, conflicts, _user)
+    return ReservationValidation(valid=not missing_items and not report, missing_items=missing_items, conflicts=report)
+
+
+@router.post(
+    '/reservations/group',
+    tags=['Reservation'],
+    response_model=Reservation,
+    status_code=201,
+)
+async def create_group_reservation(
+        reservation: GroupReservationInWrite = Body(...),
+        _user: UserInfo = Depends(Authentication(require_userinfo=True)),
+) -> Reservation:
+    """Reserves `count` items of the group, the server allocates free items (see `allocate_group_items`)."""
+    _check_new_reservation_user(reservation, _user)
+    if reservation.end < reservation.start:
+        raise HTTPException(400, "End is before start")
+    async with group_lock(reservation.group_id):
+        for _ in range(_group_allocation_attempts):
+            db_reservation = DbReservation(
+                id=uuid4(),
+                items=await allocate_group_items(
+                    reservation.group_id, reservation.count, reservation.start, reservation.end
+                ),
+                **reservation.dict(exclude={'group_id', 'count'}),
+            )
+            await collections.reservation_collection.insert_one(db_reservation)
+            # Reservations of concrete items do not take the group lock, one may have taken an allocated item since
+            if not await _written_concurrently([db_reservation]):
+                break
+            await collections.reservation_collection.delete_one({'_id': db_reservation.id})
+        else:
+            raise HTTPException(409, f"Items of group {reservation.group_id} are being reserved, try again")
+    await _created(db_reservation)
+    return Reservation.validate(db_reservation)
+
+
+@router.get(
+    '/reservations/groups/{group_id}/availability',
+    tags=['Item'],
+    response_model=List[GroupDayAvailability],
+)
+async def get_group_availability(
+        group_id: str,
+        start: date = Query(...),
+        end: date = Query(...),
+        _user: UserInfo = Depends(Authentication()),
+) -> Response:
+    """Returns the number of items of the group which are free on each day of the (inclusive) range."""
+    if end < start:
+        raise HTTPException(400, "End is before start")
+    if (end - start).days >= _max_availability_days:
+        raise HTTPException(400, f"At most {_max_availability_days} days can be requested")
+    return models_response(await group_availability(group_id, start, end))
+
+
 @router.put(
     '/reservations/{reservation_id}',
     tags=['Reservation'],
@@ -196,19 +516,11 @@ async def update_reservation(
     prev_reservation = await collections.reservation_collection.find_one({'_id': reservation_id})
     if prev_reservation is None:
         raise HTTPException(404, f"Reservation {reservation_id} not found")
-    if prev_reservation.user_id != _user['sub'] and (
-            prev_reservation.team_id not in _user.get(config.oauth2.teams_property, []) or
-            prev_reservation.team_id is None
-    ) and 'admin' not in _user['roles']:
+    if not _is_owner(prev_reservation, _user) and 'admin' not in _user['roles']:
         raise HTTPException(403, f"Cannot modify {reservation_id}")
-    if reservation.team_id is not None and reservation.team_id not in _user.get(config.oauth2.teams_property, []) and \
-            'admin' not in _user['roles']:
-        raise HTTPException(400, f"User is not in team {reservation.team_id}")
-    if reservation.user_id is None:
-        reservation.user_id = _user['sub']
-    elif reservation.user_id != _user['sub'] and reservation.user_id != prev_reservation.user_id and \
-            'admin' not in _user['roles']:
-        raise HTTPException(400, f"Cannot set user {reservation.user_id}")
+    if reservation.recurrence is not None:
+        raise HTTPException(400, "The recurrence can only be changed for the whole series")
+    _check_update_user(prev_reservation, reservation, _user)
     if reservation.start <= date.today() and reservation.start != prev_reservation.start \
             and 'admin' not in _user['roles']:
         raise HTTPException(400, "Cannot change start of started reservation")
@@ -220,11 +532,20 @@ async def update_reservation(
         raise HTTPException(400, "Cannot change items of past reservation")
     db_reservation = DbReservation(
         id=reservation_id,
-        **reservation.dict()
+        series_id=prev_reservation.series_id,
+        **reservation.dict(exclude={'recurrence'})
     )
-    await _check_items(reservation.items, reservation.start, reservation.end, reservation_id)
+    await _check_items(reservation.items, [(reservation.start, reservation.end)], _user, [reservation_id])
     if not await collections.reservation_collection.replace_one(db_reservation):
         raise HTTPException(404, f"Reservation {reservation_id} not found")
+    if await _written_concurrently([db_reservation]):
+        await collections.reservation_collection.replace_one(prev_reservation)
+        raise _concurrent_write()
+    await asyncio.gather(
+        update_reservation_utilization(prev_reservation, db_reservation),
+        update_item_reservation_status(prev_reservation.items + db_reservation.items),
+    )
+    change_feed.publish(reservation_event(ChangeEventType.ReservationUpdated, db_reservation))
     return Reservation.validate(db_reservation)
 
 
@@ -239,13 +560,96 @@ async def delete_reservation(
     reservation = await collections.reservation_collection.find_one({'_id': reservation_id})
     if reservation is None:
         raise HTTPException(404, f"Reservation {reservation_id} not found")
-    if (reservation.start <= date.today() or (reservation.user_id != _user['sub'] and (
-            reservation.team_id not in _user.get(config.oauth2.teams_property, []) or
-            reservation.team_id is None
-    ))) and 'admin' not in _user['roles']:
+    if (reservation.start <= date.today() or not _is_owner(reservation, _user)) and 'admin' not in _user['roles']:
         raise HTTPException(403, f"Cannot delete {reservation_id}")
     if not await collections.reservation_collection.delete_one({'_id': reservation_id}):
         raise HTTPException(404, f"Reservation {reservation_id} not found")
+    await asyncio.gather(
+        update_reservation_utilization(reservation, None),
+        update_item_reservation_status(reservation.items),
+    )
+    change_feed.publish(reservation_event(ChangeEventType.ReservationDeleted, reservation))
+
+
+async def _find_series(series_id: UUID) -> List[DbReservation]:
+    reservations = [
+        reservation
+        async for reservation in collections.reservation_collection.find(
+            {'series_id': series_id}, sort=[('start', ASCENDING)]
+        )
+    ]
+    if not reservations:
+        raise HTTPException(404, f"Series {series_id} not found")
+    return reservations
+
+
+@router.put(
+    '/reservations/series/{series_id}',
+    tags=['Reservation'],
+    response_model=List[Reservation],
+)
+async def update_reservation_series(
+        series_id: UUID,
+        reservation: ReservationInWrite = Body(...),
+        _user: UserInfo = Depends(Authentication(require_userinfo=True)),
+) -> Response:
+    """
+    Replaces the occurrences of the series which did not start yet by the occurrences of `recurrence` (start and end
+    are those of its first occurrence) which start after today. Started occurrences are kept. Returns all occurrences.
+    """
+    prev_reservations = await _find_series(series_id)
+    if not _is_owner(prev_reservations[0], _user) and 'admin' not in _user['roles']:
+        raise HTTPException(403, f"Cannot modify {series_id}")
+    if reservation.recurrence is None:
+        raise HTTPException(400, "The recurrence is required")
+    _check_update_user(prev_reservations[0], reservation, _user)
+    today = date.today()
+    kept = [prev_reservation for prev_reservation in prev_reservations if prev_reservation.start <= today]
+    replaced = [prev_reservation for prev_reservation in prev_reservations if prev_reservation.start > today]
+    occurrences = [
+        (start, end)
+        for start, end in expand_recurrence(reservation.start, reservation.end, reservation.recurrence)
+        if start > today
+    ]
+    added = _series_reservations(reservation, series_id, occurrences)
+    if occurrences:
+        await _check_items(
+            reservation.items, occurrences, _user, [replaced_reservation.id for replaced_reservation in replaced]
+        )
+    await collections.reservation_collection.delete_many(
+        {'_id': {'$in': [replaced_reservation.id for replaced_reservation in replaced]}}
+    )
+    if added:
+        await collections.reservation_collection.insert_many(added)
+        if await _written_concurrently(added):
+            await collections.reservation_collection.delete_many(
+                {'_id': {'$in': [added_reservation.id for added_reservation in added]}}
+            )
+            if replaced:
+                await collections.reservation_collection.insert_many(replaced)
+            raise _concurrent_write()
+    await _series_changed(replaced, added)
+    return models_response([Reservation.validate(occurrence) for occurrence in kept + added])
+
+
+@router.delete(
+    '/reservations/series/{series_id}',
+    tags=['Reservation'],
+)
+async def delete_reservation_series(
+        series_id: UUID,
+        _user: UserInfo = Depends(Authentication(require_userinfo=True)),
+) -> None:
+    """Deletes the occurrences of the series. Occurrences which started are only deleted by admins."""
+    reservations = await _find_series(series_id)
+    if 'admin' in _user['roles']:
+        deleted = reservations
+    elif _is_owner(reservations[0], _user):
+        deleted = [reservation for reservation in reservations if reservation.start > date.today()]
+    else:
+        raise HTTPException(403, f"Cannot delete {series_id}")
+    await collections.reservation_collection.delete_many({'_id': {'$in': [reservation.id for reservation in deleted]}})
+    await _series_changed(deleted, [])
 
 
 @router.put(
@@ -254,21 +658,18 @@ async def delete_reservation(
 )
 async def return_reservation(
         reservation_id: UUID,
-        background_tasks: BackgroundTasks,
         reservation_return: ReservationReturnInWrite = Body(...),
         _user: UserInfo = Depends(Authentication(require_userinfo=True)),
 ) -> None:
     reservation = await collections.reservation_collection.find_one({'_id': reservation_id})
     if reservation is None:
         raise HTTPException(404, f"Reservation {reservation_id} not found")
-    if reservation.user_id != _user['sub'] and (
-            reservation.team_id not in _user.get(config.oauth2.teams_property, []) or
-            reservation.team_id is None
-    ) and 'admin' not in _user['roles']:
+    if not _is_owner(reservation, _user) and 'admin' not in _user['roles']:
         raise HTTPException(403, f"Cannot modify {reservation_id}")
 
     if reservation.start > date.today() and 'admin' not in _user['roles']:
         raise HTTPException(400, "Cannot finish future reservation")
+    prev_reservation = reservation.copy()
     if reservation.end > date.today():
         reservation.end = date.today()
     reservation.returned = True
@@ -277,27 +678,14 @@ async def return_reservation(
         raise HTTPException(400, "Items must match reservation items")
     if not await collections.reservation_collection.replace_one(reservation):
         raise HTTPException(404, f"Reservation {reservation_id} could not be updated")
+    await asyncio.gather(
+        update_reservation_utilization(prev_reservation, reservation),
+        update_item_reservation_status(reservation.items),
+    )
+    change_feed.publish(reservation_event(ChangeEventType.ReservationReturned, reservation))
 
     problem_items = [
         return_item for return_item in reservation_return.items if return_item.problem or return_item.comment
     ]
     if problem_items:
-        problem_items_by_id: Dict[UUID, DbItem] = {
-            item.id: item
-            async for item in collections.item_collection.find(
-                {'_id': {'$in': [return_item.item_id for return_item in problem_items]}}
-            )
-        }
-        background_tasks.add_task(
-            send_manager_item_problem,
-            _user,
-            [
-                ProblemItem(
-                    problem=problem_item.problem,
-                    comment=problem_item.comment,
-                    item=problem_items_by_id[problem_item.item_id],
-                )
-                for problem_item in problem_items if problem_item.item_id in problem_items_by_id
-            ],
-            reservation,
-        )
+        await send_manager_item_problem(_user, problem_items, reservation)
@@ -0,0 +1,35 @@
+from authlib.oidc.core import UserInfo
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+
+from depot_server.db import collections
+from depot_server.helper.auth import Authentication
+from depot_server.model import ScheduledJob
+
+router = APIRouter()
+
+
+@router.get(
+    '/scheduler/jobs',
+    tags=['Scheduler'],
+    response_model=List[ScheduledJob],
+)
+async def get_scheduled_jobs(
+        _user: UserInfo = Depends(Authentication(require_admin=True)),
+) -> List[ScheduledJob]:
+    return [ScheduledJob.validate(job) async for job in collections.scheduled_job_collection.find({})]
+
+
+@router.get(
+    '/scheduler/jobs/{job_id}',
+    tags=['Scheduler'],
+    response_model=ScheduledJob,
+)
+async def get_scheduled_job(
+        job_id: str,
+        _user: UserInfo = Depends(Authentication(require_admin=True)),
+) -> ScheduledJob:
+    job = await collections.scheduled_job_collection.find_one({'_id': job_id})
+    if job is None:
+        raise HTTPException(404, f"No scheduled job {job_id}")
+    return ScheduledJob.validate(job)
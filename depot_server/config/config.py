@@ -5,9 +5,39 @@ from typing import Optional, List
 from pydantic import BaseModel, Field
 
 
+class MongoReadConfig(BaseModel):
+    # primary, primaryPreferred, secondary, secondaryPreferred or nearest
+    read_preference: str = 'primary'
+    # Maximum replication lag (seconds, at least 90) of secondaries to read from, None for no bound
+    max_staleness: Optional[float] = None
+    # Read concern level (e.g. local or majority), None for the server default
+    read_concern: Optional[str] = None
+
+
 class MongoConfig(BaseModel):
     uri: str = Field(...)
 
+    # Connection pool and timeouts (seconds), None keeps the driver default or the option of the uri
+    max_pool_size: Optional[int] = None
+    min_pool_size: Optional[int] = None
+    max_idle_time: Optional[float] = None
+    wait_queue_timeout: Optional[float] = None
+    connect_timeout: Optional[float] = None
+    socket_timeout: Optional[float] = None
+    server_selection_timeout: Optional[float] = None
+    # Wire compression in order of preference (zstd, snappy, zlib), zstd and snappy need their python packages
+    compressors: List[str] = []
+
+    # Writes, conflict checks and all other reads
+    default_reads: MongoReadConfig = MongoReadConfig()
+    # Read-only endpoints (lists, history, pictures), which may be routed to secondaries
+    read_only_reads: MongoReadConfig = MongoReadConfig()
+
+    # Commands slower than this (seconds) are logged, None disables the log
+    slow_command_threshold: Optional[float] = 0.1
+    # Explain slow commands (once per filter shape) to find collection scans
+    explain_slow_commands: bool = False
+
 
 class MailConfig(BaseModel):
     host: str = Field(...)
@@ -21,6 +51,18 @@ class MailConfig(BaseModel):
     user: Optional[str]
     password: Optional[str]
 
+    pool_size: int = 2
+    pool_max_messages: int = 100
+    pool_idle_timeout: float = 30
+    render_workers: int = 2
+
+    outbox_workers: int = 4
+    outbox_max_attempts: int = 8
+    outbox_retry_backoff: float = 30
+    outbox_retry_backoff_max: float = 3600
+    outbox_lease_time: float = 300
+    outbox_poll_interval: float = 10
+
 
 class OAuth2ClientConfig(BaseModel):
     client_id: str
@@ -39,6 +81,58 @@ class OAuth2ClientConfig(BaseModel):
     teams_property: str = 'teams'
 
 
+class SchedulerConfig(BaseModel):
+    lease_time: float = 300
+    poll_interval: float = 60
+    max_attempts: int = 5
+    retry_backoff: float = 60
+    retry_backoff_max: float = 3600
+
+
+class CascadeConfig(BaseModel):
+    workers: int = 1
+    # Documents updated per batch
+    batch_size: int = 500
+    lease_time: float = 300
+    poll_interval: float = 10
+    max_attempts: int = 5
+
+
+class CompressionConfig(BaseModel):
+    # Smaller responses are sent uncompressed
+    minimum_size: int = 1024
+    gzip_level: int = 6
+    # Only used if the brotli package is installed
+    brotli_quality: int = 4
+
+
+class EventsConfig(BaseModel):
+    # Source of the change events: change_stream (needs a replica set), local (events of this process only) or auto
+    source: str = 'auto'
+    # Events buffered per client, a client which falls behind gets an overflow event and is disconnected
+    queue_size: int = 1000
+    keepalive_interval: float = 15
+
+
+class InvalidationConfig(BaseModel):
+    # Transport of cache invalidations between the workers: mongo (capped collection), memory (this process only) or
+    # auto (mongo, falling back to memory if the capped collection cannot be used)
+    backend: str = 'auto'
+    # Size (bytes) of the capped collection
+    collection_size: int = 1024 * 1024
+    # Seconds to wait before following the capped collection again after the cursor died
+    retry_interval: float = 1
+
+
+class GroupsConfig(BaseModel):
+    # Seconds a group allocation lock is held at most (if the worker crashes)
+    lock_lease_time: float = 30
+    # Seconds to wait for the lock of a group before failing with 409
+    lock_timeout: float = 10
+    # Days before and after a group reservation considered to find the best fitting items
+    fit_window: int = 28
+
+
 class Config(BaseModel):
     mongo: MongoConfig = Field(...)
     mail: MailConfig = Field(...)
@@ -47,3 +141,17 @@ class Config(BaseModel):
     allow_origins: List[str] = Field(...)
 
     return_reservation_reminder_cron_time: time = Field(...)
+    utilization_rebuild_cron_time: time = time(3, 0)
+    item_reservation_status_cron_time: time = time(0, 1)
+
+    scheduler: SchedulerConfig = SchedulerConfig()
+    cascade: CascadeConfig = CascadeConfig()
+    events: EventsConfig = EventsConfig()
+    invalidation: InvalidationConfig = InvalidationConfig()
+    groups: GroupsConfig = GroupsConfig()
+    compression: CompressionConfig = CompressionConfig()
+
+    manager_roster_refresh_interval: float = 300
+
+    # If set, /metrics requires `Authorization: Bearer <metrics_token>`
+    metrics_token: Optional[str] = None
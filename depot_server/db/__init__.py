@@ -1,3 +1,4 @@
 from .collections import startup, shutdown
 from .model import DbItemState, DbBay, DbReservation, DbItem, DbItemStateChanges, DbStrChange, DbItemConditionChange, \
-    DbTagsChange, DbIdChange, DbDateChange, DbTotalReportStateChange, DbItemReport, DbReportElement, DbReportProfile
+    DbTagsChange, DbIdChange, DbDateChange, DbTotalReportStateChange, DbItemReport, DbReportElement, DbReportProfile, \
+    DbMailOutbox, DbScheduledJob, DbItemUtilization, DbCascadeJob, DbGroupLock
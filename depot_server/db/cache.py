@@ -0,0 +1,66 @@
+from typing import Any, Callable, Dict, Generic, List, Optional, Type
+
+from depot_server.db import collections
+from depot_server.db.collection import ModelCollection, TModel
+from depot_server.db.invalidation import invalidation_bus
+from depot_server.db.model import DbReportElement, DbReportProfile
+from depot_server.helper.metrics import cache_requests
+
+
+class ModelCache(Generic[TModel]):
+    """
+    Caches documents of a collection by id in this process. Writes through `ModelCollection` evict the changed
+    documents on all workers (see `InvalidationBus`).
+
+    The cached models are shared between the callers and must not be modified.
+    """
+
+    def __init__(
+            self, name: str, model: Type[TModel], collection: Callable[[], ModelCollection[TModel]],
+            max_size: int = 1000,
+    ):
+        self._collection = collection
+        self._max_size = max_size
+        self._documents: Dict[Any, TModel] = {}
+        # Incremented by every eviction, so documents loaded concurrently to a write are not stored
+        self._generation = 0
+        self._hits = cache_requests.labels(name, 'hit')
+        self._misses = cache_requests.labels(name, 'miss')
+        invalidation_bus.subscribe(model.__collection_name__, self._evict)
+
+    def _evict(self, ids: Optional[List[Any]]):
+        self._generation += 1
+        if ids is None:
+            self._documents.clear()
+        else:
+            for id in ids:
+                self._documents.pop(id, None)
+
+    async def get_many(self, ids: List[Any]) -> Dict[Any, TModel]:
+        """Returns the existing documents of the ids by id."""
+        found = {id: self._documents[id] for id in ids if id in self._documents}
+        missing = [id for id in ids if id not in found]
+        self._hits.inc(len(found))
+        if not missing:
+            return found
+        self._misses.inc(len(missing))
+        generation = self._generation
+        loaded = {
+            document.document_id(): document
+            async for document in self._collection().find({'_id': {'$in': missing}})
+        }
+        if generation == self._generation and len(self._documents) + len(loaded) <= self._max_size:
+            self._documents.update(loaded)
+        found.update(loaded)
+        return found
+
+    async def get(self, id: Any) -> Optional[TModel]:
+        return (await self.get_many([id])).get(id)
+
+
+report_profile_cache: ModelCache[DbReportProfile] = ModelCache(
+    'report_profile', DbReportProfile, lambda: collections.report_profile_collection
+)
+report_element_cache: ModelCache[DbReportElement] = ModelCache(
+    'report_element', DbReportElement, lambda: collections.report_element_collection
+)
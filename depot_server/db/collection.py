@@ -1,62 +1,188 @@
-from typing import TypeVar, Generic, Type, Any, List, Tuple, AsyncIterable, Optional, Iterable
+import functools
+from time import perf_counter
+from typing import TypeVar, Generic, Type, Any, List, Tuple, AsyncIterable, Optional, Iterable, Callable, \
+    Collection, Dict, Mapping
 
 from motor.motor_asyncio import AsyncIOMotorCollection
-from pymongo.errors import OperationFailure
+from pymongo import ReturnDocument
 
+from depot_server.db.invalidation import invalidation_bus
 from depot_server.db.model.base import BaseDocument
+from depot_server.helper.metrics import mongo_operation_duration, mongo_operation_errors
 
 TModel = TypeVar('TModel', bound=BaseDocument)
 
+_operations = (
+    'insert_one', 'insert_many', 'find', 'find_one', 'replace_one', 'update_one', 'find_one_and_update',
+    'update_many', 'delete_one', 'find_one_and_delete', 'delete_many', 'bulk_write', 'aggregate', 'count_documents',
+)
+
+TFunc = TypeVar('TFunc', bound=Callable)
+
+
+def _timed(operation: str) -> Callable[[TFunc], TFunc]:
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self: 'ModelCollection', *args, **kwargs):
+            duration, errors = self._metrics[operation]
+            start = perf_counter()
+            try:
+                return await fn(self, *args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                duration.observe(perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def _index_definition(index: Mapping[str, Any]) -> Tuple[Any, ...]:
+    """Returns what makes up the definition of an index (from `list_indexes()` or `IndexModel.document`)."""
+    return (
+        # The server may return the key directions as floats
+        tuple(
+            (field, int(direction) if isinstance(direction, float) else direction)
+            for field, direction in index['key'].items()
+        ),
+        bool(index.get('unique')),
+        bool(index.get('sparse')),
+        index.get('expireAfterSeconds'),
+        index.get('partialFilterExpression'),
+    )
+
+
+def _filter_ids(filter: Any) -> Optional[List[Any]]:
+    """Returns the ids a write filter is restricted to, None if it may match any document."""
+    if not isinstance(filter, Mapping) or '_id' not in filter:
+        return None
+    id_filter = filter['_id']
+    if not isinstance(id_filter, Mapping):
+        return [id_filter]
+    if set(id_filter.keys()) == {'$in'}:
+        return list(id_filter['$in'])
+    return None
+
 
 class ModelCollection(Generic[TModel]):
-    def __init__(self, collection_model: Type[TModel]):
+    def __init__(self, collection_model: Type[TModel], read_only: bool = False):
         from depot_server.db import connection
 
         self.collection_model = collection_model
-        assert connection.async_db is not None, "Database not initialized"
-        self.collection: AsyncIOMotorCollection = connection.async_db[collection_model.__collection_name__]
+        db = connection.async_read_only_db if read_only else connection.async_db
+        assert db is not None, "Database not initialized"
+        self.collection: AsyncIOMotorCollection = db[collection_model.__collection_name__]
+        # Same collection with the read preference of read-only endpoints (`mongo.read_only_reads`), which may read
+        # stale data from secondaries. Writes and conflict checks must use the collection itself.
+        self.read_only: ModelCollection[TModel] = self if read_only else ModelCollection(collection_model, True)
+        self._metrics = {
+            operation: (
+                mongo_operation_duration.labels(self.collection.name, operation),
+                mongo_operation_errors.labels(self.collection.name, operation),
+            )
+            for operation in _operations
+        }
 
-    async def create_indexes(self):
-        idx = getattr(self.collection_model, '__indexes__', None)
-        if idx:
-            try:
-                created_indexes = await self.collection.create_indexes(idx)
-                if created_indexes:
-                    print(f"Created indexes {created_indexes} for {self.collection.name}")
-            except OperationFailure:
-                await self.collection.drop_indexes()
-                created_indexes = await self.collection.create_indexes(idx)
-                if created_indexes:
-                    print(f"Recreated indexes {created_indexes} for {self.collection.name}")
+    async def _invalidate(self, ids: Optional[List[Any]]):
+        """Evicts the written documents from the caches of all workers (see `InvalidationBus`)."""
+        if invalidation_bus.subscribed(self.collection.name):
+            await invalidation_bus.publish(self.collection.name, ids)
+
+    async def _timed_cursor(self, operation: str, cursor) -> AsyncIterable[dict]:
+        # Only the time spent waiting for the cursor counts, not the time spent by the consumer
+        duration, errors = self._metrics[operation]
+        elapsed = 0.0
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    data = await cursor.__anext__()
+                except StopAsyncIteration:
+                    elapsed += perf_counter() - start
+                    break
+                except Exception:
+                    elapsed += perf_counter() - start
+                    errors.inc()
+                    raise
+                elapsed += perf_counter() - start
+                yield data
+        finally:
+            duration.observe(elapsed)
 
+    async def reconcile_indexes(self) -> Dict[str, List[str]]:
+        """
+        Brings the indexes of the collection in line with `__indexes__` of the model by diffing them against
+        `list_indexes()`: Only indexes which are missing or whose definition changed are (re)created and indexes which
+        are no longer defined are dropped. Returns the names of the created and dropped indexes.
+        """
+        desired = {
+            index.document['name']: index for index in getattr(self.collection_model, '__indexes__', None) or []
+        }
+        existing = {
+            index['name']: index async for index in self.collection.list_indexes() if index['name'] != '_id_'
+        }
+        dropped = [
+            name for name, index in existing.items()
+            if name not in desired or _index_definition(index) != _index_definition(desired[name].document)
+        ]
+        created = [name for name in desired if name not in existing or name in dropped]
+        for name in dropped:
+            await self.collection.drop_index(name)
+        if dropped:
+            print(f"Dropped indexes {dropped} for {self.collection.name}")
+        if created:
+            await self.collection.create_indexes([desired[name] for name in created])
+            print(f"Created indexes {created} for {self.collection.name}")
+        return {'created': created, 'dropped': dropped}
+
+    @_timed('insert_one')
     async def insert_one(
             self, document: TModel, **kwargs
     ) -> None:
         await self.collection.insert_one(document.document(), **kwargs)
+        await self._invalidate([document.document_id()])
 
+    @_timed('insert_many')
     async def insert_many(
             self, documents: Iterable[TModel], **kwargs
     ) -> None:
-        await self.collection.insert_one((document.document() for document in documents), **kwargs)
+        documents = list(documents)
+        await self.collection.insert_many([document.document() for document in documents], **kwargs)
+        await self._invalidate([document.document_id() for document in documents])
 
     async def find(
-            self, filter: Any, skip: int = None, limit: int = None, sort: List[Tuple[str, int]] = None, **kwargs
+            self, filter: Any, skip: int = None, limit: int = None, sort: List[Tuple[str, int]] = None,
+            fields: Optional[Collection[str]] = None, **kwargs
     ) -> AsyncIterable[TModel]:
+        """
+        Finds documents. If `fields` (field names) is given, only these fields are fetched and the results are partial
+        models (see `BaseDocument.partial`).
+        """
         if skip is not None and skip != 0:
             kwargs['skip'] = skip
         if limit is not None and limit != 0:
             kwargs['limit'] = limit
-        async for data in self.collection.find(filter, sort=sort, **kwargs):
-            yield self.collection_model.validate_document(data)
+        model = self.collection_model
+        if fields is not None:
+            kwargs['projection'] = model.projection(fields)
+            model = model.partial(fields)
+        async for data in self._timed_cursor('find', self.collection.find(filter, sort=sort, **kwargs)):
+            yield model.validate_document(data)
 
+    @_timed('find_one')
     async def find_one(
-            self, filter: Any, **kwargs
+            self, filter: Any, fields: Collection[str] = None, **kwargs
     ) -> Optional[TModel]:
+        model = self.collection_model
+        if fields is not None:
+            kwargs['projection'] = model.projection(fields)
+            model = model.partial(fields)
         data = await self.collection.find_one(filter, **kwargs)
         if data is None:
             return None
-        return self.collection_model.validate_document(data)
+        return model.validate_document(data)
 
+    @_timed('replace_one')
     async def replace_one(
             self, replacement: TModel, **kwargs
     ) -> bool:
@@ -64,30 +190,76 @@ class ModelCollection(Generic[TModel]):
         id = doc['_id']
         del doc['_id']
         res = await self.collection.replace_one({'_id': id}, doc, **kwargs)
+        if res.matched_count == 1 or res.upserted_id is not None:
+            await self._invalidate([id])
         return res.matched_count == 1
 
+    @_timed('update_one')
     async def update_one(
             self, filter: Any, update: Any, **kwargs
     ) -> bool:
         res = await self.collection.update_one(filter, update, **kwargs)
+        if res.matched_count == 1 or res.upserted_id is not None:
+            await self._invalidate(_filter_ids(filter))
         return res.matched_count == 1
 
+    @_timed('find_one_and_update')
+    async def find_one_and_update(
+            self, filter: Any, update: Any, return_document: bool = ReturnDocument.AFTER, **kwargs
+    ) -> Optional[TModel]:
+        data = await self.collection.find_one_and_update(filter, update, return_document=return_document, **kwargs)
+        if data is None:
+            return None
+        await self._invalidate([data['_id']])
+        return self.collection_model.validate_document(data)
+
+    @_timed('update_many')
     async def update_many(
             self, filter: Any, update: Any, **kwargs
     ) -> None:
         await self.collection.update_many(filter, update, **kwargs)
+        await self._invalidate(_filter_ids(filter))
 
+    @_timed('delete_one')
     async def delete_one(
             self, filter: Any, **kwargs
     ) -> bool:
         res = await self.collection.delete_one(filter, **kwargs)
+        if res.deleted_count == 1:
+            await self._invalidate(_filter_ids(filter))
         return res.deleted_count == 1
 
+    @_timed('find_one_and_delete')
+    async def find_one_and_delete(
+            self, filter: Any, **kwargs
+    ) -> Optional[TModel]:
+        data = await self.collection.find_one_and_delete(filter, **kwargs)
+        if data is None:
+            return None
+        await self._invalidate([data['_id']])
+        return self.collection_model.validate_document(data)
+
+    @_timed('delete_many')
     async def delete_many(
             self, filter: Any, **kwargs
     ) -> None:
         await self.collection.delete_many(filter, **kwargs)
+        await self._invalidate(_filter_ids(filter))
+
+    @_timed('bulk_write')
+    async def bulk_write(
+            self, requests: List[Any], **kwargs
+    ) -> None:
+        if requests:
+            await self.collection.bulk_write(requests, **kwargs)
+            await self._invalidate(None)
+
+    def aggregate(
+            self, pipeline: List[dict], **kwargs
+    ) -> AsyncIterable[dict]:
+        return self._timed_cursor('aggregate', self.collection.aggregate(pipeline, **kwargs))
 
+    @_timed('count_documents')
     async def count_documents(
             self, filter: Any, **kwargs
     ) -> int:
@@ -1,11 +1,15 @@
 import asyncio
-from typing import cast
+import traceback
+from typing import cast, Dict, List, Optional
 
 from motor.motor_asyncio import AsyncIOMotorGridFSBucket
 
 from .collection import ModelCollection
 from .connection import async_gridfs, startup as connection_startup, shutdown as connection_shutdown
-from .model import DbBay, DbItem, DbItemState, DbReservation, DbReportElement, DbReportProfile
+from .invalidation import startup as invalidation_startup, shutdown as invalidation_shutdown
+from .model import DbBay, DbItem, DbItemState, DbReservation, DbReportElement, DbReportProfile, DbMailOutbox, \
+    DbScheduledJob, DbItemUtilization, DbCascadeJob, DbGroupLock
+from depot_server.model import IndexBuildState, IndexStatus
 
 bay_collection: ModelCollection[DbBay]
 item_collection: ModelCollection[DbItem]
@@ -13,14 +17,50 @@ item_state_collection: ModelCollection[DbItemState]
 report_element_collection: ModelCollection[DbReportElement]
 report_profile_collection: ModelCollection[DbReportProfile]
 reservation_collection: ModelCollection[DbReservation]
+mail_outbox_collection: ModelCollection[DbMailOutbox]
+scheduled_job_collection: ModelCollection[DbScheduledJob]
+item_utilization_collection: ModelCollection[DbItemUtilization]
+cascade_job_collection: ModelCollection[DbCascadeJob]
+group_lock_collection: ModelCollection[DbGroupLock]
 item_picture_collection: AsyncIOMotorGridFSBucket
+item_picture_read_only_collection: AsyncIOMotorGridFSBucket
+
+# Index reconciliation state by collection name, see `reconcile_indexes`
+index_status: Dict[str, IndexStatus] = {}
+_index_task: Optional[asyncio.Task] = None
+
+
+async def reconcile_indexes(collections: List[ModelCollection]):
+    """Reconciles the indexes of the collections one after the other, tracking the state in `index_status`."""
+    for collection in collections:
+        status = index_status[collection.collection.name]
+        status.state = IndexBuildState.Building
+        try:
+            changes = await collection.reconcile_indexes()
+        except Exception as e:
+            traceback.print_exc()
+            status.state = IndexBuildState.Failed
+            status.error = repr(e)
+        else:
+            status.state = IndexBuildState.Ready
+            status.created = changes['created']
+            status.dropped = changes['dropped']
+
+
+async def wait_for_indexes():
+    """Waits until the index reconciliation started by `startup` is done."""
+    if _index_task is not None:
+        await asyncio.shield(_index_task)
 
 
 async def startup():
     global bay_collection, item_collection, item_state_collection, report_element_collection, \
-        report_profile_collection, reservation_collection, item_picture_collection
+        report_profile_collection, reservation_collection, mail_outbox_collection, scheduled_job_collection, \
+        item_utilization_collection, cascade_job_collection, group_lock_collection, item_picture_collection, \
+        item_picture_read_only_collection, _index_task
 
     await connection_startup()
+    await invalidation_startup()
 
     bay_collection = ModelCollection(DbBay)
     item_collection = ModelCollection(DbItem)
@@ -28,27 +68,54 @@ async def startup():
     report_element_collection = ModelCollection(DbReportElement)
     report_profile_collection = ModelCollection(DbReportProfile)
     reservation_collection = ModelCollection(DbReservation)
+    mail_outbox_collection = ModelCollection(DbMailOutbox)
+    scheduled_job_collection = ModelCollection(DbScheduledJob)
+    item_utilization_collection = ModelCollection(DbItemUtilization)
+    cascade_job_collection = ModelCollection(DbCascadeJob)
+    group_lock_collection = ModelCollection(DbGroupLock)
     item_picture_collection = async_gridfs('item_picture')
-    await asyncio.gather(
-        *[
-            collection.create_indexes()
-            for collection in [
-                bay_collection, item_collection, item_state_collection, report_element_collection,
-                report_profile_collection, reservation_collection
-            ]
-        ]
-    )
+    item_picture_read_only_collection = async_gridfs('item_picture', read_only=True)
+    # Index builds can take long on large collections, they run in the background (see /readyz)
+    model_collections = [
+        bay_collection, item_collection, item_state_collection, report_element_collection,
+        report_profile_collection, reservation_collection, mail_outbox_collection, scheduled_job_collection,
+        item_utilization_collection, cascade_job_collection, group_lock_collection,
+    ]
+    index_status.clear()
+    for collection in model_collections:
+        index_status[collection.collection.name] = IndexStatus(
+            collection=collection.collection.name, state=IndexBuildState.Pending
+        )
+    _index_task = asyncio.create_task(reconcile_indexes(model_collections))
 
 
 async def shutdown():
+    global _index_task
+    if _index_task is not None:
+        _index_task.cancel()
+        try:
+            await _index_task
+        except asyncio.CancelledError:
+            pass
+        _index_task = None
+
+    await invalidation_shutdown()
     await connection_shutdown()
 
     global bay_collection, item_collection, item_state_collection, report_element_collection, \
-        report_profile_collection, reservation_collection, item_picture_collection
+        report_profile_collection, reservation_collection, mail_outbox_collection, scheduled_job_collection, \
+        item_utilization_collection, cascade_job_collection, group_lock_collection, item_picture_collection, \
+        item_picture_read_only_collection
     bay_collection = cast(ModelCollection, None)
     item_collection = cast(ModelCollection, None)
     item_state_collection = cast(ModelCollection, None)
     report_element_collection = cast(ModelCollection, None)
     report_profile_collection = cast(ModelCollection, None)
     reservation_collection = cast(ModelCollection, None)
+    mail_outbox_collection = cast(ModelCollection, None)
+    scheduled_job_collection = cast(ModelCollection, None)
+    item_utilization_collection = cast(ModelCollection, None)
+    cascade_job_collection = cast(ModelCollection, None)
+    group_lock_collection = cast(ModelCollection, None)
     item_picture_collection = cast(AsyncIOMotorGridFSBucket, None)
+    item_picture_read_only_collection = cast(AsyncIOMotorGridFSBucket, None)
@@ -1,25 +1,82 @@
-from typing import Optional
+from typing import Optional, Dict, Any
 
 import motor.motor_asyncio
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
 
 from depot_server.config import config
+from depot_server.config.config import MongoReadConfig
+from depot_server.db.monitoring import command_monitor
 
 async_client: Optional[motor.motor_asyncio.AsyncIOMotorClient] = None
 async_db: Optional[motor.motor_asyncio.AsyncIOMotorCollection] = None
+# Same database, with the read preference and read concern for read-only endpoints
+async_read_only_db: Optional[motor.motor_asyncio.AsyncIOMotorCollection] = None
+
+_read_preferences = {
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+
+def _read_preference(read_config: MongoReadConfig) -> Any:
+    if read_config.read_preference == 'primary':
+        if read_config.max_staleness is not None:
+            raise ValueError("max_staleness cannot be used with read preference primary")
+        return Primary()
+    if read_config.read_preference not in _read_preferences:
+        raise ValueError(f"Invalid read preference {read_config.read_preference}")
+    return _read_preferences[read_config.read_preference](
+        max_staleness=-1 if read_config.max_staleness is None else int(read_config.max_staleness)
+    )
+
+
+def _read_options(read_config: MongoReadConfig) -> Dict[str, Any]:
+    return {
+        'read_preference': _read_preference(read_config),
+        'read_concern': ReadConcern(read_config.read_concern),
+    }
+
+
+def _client_options() -> Dict[str, Any]:
+    mongo_config = config.mongo
+    options: Dict[str, Any] = {
+        'maxPoolSize': mongo_config.max_pool_size,
+        'minPoolSize': mongo_config.min_pool_size,
+    }
+    # The driver takes milliseconds
+    for option, seconds in (
+            ('maxIdleTimeMS', mongo_config.max_idle_time),
+            ('waitQueueTimeoutMS', mongo_config.wait_queue_timeout),
+            ('connectTimeoutMS', mongo_config.connect_timeout),
+            ('socketTimeoutMS', mongo_config.socket_timeout),
+            ('serverSelectionTimeoutMS', mongo_config.server_selection_timeout),
+    ):
+        options[option] = None if seconds is None else int(seconds * 1000)
+    if mongo_config.compressors:
+        options['compressors'] = ','.join(mongo_config.compressors)
+    return {key: value for key, value in options.items() if value is not None}
 
 
 async def startup():
-    global async_client, async_db
+    global async_client, async_db, async_read_only_db
 
     assert async_client is None, "Already initialized"
     assert async_db is None, "Already initialized"
 
-    async_client = motor.motor_asyncio.AsyncIOMotorClient(config.mongo.uri)
-    async_db = async_client.get_database()
+    command_monitor.startup()
+    async_client = motor.motor_asyncio.AsyncIOMotorClient(
+        config.mongo.uri, event_listeners=[command_monitor], **_client_options()
+    )
+    default_db = async_client.get_database()
+    async_db = default_db.with_options(**_read_options(config.mongo.default_reads))
+    async_read_only_db = default_db.with_options(**_read_options(config.mongo.read_only_reads))
 
 
 async def shutdown():
-    global async_client, async_db
+    global async_client, async_db, async_read_only_db
 
     assert async_client is not None, "Was not initialized"
     assert async_db is not None, "Was not initialized"
@@ -27,7 +84,11 @@ async def shutdown():
     async_client.close()
     async_client = None
     async_db = None
+    async_read_only_db = None
+    command_monitor.shutdown()
 
 
-def async_gridfs(bucket_name: str):
-    return motor.motor_asyncio.AsyncIOMotorGridFSBucket(async_db, bucket_name=bucket_name, disable_md5=True)
+def async_gridfs(bucket_name: str, read_only: bool = False):
+    return motor.motor_asyncio.AsyncIOMotorGridFSBucket(
+        async_read_only_db if read_only else async_db, bucket_name=bucket_name, disable_md5=True
+    )
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import socket
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+from uuid import uuid4
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+from depot_server.config import config
+from depot_server.db import connection
+
+# Called with the ids of the changed documents, or None if any document of the collection may have changed
+InvalidationCallback = Callable[[Optional[List[Any]]], None]
+
+# Invalidations of more documents evict the whole collection, to keep the messages small
+_max_ids = 1000
+
+
+class InvalidationBackend:
+    """Transports invalidations between the workers."""
+
+    async def startup(self, bus: 'InvalidationBus'):
+        pass
+
+    async def shutdown(self, bus: 'InvalidationBus'):
+        pass
+
+    async def publish(self, origin: str, collection_name: str, ids: Optional[List[Any]]):
+        raise NotImplementedError()
+
+
+class MemoryInvalidationBackend(InvalidationBackend):
+    """
+    Delivers invalidations to the buses of this process which use the same backend instance. With a single bus, only
+    the local caches are invalidated. Tests can start several buses on one backend to act as several workers.
+    """
+
+    def __init__(self):
+        self._buses: List['InvalidationBus'] = []
+
+    async def startup(self, bus: 'InvalidationBus'):
+        self._buses.append(bus)
+
+    async def shutdown(self, bus: 'InvalidationBus'):
+        self._buses.remove(bus)
+
+    async def publish(self, origin: str, collection_name: str, ids: Optional[List[Any]]):
+        for bus in self._buses:
+            if bus.worker_id != origin:
+                bus.evict(collection_name, ids)
+
+
+class MongoInvalidationBackend(InvalidationBackend):
+    """
+    Inserts the invalidations into the capped collection `invalidation`, which every worker follows with a tailable
+    cursor.
+
+    When the cursor is (re)started, the collection is read from the start. Evicting more than needed is harmless, so
+    this avoids tracking a position. If the cursor failed or was overtaken by the capped collection, invalidations may
+    have been lost and all caches are cleared.
+    """
+
+    collection_name = 'invalidation'
+
+    def __init__(self):
+        self._collection: Optional[Any] = None
+        self._tail_task: Optional[asyncio.Task] = None
+
+    async def startup(self, bus: 'InvalidationBus'):
+        assert connection.async_db is not None
+        if not await connection.async_db.list_collection_names(filter={'name': self.collection_name}):
+            try:
+                await connection.async_db.create_collection(
+                    self.collection_name, capped=True, size=config.invalidation.collection_size
+                )
+            except CollectionInvalid:
+                # Created by another worker in the meantime
+                pass
+        self._collection = connection.async_db[self.collection_name]
+        self._tail_task = asyncio.create_task(self._tail(bus))
+
+    async def shutdown(self, bus: 'InvalidationBus'):
+        if self._tail_task is not None:
+            self._tail_task.cancel()
+            await asyncio.gather(self._tail_task, return_exceptions=True)
+            self._tail_task = None
+        self._collection = None
+
+    async def _tail(self, bus: 'InvalidationBus'):
+        assert self._collection is not None
+        may_have_missed = False
+        while True:
+            if may_have_missed:
+                bus.evict_all()
+            received = False
+            try:
+                cursor = self._collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    # Ends when no message arrived within the await time of the server
+                    async for message in cursor:
+                        received = True
+                        if message['origin'] != bus.worker_id:
+                            bus.evict(message['collection'], message.get('ids'))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+                received = True
+            # The cursor dies immediately on an empty collection, nothing was missed then
+            may_have_missed = received
+            await asyncio.sleep(config.invalidation.retry_interval)
+
+    async def publish(self, origin: str, collection_name: str, ids: Optional[List[Any]]):
+        assert self._collection is not None
+        await self._collection.insert_one({'collection': collection_name, 'ids': ids, 'origin': origin})
+
+
+class InvalidationBus:
+    """
+    Evicts entries of in-process caches on all workers when the documents they hold change.
+
+    Caches `subscribe` to a collection. The write methods of `ModelCollection` `publish` the ids of the changed
+    documents (or None if they are not known from the filter), which evicts them locally and, through the backend, on
+    the other workers. Collections without subscribers publish nothing, as every worker subscribes the same caches.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[InvalidationCallback]] = {}
+        self.backend: Optional[InvalidationBackend] = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+    def subscribe(self, collection_name: str, callback: InvalidationCallback):
+        self._subscribers.setdefault(collection_name, []).append(callback)
+
+    def subscribed(self, collection_name: str) -> bool:
+        return collection_name in self._subscribers
+
+    def evict(self, collection_name: str, ids: Optional[List[Any]]):
+        for callback in self._subscribers.get(collection_name, ()):
+            try:
+                callback(ids)
+            except Exception:
+                traceback.print_exc()
+
+    def evict_all(self):
+        for collection_name in self._subscribers:
+            self.evict(collection_name, None)
+
+    async def publish(self, collection_name: str, ids: Optional[List[Any]]):
+        if collection_name not in self._subscribers:
+            return
+        if ids is not None and len(ids) > _max_ids:
+            ids = None
+        self.evict(collection_name, ids)
+        if self.backend is None:
+            return
+        try:
+            await self.backend.publish(self.worker_id, collection_name, ids)
+        except Exception:
+            # The write itself succeeded, other workers may serve stale entries until their cursor restarts
+            traceback.print_exc()
+
+    async def startup(self, backend: InvalidationBackend = None):
+        assert self.backend is None, "Already initialized"
+        # Anything may have changed while not running
+        self.evict_all()
+        source = config.invalidation.backend
+        if backend is None:
+            backend = MemoryInvalidationBackend() if source == 'memory' else MongoInvalidationBackend()
+        try:
+            await backend.startup(self)
+        except Exception as e:
+            if source != 'auto':
+                raise
+            print(f"Cannot use a capped collection for invalidations, only invalidating this process: {e!r}")
+            backend = MemoryInvalidationBackend()
+            await backend.startup(self)
+        self.backend = backend
+
+    async def shutdown(self):
+        if self.backend is not None:
+            await self.backend.shutdown(self)
+            self.backend = None
+
+
+invalidation_bus = InvalidationBus()
+
+
+async def startup():
+    await invalidation_bus.startup()
+
+
+async def shutdown():
+    await invalidation_bus.shutdown()
@@ -5,3 +5,8 @@ from .item_state import DbItemState, DbItemStateChanges, DbStrChange, DbItemCond
 from .reservation import DbReservation
 from .report_profile import DbReportProfile
 from .report_element import DbReportElement
+from .mail_outbox import DbMailOutbox
+from .scheduled_job import DbScheduledJob
+from .item_utilization import DbItemUtilization
+from .cascade_job import DbCascadeJob
+from .group_lock import DbGroupLock
@@ -1,9 +1,9 @@
 from datetime import datetime, date
 from enum import Enum
-from typing import List, Any, Sequence, Mapping, TypeVar, Type, get_origin, Union
+from typing import List, Any, Sequence, Mapping, TypeVar, Type, get_origin, Union, Dict, Tuple, FrozenSet, Collection
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, create_model
 from pymongo import IndexModel
 
 
@@ -57,13 +57,46 @@ class BaseSubDocument(BaseModel):
         validate_assignment = True
 
 
+_partial_models: Dict[Tuple[type, FrozenSet[str]], type] = {}
+
+
 class BaseDocument(BaseSubDocument):
     __indexes__: List[IndexModel] = []
     __collection_name__: str
 
+    @classmethod
+    def partial(cls: Type[TDocument], fields: Collection[str]) -> Type[TDocument]:
+        """
+        Returns a model with only the given fields (all optional) for documents read with a projection. The models are
+        cached, so validation stays as cheap as for the full model.
+        """
+        key = (cls, frozenset(fields))
+        model = _partial_models.get(key)
+        if model is None:
+            field_definitions: Dict[str, Any] = {
+                name: (cls.__fields__[name].outer_type_, Field(None, alias=cls.__fields__[name].alias))
+                for name in key[1]
+            }
+            model = create_model(f'{cls.__name__}Partial', __base__=BaseDocument, **field_definitions)
+            setattr(model, '__collection_name__', getattr(cls, '__collection_name__'))
+            _partial_models[key] = model
+        return model
+
+    @classmethod
+    def projection(cls, fields: Collection[str]) -> Dict[str, int]:
+        """Returns the mongo projection for the given field names."""
+        projection = {cls.__fields__[name].alias: 1 for name in fields}
+        if '_id' not in projection:
+            projection['_id'] = 0
+        return projection
+
     def document(self):
         return _safe_document(self.dict(exclude_none=True, by_alias=True))
 
+    def document_id(self) -> Any:
+        """Returns the `_id`, which every collection model declares as `id`."""
+        return getattr(self, 'id')
+
     @classmethod
     def validate_override(cls: Type[TDocument], data: Union[dict, BaseModel], **overrides) -> TDocument:
         if isinstance(data, BaseModel):
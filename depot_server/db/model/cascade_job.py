@@ -0,0 +1,37 @@
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from pydantic import Field
+from pymongo import IndexModel, ASCENDING
+
+from depot_server.db.model.base import BaseDocument
+from depot_server.model import CascadeKind, CascadeJobState
+
+
+class DbCascadeJob(BaseDocument):
+    __collection_name__ = 'cascadeJob'
+    __indexes__ = [
+        IndexModel([('state', ASCENDING), ('created', ASCENDING)]),
+        IndexModel([('state', ASCENDING), ('lease_until', ASCENDING)]),
+        # Finished jobs are kept for 30 days
+        IndexModel([('finished_at', ASCENDING)], expireAfterSeconds=30 * 24 * 60 * 60),
+    ]
+
+    id: UUID = Field(..., alias='_id')
+    kind: CascadeKind = Field(...)
+    target_id: UUID = Field(...)
+
+    state: CascadeJobState = CascadeJobState.Pending
+    # Resume position: index of the cascade step and last processed document id of the step
+    step: int = 0
+    last_id: Optional[UUID] = None
+    processed: int = 0
+
+    created: datetime = Field(...)
+    finished_at: Optional[datetime] = None
+
+    lease_owner: Optional[str] = None
+    lease_until: Optional[datetime] = None
+    attempts: int = 0
+    last_error: Optional[str] = None
@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from pydantic import Field
+from pymongo import IndexModel, ASCENDING
+
+from depot_server.db.model.base import BaseDocument
+
+
+class DbGroupLock(BaseDocument):
+    """Held while items of a group are allocated, see helper.group_allocation."""
+    __collection_name__ = 'groupLock'
+    __indexes__ = [
+        # Removes locks of crashed workers, an expired lock can also be taken over before
+        IndexModel([('lease_until', ASCENDING)], expireAfterSeconds=0),
+    ]
+
+    # Group id of the items
+    id: str = Field(..., alias='_id')
+
+    lease_owner: str = Field(...)
+    lease_until: datetime = Field(...)
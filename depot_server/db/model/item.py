@@ -10,7 +10,15 @@ from depot_server.model import ItemCondition, TotalReportState
 
 class DbItem(BaseDocument):
     __collection_name__ = 'item'
-    __indexes__ = [IndexModel([('external_id', ASCENDING)])]
+    __indexes__ = [
+        IndexModel([('external_id', ASCENDING)]),
+        IndexModel([('current_reservation_id', ASCENDING), ('next_reservation_start', ASCENDING)]),
+        # For the cascades of deleted bays and report profiles, which go through the items by id
+        IndexModel([('bay_id', ASCENDING), ('_id', ASCENDING)]),
+        IndexModel([('report_profile_id', ASCENDING), ('_id', ASCENDING)]),
+        # Items of a group for group reservations
+        IndexModel([('group_id', ASCENDING), ('condition', ASCENDING)]),
+    ]
 
     id: UUID = Field(..., alias='_id')
     external_id: Optional[str] = None
@@ -40,3 +48,8 @@ class DbItem(BaseDocument):
     tags: List[str] = []
 
     bay_id: Optional[UUID] = None
+
+    # Denormalized from the reservations, see helper.item_reservation_status
+    current_reservation_id: Optional[UUID] = None
+    next_reservation_start: Optional[date] = None
+    available_until: Optional[date] = None
@@ -74,6 +74,8 @@ class DbItemState(BaseDocument):
     __collection_name__ = 'item_state'
     __indexes__ = [
         IndexModel([('item_id', ASCENDING), ('timestamp', DESCENDING)]),
+        # For the cascade of deleted report elements
+        IndexModel([('report.report_element_id', ASCENDING), ('_id', ASCENDING)]),
     ]
 
     id: UUID = Field(..., alias='_id')
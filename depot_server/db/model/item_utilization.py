@@ -0,0 +1,27 @@
+from datetime import date, datetime
+from typing import List, Optional
+from uuid import UUID
+
+from pydantic import Field
+from pymongo import IndexModel, ASCENDING
+
+from depot_server.db.model.base import BaseDocument
+
+
+class DbItemUtilization(BaseDocument):
+    """Reserved days of an item in one month."""
+    __collection_name__ = 'itemUtilization'
+    __indexes__ = [
+        IndexModel([('month', ASCENDING), ('item_id', ASCENDING)]),
+        IndexModel([('updated_at', ASCENDING)]),
+    ]
+
+    # "<item_id>/<month>"
+    id: str = Field(..., alias='_id')
+    item_id: UUID = Field(...)
+    # First day of the month
+    month: date = Field(...)
+    # Reserved days as ordinals
+    days: List[int] = Field(...)
+    # Last incremental update or rebuild, rollups which were not touched by a rebuild run are stale
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+from uuid import UUID
+
+from pydantic import Field
+from pymongo import IndexModel, ASCENDING
+
+from depot_server.db.model.base import BaseDocument
+from depot_server.model import MailOutboxState
+
+
+class DbMailOutbox(BaseDocument):
+    __collection_name__ = 'mailOutbox'
+    __indexes__ = [
+        IndexModel([('state', ASCENDING), ('next_attempt', ASCENDING)]),
+        IndexModel([('state', ASCENDING), ('lease_until', ASCENDING)]),
+        # Sent mails are kept for 30 days
+        IndexModel([('sent_at', ASCENDING)], expireAfterSeconds=30 * 24 * 60 * 60),
+    ]
+
+    id: UUID = Field(..., alias='_id')
+    # Notification which is resolved to the mails by the outbox worker
+    name: str = Field(...)
+    # Ids and small values the mails are built from
+    params: Dict[str, Any] = Field(...)
+
+    state: MailOutboxState = MailOutboxState.Pending
+    attempts: int = 0
+    created: datetime = Field(...)
+    next_attempt: datetime = Field(...)
+
+    lease_owner: Optional[str] = None
+    lease_until: Optional[datetime] = None
+
+    # Recipients which already received the mail, they are skipped on retries
+    sent_to: List[str] = []
+    sent_at: Optional[datetime] = None
+    last_error: Optional[str] = None
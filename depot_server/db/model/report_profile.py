@@ -9,7 +9,10 @@ from depot_server.db.model.base import BaseDocument
 
 class DbReportProfile(BaseDocument):
     __collection_name__ = 'reportProfile'
-    __indexes__ = []
+    __indexes__ = [
+        # For the cascade of deleted report elements
+        IndexModel([('elements', ASCENDING), ('_id', ASCENDING)]),
+    ]
 
     id: UUID = Field(..., alias='_id')
     name: str = Field(...)
@@ -16,6 +16,8 @@ class DbReservation(BaseDocument):
         IndexModel([('items', ASCENDING), ('end', ASCENDING), ('start', ASCENDING)]),
         IndexModel([('user_id', ASCENDING), ('end', ASCENDING), ('start', ASCENDING)]),
         IndexModel([('user_id', ASCENDING), ('items', ASCENDING), ('end', ASCENDING), ('start', ASCENDING)]),
+        IndexModel([('returned', ASCENDING), ('end', ASCENDING)]),
+        IndexModel([('series_id', ASCENDING), ('start', ASCENDING)], sparse=True),
     ]
 
     id: UUID = Field(..., alias='_id')
@@ -33,3 +35,5 @@ class DbReservation(BaseDocument):
     items: List[UUID] = Field(...)
 
     returned: bool = Field(False)
+
+    series_id: Optional[UUID] = None
@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import Field
+
+from depot_server.db.model.base import BaseDocument
+
+
+class DbScheduledJob(BaseDocument):
+    __collection_name__ = 'scheduledJob'
+    __indexes__ = []
+
+    # Name of the job
+    id: str = Field(..., alias='_id')
+
+    # Last scheduled time which was run
+    completed_slot: datetime = Field(...)
+
+    lease_owner: Optional[str] = None
+    lease_until: Optional[datetime] = None
+
+    last_run_start: Optional[datetime] = None
+    last_run_duration: Optional[float] = None
+    last_run_error: Optional[str] = None
+    last_run_result: Optional[dict] = None
+
+    # Failed runs since the last completed slot, retried after `retry_after`
+    failed_attempts: int = 0
+    retry_after: Optional[datetime] = None
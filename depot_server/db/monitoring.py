@@ -0,0 +1,173 @@
+import asyncio
+import json
+import traceback
+from contextvars import ContextVar
+from typing import Any, Dict, Mapping, Optional, Set, Tuple
+
+from pymongo import monitoring
+
+from depot_server.config import config
+from depot_server.helper.metrics import registry
+
+# ASGI scope of the request (or `{'job': name}` of the scheduled job) which issues the Mongo commands. Motor runs the
+# commands in its executor with a copy of the context, so the listener sees the value of the awaiting task. The
+# listener only keeps the operation name, not the scope.
+current_operation: ContextVar[Optional[Mapping[str, Any]]] = ContextVar('current_operation', default=None)
+
+mongo_command_duration = registry.histogram(
+    'depot_mongo_command_duration_seconds', "Duration of Mongo commands by originating route or job.",
+    ('command', 'collection', 'operation'),
+)
+mongo_slow_commands = registry.counter(
+    'depot_mongo_slow_commands_total', "Mongo commands slower than mongo.slow_command_threshold.",
+    ('command', 'collection', 'operation'),
+)
+mongo_collscans = registry.counter(
+    'depot_mongo_collscan_total', "Explained slow commands which scan the whole collection.", ('collection',)
+)
+
+_filter_fields = {
+    'find': 'filter',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query',
+}
+_explainable_commands = {'find', 'aggregate', 'count', 'distinct', 'findAndModify', 'update', 'delete'}
+_max_explained_shapes = 1000
+
+
+def operation_name(operation: Optional[Mapping[str, Any]]) -> str:
+    if operation is None:
+        return 'background'
+    if 'job' in operation:
+        return f"job:{operation['job']}"
+    endpoint = operation.get('endpoint')
+    if endpoint is None:
+        return 'unmatched'
+    return endpoint.__name__
+
+
+def filter_shape(value: Any) -> Any:
+    """Replaces all values in the filter by `1`, keeping only the structure (like the Mongo query shape)."""
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) and value and all(isinstance(item, dict) for item in value):
+        return [filter_shape(item) for item in value]
+    return 1
+
+
+def command_filter(command_name: str, command: dict) -> Optional[dict]:
+    if command_name in _filter_fields:
+        return command.get(_filter_fields[command_name])
+    if command_name == 'aggregate':
+        pipeline = command.get('pipeline') or [{}]
+        return pipeline[0].get('$match')
+    if command_name == 'update':
+        return (command.get('updates') or [{}])[0].get('q')
+    if command_name == 'delete':
+        return (command.get('deletes') or [{}])[0].get('q')
+    return None
+
+
+def has_collscan(plan: Any) -> bool:
+    if isinstance(plan, dict):
+        return plan.get('stage') == 'COLLSCAN' or any(has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(has_collscan(value) for value in plan)
+    return False
+
+
+class _StartedCommand:
+    __slots__ = ('command_name', 'collection', 'operation', 'command')
+
+    def __init__(self, command_name: str, collection: str, operation: str, command: dict):
+        self.command_name = command_name
+        self.collection = collection
+        self.operation = operation
+        self.command = command
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """
+    Records the duration of every Mongo command by the route (or job) which issued it. Commands slower than
+    `mongo.slow_command_threshold` are logged with their filter shape and, with `mongo.explain_slow_commands`, explained
+    once per shape to flag collection scans.
+    """
+
+    def __init__(self):
+        self._started: Dict[Tuple[Any, int], _StartedCommand] = {}
+        self._explained: Set[str] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def startup(self):
+        self._loop = asyncio.get_event_loop()
+
+    def shutdown(self):
+        self._loop = None
+        self._started.clear()
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        command = event.command
+        collection = command.get(event.command_name)
+        self._started[event.connection_id, event.request_id] = _StartedCommand(
+            event.command_name,
+            collection if isinstance(collection, str) else '',
+            # The router stored the endpoint in the scope before the endpoint issued the command
+            operation_name(current_operation.get()),
+            command,
+        )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finished(event)
+
+    def _finished(self, event):
+        started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        duration = event.duration_micros / 1e6
+        operation = started.operation
+        mongo_command_duration.labels(started.command_name, started.collection, operation).observe(duration)
+        threshold = config.mongo.slow_command_threshold
+        if threshold is None or duration < threshold or started.command_name == 'explain':
+            return
+        mongo_slow_commands.labels(started.command_name, started.collection, operation).inc()
+        shape = json.dumps(filter_shape(command_filter(started.command_name, started.command)), sort_keys=True)
+        print(
+            f"Slow Mongo command {started.command_name} on {started.collection} from {operation}: "
+            f"{duration * 1000:.1f}ms, filter {shape}"
+        )
+        if config.mongo.explain_slow_commands and started.command_name in _explainable_commands:
+            key = f"{started.collection}:{started.command_name}:{shape}"
+            if key not in self._explained and len(self._explained) < _max_explained_shapes and \
+                    self._loop is not None:
+                self._explained.add(key)
+                # Listeners run in the executor threads, explain from the event loop
+                self._loop.call_soon_threadsafe(self._start_explain, started, shape)
+
+    def _start_explain(self, started: _StartedCommand, shape: str):
+        asyncio.ensure_future(self._explain(started, shape))
+
+    @staticmethod
+    async def _explain(started: _StartedCommand, shape: str):
+        from depot_server.db import connection
+
+        if connection.async_db is None:
+            return
+        command = {
+            key: value for key, value in started.command.items()
+            if not key.startswith('$') and key not in ('lsid', 'txnNumber', 'cursor', 'readConcern')
+        }
+        try:
+            explained = await connection.async_db.command({'explain': command, 'verbosity': 'queryPlanner'})
+        except Exception:
+            traceback.print_exc()
+            return
+        if has_collscan(explained.get('queryPlanner')):
+            mongo_collscans.labels(started.collection).inc()
+            print(f"COLLSCAN for {started.command_name} on {started.collection}, filter {shape}")
+
+
+command_monitor = CommandMonitor()
@@ -1,12 +1,19 @@
+import asyncio
+import traceback
+
 import httpx
 from authlib.integrations.starlette_client import OAuth as _OAuth, StarletteRemoteApp as _StarletteRemoteApp
 from authlib.oidc.core import UserInfo
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from starlette.status import HTTP_403_FORBIDDEN
-from typing import Optional, List
+from time import perf_counter
+from typing import Optional, List, Iterable, Dict, Awaitable, TypeVar
 
 from depot_server.config import config
+from depot_server.helper.metrics import oauth_request_duration, oauth_request_errors
+
+T = TypeVar('T')
 
 
 class StarletteRemoteApp(_StarletteRemoteApp):
@@ -32,22 +39,63 @@ oauth = OAuth()
 oauth.register('server', **config.oauth2.dict())
 
 
+class _OAuthRequestMetrics:
+    def __init__(self, operation: str):
+        self.duration = oauth_request_duration.labels(operation)
+        self.errors = oauth_request_errors.labels(operation)
+
+    async def __call__(self, request: Awaitable[T]) -> T:
+        start = perf_counter()
+        try:
+            return await request
+        except Exception:
+            self.errors.inc()
+            raise
+        finally:
+            self.duration.observe(perf_counter() - start)
+
+
+_profile_request = _OAuthRequestMetrics('profile')
+_profiles_request = _OAuthRequestMetrics('profiles')
+_userinfo_request = _OAuthRequestMetrics('userinfo')
+
+
 async def get_profile(user_id: str) -> dict:
     server_metadata = await oauth.server.load_server_metadata()
     issuer = server_metadata['issuer']
     profile_url = f"{issuer}/profiles/{user_id}"
     async with httpx.AsyncClient(auth=httpx.BasicAuth(config.oauth2.client_id, config.oauth2.client_secret)) as client:
-        r = await client.get(profile_url)
+        r = await _profile_request(client.get(profile_url))
         r.raise_for_status()
     return r.json()
 
 
+async def get_profiles_by_id(user_ids: Iterable[str], max_concurrency: int = 8) -> Dict[str, dict]:
+    """Fetches the profiles of multiple users over one client. Profiles which could not be fetched are skipped."""
+    server_metadata = await oauth.server.load_server_metadata()
+    issuer = server_metadata['issuer']
+    limit = asyncio.Semaphore(max_concurrency)
+    profiles: Dict[str, dict] = {}
+    async with httpx.AsyncClient(auth=httpx.BasicAuth(config.oauth2.client_id, config.oauth2.client_secret)) as client:
+        async def fetch(user_id: str):
+            async with limit:
+                try:
+                    r = await _profile_request(client.get(f"{issuer}/profiles/{user_id}"))
+                    r.raise_for_status()
+                    profiles[user_id] = r.json()
+                except httpx.HTTPError:
+                    traceback.print_exc()
+
+        await asyncio.gather(*[fetch(user_id) for user_id in set(user_ids)])
+    return profiles
+
+
 async def get_profiles() -> List[dict]:
     server_metadata = await oauth.server.load_server_metadata()
     issuer = server_metadata['issuer']
     profiles_url = f"{issuer}/profiles"
     async with httpx.AsyncClient(auth=httpx.BasicAuth(config.oauth2.client_id, config.oauth2.client_secret)) as client:
-        r = await client.get(profiles_url)
+        r = await _profiles_request(client.get(profiles_url))
         r.raise_for_status()
     return r.json()
 
@@ -89,8 +137,8 @@ class Authentication:
                 )
             return None
         if self.require_userinfo:
-            userinfo = await oauth.server.userinfo(
+            userinfo = await _userinfo_request(oauth.server.userinfo(
                 token={'token_type': 'bearer', 'access_token': authorization_code.credentials}
-            )
+            ))
             token_data.update(userinfo)
         return token_data
@@ -0,0 +1,130 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Collection
+from uuid import UUID
+
+from depot_server.db import DbReservation
+from depot_server.db.collection import ModelCollection
+
+# Inclusive range of day ordinals
+Interval = Tuple[int, int]
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sorts the intervals and merges overlapping and adjacent ones."""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+async def busy_intervals(
+        collection: ModelCollection[DbReservation], item_ids: Collection[UUID], start: date, end: date,
+) -> Dict[UUID, List[Interval]]:
+    """
+    Returns the merged reserved day ranges of the items which overlap the (inclusive) day range, read with one range
+    query. Items without reservations in the range are not included.
+    """
+    item_id_set = set(item_ids)
+    intervals: Dict[UUID, List[Interval]] = defaultdict(list)
+    async for reservation in collection.find({
+        'items': {'$in': list(item_ids)},
+        'end': {'$gte': start.toordinal()},
+        'start': {'$lte': end.toordinal()},
+    }, fields={'start', 'end', 'items'}):
+        interval = (reservation.start.toordinal(), reservation.end.toordinal())
+        for item_id in reservation.items:
+            if item_id in item_id_set:
+                intervals[item_id].append(interval)
+    return {item_id: merge_intervals(item_intervals) for item_id, item_intervals in intervals.items()}
+
+
+def free_counts(busy: Dict[UUID, List[Interval]], total: int, start: date, end: date) -> List[Tuple[date, int]]:
+    """
+    Returns the number of free items for each day of the (inclusive) range, given the merged busy intervals of `total`
+    items. Runs in O(intervals + days) with a difference array.
+    """
+    start_ordinal = start.toordinal()
+    days = end.toordinal() - start_ordinal + 1
+    changes = [0] * (days + 1)
+    for intervals in busy.values():
+        for busy_start, busy_end in intervals:
+            first = max(busy_start - start_ordinal, 0)
+            last = min(busy_end - start_ordinal, days - 1)
+            if first <= last:
+                changes[first] += 1
+                changes[last + 1] -= 1
+    counts = []
+    reserved = 0
+    for offset in range(days):
+        reserved += changes[offset]
+        counts.append((start + timedelta(days=offset), total - reserved))
+    return counts
+
+
+def free_gaps(busy: List[Interval], start: int, end: int) -> Iterator[Interval]:
+    """Yields the free day ranges within [start, end] between the merged busy intervals, in order."""
+    cursor = start
+    for busy_start, busy_end in busy:
+        if busy_start > cursor:
+            yield cursor, min(busy_start - 1, end)
+        cursor = max(cursor, busy_end + 1)
+        if cursor > end:
+            return
+    yield cursor, end
+
+
+def free_windows(busy: List[Interval], start: date, end: date, duration: int, limit: int) -> List[Interval]:
+    """
+    Returns the earliest (up to `limit`) free gaps of at least `duration` days within the (inclusive) range, given
+    merged busy intervals.
+    """
+    windows: List[Interval] = []
+    for gap_start, gap_end in free_gaps(busy, start.toordinal(), end.toordinal()):
+        if gap_end - gap_start + 1 >= duration:
+            windows.append((gap_start, gap_end))
+            if len(windows) == limit:
+                break
+    return windows
+
+
+def count_free_windows(
+        busy: Dict[UUID, List[Interval]], item_ids: Iterable[UUID], start: date, end: date, duration: int, count: int,
+        limit: int,
+) -> List[Interval]:
+    """
+    Returns the earliest (up to `limit`) ranges within the (inclusive) range in which at least `count` of the items are
+    free for any `duration` days, given the merged busy intervals per item.
+
+    The free gaps of every item mark the days on which a reservation of `duration` days could start, the marks are
+    summed per day with a difference array. Runs of days with enough items make up the windows.
+    """
+    start_ordinal = start.toordinal()
+    days = end.toordinal() - start_ordinal + 1
+    changes = [0] * (days + 1)
+    for item_id in item_ids:
+        for gap_start, gap_end in free_gaps(busy.get(item_id, []), start_ordinal, end.toordinal()):
+            last_start = gap_end - duration + 1
+            if last_start >= gap_start:
+                changes[gap_start - start_ordinal] += 1
+                changes[last_start - start_ordinal + 1] -= 1
+    windows: List[Interval] = []
+    free = 0
+    run_start: Optional[int] = None
+    for offset in range(days + 1):
+        if offset < days:
+            free += changes[offset]
+        if offset < days and free >= count:
+            if run_start is None:
+                run_start = offset
+        elif run_start is not None:
+            # The last reservation of the run starts the day before
+            windows.append((start_ordinal + run_start, start_ordinal + offset - 1 + duration - 1))
+            run_start = None
+            if len(windows) == limit:
+                break
+    return windows
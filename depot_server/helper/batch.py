@@ -0,0 +1,42 @@
+from typing import List, Tuple, Type, Optional, Collection
+from uuid import UUID
+
+from fastapi import HTTPException
+
+from depot_server.db.collection import ModelCollection, TModel
+from depot_server.helper.fields import parse_fields, partial_dict
+from depot_server.helper.response import FastJSONResponse
+from depot_server.model.base import BaseModel
+
+# Most ids per batch request
+max_batch_ids = 1000
+
+
+async def find_by_ids(
+        collection: ModelCollection[TModel], ids: List[UUID], fields: Optional[Collection[str]] = None
+) -> Tuple[List[TModel], List[UUID]]:
+    """
+    Finds the documents of `ids` with one `$in` query. Returns the found documents in the order of `ids` and the ids
+    which were not found. Duplicate ids are returned once.
+    """
+    if len(ids) > max_batch_ids:
+        raise HTTPException(400, f"At most {max_batch_ids} ids can be requested")
+    unique_ids = list(dict.fromkeys(ids))
+    by_id = {
+        document.document_id(): document
+        async for document in collection.find({'_id': {'$in': unique_ids}}, fields=fields)
+    }
+    return [by_id[id] for id in unique_ids if id in by_id], [id for id in unique_ids if id not in by_id]
+
+
+async def batch_response(
+        collection: ModelCollection, model: Type[BaseModel], ids: List[UUID], fields: Optional[str]
+) -> FastJSONResponse:
+    """Returns the `Batch` of `ids`, optionally with only the `fields` (see `parse_fields`)."""
+    field_names = parse_fields(fields, model)
+    documents, missing = await find_by_ids(collection, ids, field_names)
+    if field_names is not None:
+        results = [partial_dict(document) for document in documents]
+    else:
+        results = [model.validate(document).dict(by_alias=True) for document in documents]
+    return FastJSONResponse({'results': results, 'missing': missing})
@@ -0,0 +1,212 @@
+import asyncio
+import os
+import socket
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Awaitable
+from uuid import UUID, uuid4
+
+from pymongo import ASCENDING
+
+from depot_server.config import config
+from depot_server.db import collections, DbCascadeJob
+from depot_server.db.collection import ModelCollection
+from depot_server.helper.change_feed import change_feed
+from depot_server.helper.util import utc_now
+from depot_server.model import CascadeKind, CascadeJobState
+
+
+@dataclass
+class _CascadeStep:
+    # Returns the collection to update (the collections are only created on startup)
+    collection: Callable[[], ModelCollection]
+    # Filter and update by the id of the deleted document
+    filter: Callable[[UUID], dict]
+    update: Callable[[UUID], dict]
+    # Publishes the change events of the updated documents by their ids and the id of the deleted document
+    publish: Optional[Callable[[List[UUID], UUID], Awaitable[None]]] = None
+
+
+_cascades: Dict[CascadeKind, List[_CascadeStep]] = {
+    CascadeKind.Bay: [
+        _CascadeStep(
+            lambda: collections.item_collection,
+            lambda bay_id: {'bay_id': bay_id},
+            lambda bay_id: {'$unset': {'bay_id': 1}},
+            lambda item_ids, bay_id: change_feed.publish_items(item_ids, prev_bay_id=bay_id),
+        ),
+    ],
+    CascadeKind.ReportProfile: [
+        _CascadeStep(
+            lambda: collections.item_collection,
+            lambda report_profile_id: {'report_profile_id': report_profile_id},
+            lambda report_profile_id: {'$unset': {'report_profile_id': 1}},
+            lambda item_ids, report_profile_id: change_feed.publish_items(item_ids),
+        ),
+    ],
+    CascadeKind.ReportElement: [
+        _CascadeStep(
+            lambda: collections.report_profile_collection,
+            lambda report_element_id: {'elements': report_element_id},
+            lambda report_element_id: {'$pull': {'elements': report_element_id}},
+        ),
+        _CascadeStep(
+            lambda: collections.item_state_collection,
+            lambda report_element_id: {'report.report_element_id': report_element_id},
+            lambda report_element_id: {'$pull': {'report': {'report_element_id': report_element_id}}},
+        ),
+    ],
+}
+
+
+class CascadeJobs:
+    """
+    Durable background jobs in the `cascadeJob` collection, which remove references to deleted bays, report profiles
+    and report elements.
+
+    A job runs the cascade steps of its kind one after the other. Each step updates the referencing documents in
+    batches of `cascade.batch_size` in `_id` order and stores the last processed id with the job, so a job whose
+    worker crashed (the lease expired) is resumed by another worker where it stopped.
+    """
+
+    def __init__(self):
+        self._workers: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def enqueue(self, kind: CascadeKind, target_id: UUID) -> DbCascadeJob:
+        job = DbCascadeJob(id=uuid4(), kind=kind, target_id=target_id, created=utc_now())
+        await collections.cascade_job_collection.insert_one(job)
+        if self._wake is not None:
+            self._wake.set()
+        return job
+
+    async def _claim(self, worker_id: str) -> Optional[DbCascadeJob]:
+        now = utc_now()
+        return await collections.cascade_job_collection.find_one_and_update(
+            {
+                '$or': [
+                    {'state': CascadeJobState.Pending.value},
+                    # Lease of a crashed worker expired
+                    {'state': CascadeJobState.Running.value, 'lease_until': {'$lt': now}},
+                ]
+            },
+            {
+                '$set': {
+                    'state': CascadeJobState.Running.value,
+                    'lease_owner': worker_id,
+                    'lease_until': now + timedelta(seconds=config.cascade.lease_time),
+                },
+                '$inc': {'attempts': 1},
+            },
+            sort=[('created', ASCENDING)],
+        )
+
+    async def _save_progress(self, worker_id: str, job: DbCascadeJob) -> bool:
+        """Stores the resume position and renews the lease. Returns False if the lease was lost."""
+        return await collections.cascade_job_collection.update_one(
+            {'_id': job.id, 'lease_owner': worker_id},
+            {'$set': {
+                'step': job.step,
+                'last_id': job.last_id,
+                'processed': job.processed,
+                'lease_until': utc_now() + timedelta(seconds=config.cascade.lease_time),
+            }},
+        )
+
+    async def _run_steps(self, worker_id: str, job: DbCascadeJob) -> bool:
+        steps = _cascades[job.kind]
+        while job.step < len(steps):
+            step = steps[job.step]
+            collection = step.collection()
+            query = step.filter(job.target_id)
+            if job.last_id is not None:
+                query['_id'] = {'$gt': job.last_id}
+            ids = [
+                document.id
+                async for document in collection.find(
+                    query, sort=[('_id', ASCENDING)], limit=config.cascade.batch_size, fields={'id'}
+                )
+            ]
+            if ids:
+                await collection.update_many(
+                    {'_id': {'$in': ids}, **step.filter(job.target_id)}, step.update(job.target_id)
+                )
+                job.processed += len(ids)
+                if step.publish is not None:
+                    await step.publish(ids, job.target_id)
+            if len(ids) < config.cascade.batch_size:
+                job.step += 1
+                job.last_id = None
+            else:
+                job.last_id = ids[-1]
+            if not await self._save_progress(worker_id, job):
+                return False
+        return True
+
+    async def _process(self, worker_id: str, job: DbCascadeJob):
+        try:
+            if not await self._run_steps(worker_id, job):
+                print(f"Lost the lease of cascade job {job.id}")
+                return
+        except Exception as e:
+            traceback.print_exc()
+            update: dict = {'lease_owner': None, 'lease_until': None, 'last_error': repr(e)}
+            if job.attempts >= config.cascade.max_attempts:
+                update['state'] = CascadeJobState.Failed.value
+                update['finished_at'] = utc_now()
+            else:
+                update['state'] = CascadeJobState.Pending.value
+        else:
+            update = {
+                'state': CascadeJobState.Done.value, 'lease_owner': None, 'lease_until': None,
+                'finished_at': utc_now(),
+            }
+        await collections.cascade_job_collection.update_one(
+            {'_id': job.id, 'lease_owner': worker_id}, {'$set': update}
+        )
+
+    async def _worker(self, worker_id: str):
+        assert self._wake is not None
+        while True:
+            self._wake.clear()
+            try:
+                job = await self._claim(worker_id)
+                if job is not None:
+                    await self._process(worker_id, job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+            try:
+                await asyncio.wait_for(self._wake.wait(), config.cascade.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def startup(self):
+        assert not self._workers, "Already initialized"
+        self._wake = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker(f"{self._worker_prefix}:{idx}"))
+            for idx in range(config.cascade.workers)
+        ]
+
+    async def shutdown(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wake = None
+
+
+cascade_jobs = CascadeJobs()
+
+
+async def startup():
+    await cascade_jobs.startup()
+
+
+async def shutdown():
+    await cascade_jobs.shutdown()
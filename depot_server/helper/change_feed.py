@@ -0,0 +1,210 @@
+import asyncio
+import traceback
+from dataclasses import dataclass, field
+from typing import Optional, List, Set, Collection
+from uuid import UUID
+
+from depot_server.config import config
+from depot_server.db import connection, collections, DbItem, DbReservation
+from depot_server.model import ChangeEvent, ChangeEventType
+
+# Number of items read at once for the events of bulk writes
+_publish_batch_size = 1000
+
+
+@dataclass
+class _Event:
+    event: ChangeEvent
+    # For filtering, None if unknown (the event is sent to all subscriptions)
+    item_ids: Optional[List[UUID]] = None
+    bay_ids: Optional[List[UUID]] = None
+    user_id: Optional[str] = None
+
+
+@dataclass(eq=False)
+class Subscription:
+    item_id: Optional[UUID] = None
+    bay_id: Optional[UUID] = None
+    user_id: Optional[str] = None
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(config.events.queue_size))
+    # Set when events were dropped, the subscription must be closed
+    overflowed: bool = False
+
+    def matches(self, event: _Event) -> bool:
+        if self.item_id is not None and event.item_ids is not None and self.item_id not in event.item_ids:
+            return False
+        if self.bay_id is not None and event.bay_ids is not None and self.bay_id not in event.bay_ids:
+            return False
+        if self.user_id is not None and event.user_id is not None and self.user_id != event.user_id:
+            return False
+        return True
+
+
+def item_event(event_type: ChangeEventType, item: DbItem, prev_bay_id: Optional[UUID] = None) -> _Event:
+    return _Event(
+        ChangeEvent(type=event_type, id=item.id, item=None if event_type == ChangeEventType.ItemDeleted else item),
+        item_ids=[item.id],
+        bay_ids=[bay_id for bay_id in {item.bay_id, prev_bay_id} if bay_id is not None],
+    )
+
+
+def reservation_event(event_type: ChangeEventType, reservation: DbReservation) -> _Event:
+    return _Event(
+        ChangeEvent(
+            type=event_type,
+            id=reservation.id,
+            reservation=None if event_type == ChangeEventType.ReservationDeleted else reservation,
+        ),
+        item_ids=reservation.items,
+        # Reservations are not in a bay
+        bay_ids=[],
+        user_id=reservation.user_id,
+    )
+
+
+def _change_stream_event(change: dict) -> Optional[_Event]:
+    """Converts a change stream document of the item or reservation collection."""
+    collection = change['ns']['coll']
+    operation = change['operationType']
+    document_id = change['documentKey']['_id']
+    if operation == 'delete':
+        # Only the id is known
+        if collection == DbItem.__collection_name__:
+            return _Event(ChangeEvent(type=ChangeEventType.ItemDeleted, id=document_id), item_ids=[document_id])
+        return _Event(ChangeEvent(type=ChangeEventType.ReservationDeleted, id=document_id))
+    if operation not in ('insert', 'update', 'replace') or change.get('fullDocument') is None:
+        # Deleted since, or an operation on the collection itself
+        return None
+    if collection == DbItem.__collection_name__:
+        return item_event(
+            ChangeEventType.ItemCreated if operation == 'insert' else ChangeEventType.ItemUpdated,
+            DbItem.validate_document(change['fullDocument']),
+        )
+    reservation = DbReservation.validate_document(change['fullDocument'])
+    if operation == 'insert':
+        event_type = ChangeEventType.ReservationCreated
+    elif reservation.returned and (
+            operation == 'replace' or 'returned' in change.get('updateDescription', {}).get('updatedFields', {})
+    ):
+        # Returning replaces the reservation, the previous state is not known
+        event_type = ChangeEventType.ReservationReturned
+    else:
+        event_type = ChangeEventType.ReservationUpdated
+    return reservation_event(event_type, reservation)
+
+
+class ChangeFeed:
+    """
+    Distributes change events of items and reservations to the subscriptions of this process (see `/events`).
+
+    With a replica set, the events come from a change stream on the item and reservation collections, so they
+    include the changes made by other processes. Otherwise, the write endpoints `publish` the events to this process
+    only. Bulk item writes (reservation status, cascades of deleted bays and report profiles) `publish_items`, so
+    their events reach the subscriptions of the process which ran the write.
+    """
+
+    def __init__(self):
+        self._subscriptions: Set[Subscription] = set()
+        self._watch_task: Optional[asyncio.Task] = None
+        self.uses_change_stream = False
+
+    def subscribe(
+            self, item_id: Optional[UUID] = None, bay_id: Optional[UUID] = None, user_id: Optional[str] = None
+    ) -> Subscription:
+        subscription = Subscription(item_id=item_id, bay_id=bay_id, user_id=user_id)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def _dispatch(self, event: _Event):
+        for subscription in list(self._subscriptions):
+            if subscription.overflowed or not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event.event)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+                # Wakes up the waiting stream
+                subscription.queue.get_nowait()
+                subscription.queue.put_nowait(ChangeEvent(type=ChangeEventType.Overflow))
+
+    def publish(self, event: _Event):
+        """Publishes an event of a write endpoint. Not needed with a change stream, which sees all changes."""
+        if not self.uses_change_stream:
+            self._dispatch(event)
+
+    async def publish_items(self, item_ids: Collection[UUID], prev_bay_id: Optional[UUID] = None):
+        """
+        Publishes `ItemUpdated` for items changed by a bulk write, which does not have the documents. The items are
+        only read if there are subscriptions. `prev_bay_id` is the bay the items were removed from.
+        """
+        if self.uses_change_stream or not self._subscriptions or not item_ids:
+            return
+        item_ids = list(item_ids)
+        for offset in range(0, len(item_ids), _publish_batch_size):
+            async for item in collections.item_collection.find(
+                    {'_id': {'$in': item_ids[offset:offset + _publish_batch_size]}}
+            ):
+                self._dispatch(item_event(ChangeEventType.ItemUpdated, item, prev_bay_id))
+
+    async def _watch(self):
+        assert connection.async_db is not None
+        pipeline = [
+            {'$match': {'ns.coll': {'$in': [DbItem.__collection_name__, DbReservation.__collection_name__]}}},
+        ]
+        resume_token = None
+        while True:
+            try:
+                async with connection.async_db.watch(
+                        pipeline, full_document='updateLookup', resume_after=resume_token
+                ) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        event = _change_stream_event(change)
+                        if event is not None:
+                            self._dispatch(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+                await asyncio.sleep(1)
+
+    async def _has_change_streams(self) -> bool:
+        assert connection.async_db is not None
+        try:
+            hello = await connection.async_db.command('isMaster')
+        except Exception as e:
+            print(f"Cannot detect change stream support: {e!r}")
+            return False
+        # Replica set or sharded cluster
+        return 'setName' in hello or hello.get('msg') == 'isdbgrid'
+
+    async def startup(self):
+        assert self._watch_task is None, "Already initialized"
+        source = config.events.source
+        if source == 'auto':
+            source = 'change_stream' if await self._has_change_streams() else 'local'
+        self.uses_change_stream = source == 'change_stream'
+        if self.uses_change_stream:
+            self._watch_task = asyncio.create_task(self._watch())
+        print(f"Change events from {source}")
+
+    async def shutdown(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            await asyncio.gather(self._watch_task, return_exceptions=True)
+            self._watch_task = None
+        self._subscriptions.clear()
+
+
+change_feed = ChangeFeed()
+
+
+async def startup():
+    await change_feed.startup()
+
+
+async def shutdown():
+    await change_feed.shutdown()
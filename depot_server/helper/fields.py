@@ -0,0 +1,40 @@
+from typing import Optional, Set, Type, Iterable
+
+from fastapi import HTTPException
+
+from depot_server.db.model.base import BaseDocument
+from depot_server.helper.response import FastJSONResponse
+from depot_server.model.base import BaseModel, camelcase
+
+
+def parse_fields(fields: Optional[str], model: Type[BaseModel]) -> Optional[Set[str]]:
+    """
+    Parses the `fields` query parameter (comma separated field names, camelCase or snake_case) of a list endpoint
+    returning `model` into field names. The `id` is always included.
+    """
+    if fields is None:
+        return None
+    names_by_alias = {field.alias: name for name, field in model.__fields__.items()}
+    field_names = {'id'}
+    for field in fields.split(','):
+        field = field.strip()
+        if not field:
+            continue
+        name = names_by_alias.get(field, field if field in model.__fields__ else None)
+        if name is None:
+            raise HTTPException(400, f"Unknown field {field}")
+        field_names.add(name)
+    return field_names
+
+
+def partial_dict(document: BaseDocument) -> dict:
+    """Returns a partial document (read with `fields`) with the field names of the API models."""
+    return {camelcase(key): value for key, value in document.dict().items()}
+
+
+def partial_response(documents: Iterable[BaseDocument]) -> FastJSONResponse:
+    """
+    Serializes partial documents (read with `fields`) directly, as they do not match the `response_model` of the
+    endpoint.
+    """
+    return FastJSONResponse([partial_dict(document) for document in documents])
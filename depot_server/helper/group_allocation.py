@@ -0,0 +1,128 @@
+import asyncio
+import heapq
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from typing import AsyncIterator, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from depot_server.config import config
+from depot_server.db import collections
+from depot_server.db.collection import ModelCollection
+from depot_server.helper.availability import Interval, busy_intervals, free_counts, count_free_windows
+from depot_server.helper.util import utc_now
+from depot_server.model import ItemCondition, GroupDayAvailability
+
+# Items in these conditions are not allocated
+_unavailable_conditions = [ItemCondition.Gone.value, ItemCondition.Bad.value]
+# Seconds between attempts to take a group lock
+_lock_retry_interval = 0.05
+
+
+@asynccontextmanager
+async def group_lock(group_id: str) -> AsyncIterator[None]:
+    """
+    Holds the lock of the group, so concurrent group reservations (also on other workers) do not allocate the same
+    items. Raises 409 if the lock is not available within `groups.lock_timeout`.
+    """
+    owner = uuid4().hex
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + config.groups.lock_timeout
+    while True:
+        now = utc_now()
+        try:
+            # Inserts the lock, or takes over an expired lock. Fails with a duplicate key if it is held.
+            await collections.group_lock_collection.update_one(
+                {'_id': group_id, 'lease_until': {'$lt': now}},
+                {'$set': {
+                    'lease_owner': owner, 'lease_until': now + timedelta(seconds=config.groups.lock_lease_time),
+                }},
+                upsert=True,
+            )
+            break
+        except DuplicateKeyError:
+            if loop.time() >= deadline:
+                raise HTTPException(409, f"Items of group {group_id} are being allocated, try again")
+            await asyncio.sleep(_lock_retry_interval)
+    try:
+        yield
+    finally:
+        await collections.group_lock_collection.delete_one({'_id': group_id, 'lease_owner': owner})
+
+
+async def _group_item_ids(collection: ModelCollection, group_id: str) -> List[UUID]:
+    item_ids = [
+        item.id
+        async for item in collection.find(
+            {'group_id': group_id, 'condition': {'$nin': _unavailable_conditions}}, fields={'id'}
+        )
+    ]
+    if not item_ids:
+        raise HTTPException(404, f"No items in group {group_id}")
+    return item_ids
+
+
+def _slack(intervals: List[Interval], start: int, end: int, window: int) -> Optional[int]:
+    """
+    Returns the free days the reservation [start, end] would leave between the neighbouring reservations of an item
+    (each side counted up to `window`), None if the item is not free.
+    """
+    before = window
+    after = window
+    for busy_start, busy_end in intervals:
+        if busy_start <= end and busy_end >= start:
+            return None
+        if busy_end < start:
+            before = min(before, start - busy_end - 1)
+        else:
+            after = min(after, busy_start - end - 1)
+    return before + after
+
+
+async def allocate_group_items(group_id: str, count: int, start: date, end: date) -> List[UUID]:
+    """
+    Selects `count` free items of the group for the (inclusive) day range. Must be called with the `group_lock`.
+
+    Best fit: the items whose free gap around the range is the smallest are taken, so reservations are packed onto the
+    same items and long free gaps stay available for long reservations.
+    """
+    item_ids = await _group_item_ids(collections.item_collection, group_id)
+    window = config.groups.fit_window
+    busy = await busy_intervals(
+        collections.reservation_collection, item_ids, start - timedelta(days=window), end + timedelta(days=window)
+    )
+    candidates: List[Tuple[int, str, UUID]] = []
+    for item_id in item_ids:
+        slack = _slack(busy.get(item_id, []), start.toordinal(), end.toordinal(), window)
+        if slack is not None:
+            # The id makes the choice deterministic
+            candidates.append((slack, str(item_id), item_id))
+    if len(candidates) < count:
+        raise HTTPException(400, f"Only {len(candidates)} items of group {group_id} are available")
+    return [item_id for _, _, item_id in heapq.nsmallest(count, candidates)]
+
+
+async def group_availability(group_id: str, start: date, end: date) -> List[GroupDayAvailability]:
+    """Returns the number of free items of the group for each day of the (inclusive) range."""
+    item_ids = await _group_item_ids(collections.item_collection.read_only, group_id)
+    busy = await busy_intervals(collections.reservation_collection.read_only, item_ids, start, end)
+    return [
+        GroupDayAvailability(day=day, total=len(item_ids), available=available)
+        for day, available in free_counts(busy, len(item_ids), start, end)
+    ]
+
+
+async def group_free_windows(
+        group_id: str, count: int, start: date, end: date, duration: int, limit: int
+) -> List[Interval]:
+    """
+    Returns the earliest (up to `limit`) ranges within the (inclusive) range in which `count` items of the group are
+    free for any `duration` days.
+    """
+    item_ids = await _group_item_ids(collections.item_collection.read_only, group_id)
+    if len(item_ids) < count:
+        raise HTTPException(400, f"Group {group_id} only has {len(item_ids)} items")
+    busy = await busy_intervals(collections.reservation_collection.read_only, item_ids, start, end)
+    return count_free_windows(busy, item_ids, start, end, duration, count, limit)
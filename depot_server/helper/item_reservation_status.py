@@ -0,0 +1,112 @@
+from datetime import date, timedelta
+from time import perf_counter
+from typing import Dict, Iterable, Optional, Tuple
+from uuid import UUID
+
+from pymongo import UpdateOne
+
+from depot_server.config import config
+from depot_server.db import collections
+from depot_server.helper.change_feed import change_feed
+from depot_server.helper.scheduler import scheduler
+
+# Only written here, the item endpoints leave them alone
+reservation_status_fields = ('current_reservation_id', 'next_reservation_start', 'available_until')
+
+
+def _status(reservations: Iterable[dict], today: date) -> Dict[str, Optional[object]]:
+    """
+    Computes the reservation status of an item from its not returned reservations (ordered by start).
+
+    An item is out while a reservation started and was not returned yet (also if it is overdue). Otherwise it is
+    available until the day before the next reservation starts (`None` if there is no next reservation).
+    """
+    current_reservation_id = None
+    next_reservation_start = None
+    for reservation in reservations:
+        start = date.fromordinal(reservation['start'])
+        if start <= today:
+            if current_reservation_id is None:
+                current_reservation_id = reservation['_id']
+        else:
+            next_reservation_start = start
+            break
+    return {
+        'current_reservation_id': current_reservation_id,
+        'next_reservation_start': next_reservation_start,
+        'available_until': (
+            next_reservation_start - timedelta(days=1)
+            if current_reservation_id is None and next_reservation_start is not None else None
+        ),
+    }
+
+
+async def _statuses(query: dict, today: date) -> Dict[UUID, Dict[str, Optional[object]]]:
+    reservations_by_item: Dict[UUID, list] = {}
+    async for reservation in collections.reservation_collection.collection.find(
+            {**query, 'returned': False}, projection={'_id': 1, 'start': 1, 'items': 1}, sort=[('start', 1)]
+    ):
+        for item_id in reservation['items']:
+            reservations_by_item.setdefault(item_id, []).append(reservation)
+    return {
+        item_id: _status(reservations, today)
+        for item_id, reservations in reservations_by_item.items()
+    }
+
+
+def _update(item_id: UUID, status: Dict[str, Optional[object]]) -> UpdateOne:
+    return UpdateOne({'_id': item_id}, {'$set': {
+        key: value.toordinal() if isinstance(value, date) else value for key, value in status.items()
+    }})
+
+
+async def update_item_reservation_status(item_ids: Iterable[UUID]):
+    """Recomputes the denormalized reservation status of the given items after their reservations changed."""
+    item_ids = list(set(item_ids))
+    if not item_ids:
+        return
+    today = date.today()
+    statuses = await _statuses({'items': {'$in': item_ids}}, today)
+    empty_status = _status([], today)
+    await collections.item_collection.bulk_write(
+        [_update(item_id, statuses.get(item_id, empty_status)) for item_id in item_ids], ordered=False
+    )
+    await change_feed.publish_items(item_ids)
+
+
+async def task_sweep_item_reservation_status() -> dict:
+    """Moves the reservation status of all items forward to today, as reservations start without any write."""
+    start_time = perf_counter()
+    today = date.today()
+    statuses = await _statuses({}, today)
+    empty_status = _status([], today)
+    stored: Dict[UUID, Tuple] = {}
+    async for item in collections.item_collection.collection.find(
+            {}, projection={'_id': 1, **{field: 1 for field in reservation_status_fields}}
+    ):
+        stored[item['_id']] = tuple(item.get(field) for field in reservation_status_fields)
+    requests = []
+    updated_ids = []
+    for item_id, stored_status in stored.items():
+        status = statuses.get(item_id, empty_status)
+        if stored_status != tuple(
+                value.toordinal() if isinstance(value, date) else value for value in status.values()
+        ):
+            requests.append(_update(item_id, status))
+            updated_ids.append(item_id)
+    await collections.item_collection.bulk_write(requests, ordered=False)
+    await change_feed.publish_items(updated_ids)
+    return {
+        'items': len(stored),
+        'updated': len(requests),
+        'duration': perf_counter() - start_time,
+    }
+
+
+# Runs when first deployed, to backfill the status of the existing items
+scheduler.add_daily_job(
+    'item_reservation_status',
+    config.item_reservation_status_cron_time,
+    task_sweep_item_reservation_status,
+    run_on_register=True,
+)
@@ -0,0 +1,85 @@
+import asyncio
+import traceback
+from typing import Optional, List
+
+from depot_server.config import config
+from depot_server.helper.auth import get_profiles
+from depot_server.helper.metrics import cache_requests
+
+_hits = cache_requests.labels('manager_roster', 'hit')
+_misses = cache_requests.labels('manager_roster', 'miss')
+
+
+class ManagerRoster:
+    """
+    Caches the profiles of all managers with an email address.
+
+    The profile directory is read on first use and then refreshed in the background every
+    `manager_roster_refresh_interval` seconds, so sending to managers does not need to download the directory.
+    """
+
+    def __init__(self):
+        self._managers: Optional[List[dict]] = None
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+
+    async def _load(self):
+        self._managers = [
+            profile
+            for profile in await get_profiles()
+            if 'manager' in profile.get('roles', ()) and profile.get('email')
+        ]
+
+    async def get(self) -> List[dict]:
+        if self._managers is not None:
+            self.hits += 1
+            _hits.inc()
+            return self._managers
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if self._managers is None:
+                self.misses += 1
+                _misses.inc()
+                await self._load()
+            else:
+                self.hits += 1
+                _hits.inc()
+        assert self._managers is not None
+        return self._managers
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(config.manager_roster_refresh_interval)
+            # Only refresh if it is actually used
+            if self._managers is None:
+                continue
+            try:
+                await self._load()
+            except Exception:
+                traceback.print_exc()
+
+    async def startup(self):
+        assert self._refresh_task is None, "Already initialized"
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def shutdown(self):
+        assert self._refresh_task is not None, "Was not initialized"
+        self._refresh_task.cancel()
+        self._refresh_task = None
+        self._managers = None
+        self._load_lock = None
+
+
+manager_roster = ManagerRoster()
+
+
+async def startup():
+    await manager_roster.startup()
+
+
+async def shutdown():
+    await manager_roster.shutdown()
@@ -0,0 +1,235 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Generic, Iterator, List, Sequence, Tuple, TypeVar
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str]) -> str:
+    if not label_names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ('labels', 'value')
+
+    def __init__(self, labels: str):
+        self.labels = labels
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ('labels', 'upper_bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, labels: str, upper_bounds: Sequence[float]):
+        self.labels = labels
+        self.upper_bounds = upper_bounds
+        # Not cumulative, one more for +Inf
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+TChild = TypeVar('TChild')
+
+
+class _Metric(Generic[TChild]):
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children: Dict[Tuple[str, ...], TChild] = {}
+
+    def _create_child(self, labels: str) -> TChild:
+        raise NotImplementedError()
+
+    def labels(self, *label_values: str) -> TChild:
+        """
+        Returns the child for the label values. Children are created once and should be looked up when the instrumented
+        object is set up, not for every observation.
+        """
+        assert len(label_values) == len(self.label_names), f"{self.name} requires labels {self.label_names}"
+        child = self._children.get(label_values)
+        if child is None:
+            child = self._children[label_values] = self._create_child(
+                _format_labels(self.label_names, label_values)
+            )
+        return child
+
+    def _samples(self, child: TChild) -> Iterator[str]:
+        raise NotImplementedError()
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.type_name}'
+        for child in self._children.values():
+            yield from self._samples(child)
+
+
+class Counter(_Metric[_CounterChild]):
+    type_name = 'counter'
+
+    def _create_child(self, labels: str) -> _CounterChild:
+        return _CounterChild(labels)
+
+    def _samples(self, child: _CounterChild) -> Iterator[str]:
+        yield f'{self.name}{child.labels} {_format_value(child.value)}'
+
+
+class Gauge(_Metric[_GaugeChild]):
+    type_name = 'gauge'
+
+    def _create_child(self, labels: str) -> _GaugeChild:
+        return _GaugeChild(labels)
+
+    def _samples(self, child: _GaugeChild) -> Iterator[str]:
+        yield f'{self.name}{child.labels} {_format_value(child.value)}'
+
+
+class CallbackGauge(_Metric[None]):
+    """Gauge which is computed when scraped. The callback returns the value per label values."""
+    type_name = 'gauge'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            label_names: Sequence[str],
+            callback: Callable[[], Dict[Tuple[str, ...], float]],
+    ):
+        super().__init__(name, documentation, label_names)
+        self.callback = callback
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.type_name}'
+        for label_values, value in self.callback().items():
+            yield f'{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}'
+
+
+class Histogram(_Metric[_HistogramChild]):
+    type_name = 'histogram'
+
+    def __init__(
+            self, name: str, documentation: str, label_names: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.upper_bounds = tuple(sorted(buckets))
+        self._bucket_labels = [f'le="{_format_value(bound)}"' for bound in self.upper_bounds] + ['le="+Inf"']
+
+    def _create_child(self, labels: str) -> _HistogramChild:
+        return _HistogramChild(labels, self.upper_bounds)
+
+    def _samples(self, child: _HistogramChild) -> Iterator[str]:
+        cumulative = 0
+        for bucket_label, count in zip(self._bucket_labels, child.counts):
+            cumulative += count
+            labels = '{' + (child.labels[1:-1] + ',' if child.labels else '') + bucket_label + '}'
+            yield f'{self.name}_bucket{labels} {cumulative}'
+        yield f'{self.name}_sum{child.labels} {_format_value(child.sum)}'
+        yield f'{self.name}_count{child.labels} {child.count}'
+
+
+TMetric = TypeVar('TMetric', bound=_Metric)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: TMetric) -> TMetric:
+        assert metric.name not in self._metrics, f"Metric {metric.name} already registered"
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(
+            self, name: str, documentation: str, label_names: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        lines.append('')
+        return '\n'.join(lines)
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    'depot_http_request_duration_seconds', "Duration of HTTP requests by route.", ('method', 'route')
+)
+http_requests = registry.counter(
+    'depot_http_requests_total', "HTTP requests by route and status class.", ('method', 'route', 'status')
+)
+http_requests_in_flight = registry.gauge('depot_http_requests_in_flight', "HTTP requests being processed.")
+
+mongo_operation_duration = registry.histogram(
+    'depot_mongo_operation_duration_seconds', "Duration of Mongo operations by collection.", ('collection', 'operation')
+)
+mongo_operation_errors = registry.counter(
+    'depot_mongo_operation_errors_total', "Failed Mongo operations by collection.", ('collection', 'operation')
+)
+
+oauth_request_duration = registry.histogram(
+    'depot_oauth_request_duration_seconds', "Duration of requests to the OAuth server.", ('operation',)
+)
+oauth_request_errors = registry.counter(
+    'depot_oauth_request_errors_total', "Failed requests to the OAuth server.", ('operation',)
+)
+
+smtp_send_duration = registry.histogram(
+    'depot_smtp_send_duration_seconds', "Duration of sending a mail via SMTP.", ('result',)
+)
+
+cache_requests = registry.counter('depot_cache_requests_total', "Cache lookups by result.", ('cache', 'result'))
+
+
+def _cache_hit_ratios() -> Dict[Tuple[str, ...], float]:
+    lookups: Dict[str, List[float]] = {}
+    for (cache, result), child in cache_requests._children.items():
+        lookups.setdefault(cache, [0, 0])[result == 'hit'] += child.value
+    return {(cache,): hits / (misses + hits) for cache, (misses, hits) in lookups.items() if misses + hits}
+
+
+registry.register(CallbackGauge('depot_cache_hit_ratio', "Ratio of cache hits.", ('cache',), _cache_hit_ratios))
@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+from typing import List, Tuple
+
+from fastapi import HTTPException
+
+from depot_server.model import Recurrence, RecurrenceFrequency
+
+# Most occurrences of a series
+max_occurrences = 200
+
+_frequency_days = {
+    RecurrenceFrequency.Daily: 1,
+    RecurrenceFrequency.Weekly: 7,
+}
+
+
+def expand_recurrence(start: date, end: date, recurrence: Recurrence) -> List[Tuple[date, date]]:
+    """
+    Returns the (start, end) days of the occurrences of a series whose first occurrence is [start, end]. The
+    occurrences are ordered by start and do not overlap.
+    """
+    if recurrence.count is None and recurrence.until is None:
+        raise HTTPException(400, "Recurrence requires count or until")
+    if end < start:
+        raise HTTPException(400, "End is before start")
+    step = timedelta(days=recurrence.interval * _frequency_days[recurrence.frequency])
+    duration = end - start
+    if duration >= step:
+        raise HTTPException(400, "Occurrences of the recurrence overlap")
+    occurrences: List[Tuple[date, date]] = []
+    occurrence_start = start
+    while (recurrence.count is None or len(occurrences) < recurrence.count) and \
+            (recurrence.until is None or occurrence_start <= recurrence.until):
+        if len(occurrences) >= max_occurrences:
+            raise HTTPException(400, f"At most {max_occurrences} occurrences are allowed")
+        occurrences.append((occurrence_start, occurrence_start + duration))
+        occurrence_start += step
+    if not occurrences:
+        raise HTTPException(400, "Recurrence ends before start")
+    return occurrences
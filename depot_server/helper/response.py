@@ -0,0 +1,49 @@
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Iterable
+from uuid import UUID
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, BaseModel):
+        return value.dict(by_alias=True)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serializes to JSON, with orjson if it is installed. Dates, UUIDs, enums and models are serialized directly."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(',', ':'), default=_default
+    ).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with `dumps`, which does not need `jsonable_encoder` before."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def models_response(models: Iterable[BaseModel]) -> FastJSONResponse:
+    """
+    Returns the (already validated) API models directly, skipping the validation against the `response_model` of the
+    endpoint and `jsonable_encoder`.
+    """
+    return FastJSONResponse([model.dict(by_alias=True) for model in models])
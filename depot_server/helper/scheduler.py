@@ -0,0 +1,228 @@
+import asyncio
+import os
+import socket
+import traceback
+from dataclasses import dataclass
+from datetime import datetime, date, time, timedelta
+from time import perf_counter
+from typing import Callable, Awaitable, Optional, Dict, Any
+
+import pytz
+from pymongo.errors import DuplicateKeyError
+
+from depot_server.config import config
+from depot_server.db import collections, DbScheduledJob
+from depot_server.db.monitoring import current_operation
+from depot_server.helper.util import utc_now
+
+
+def _slot(day: date, time_of_day: time) -> datetime:
+    # time_of_day is local time
+    return datetime.combine(day, time_of_day).astimezone(pytz.UTC)
+
+
+def due_slot(time_of_day: time, now: datetime = None) -> datetime:
+    """Returns the last time the daily job was scheduled for (<= now)."""
+    if now is None:
+        now = utc_now()
+    today = now.astimezone().date()
+    slot = _slot(today, time_of_day)
+    if slot > now:
+        slot = _slot(today - timedelta(days=1), time_of_day)
+    return slot
+
+
+def next_slot(time_of_day: time, now: datetime = None) -> datetime:
+    """Returns the next time the daily job is scheduled for (> now)."""
+    if now is None:
+        now = utc_now()
+    return _slot(due_slot(time_of_day, now).astimezone().date() + timedelta(days=1), time_of_day)
+
+
+@dataclass
+class _Job:
+    name: str
+    time_of_day: time
+    task: Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+    run_on_register: bool = False
+
+
+class Scheduler:
+    """
+    Runs daily jobs exactly once across all worker processes.
+
+    Every job has a document in the `scheduledJob` collection. A worker which wants to run a due job takes a lease on
+    that document, which it renews while the job runs. If the worker dies, the lease expires and another worker takes
+    the job over. A failed run is retried with exponential backoff, after `max_attempts` failed runs the slot is
+    skipped. A job can also be triggered to run before its next slot.
+    """
+
+    def __init__(self, owner: str = None):
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self._jobs: Dict[str, _Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._wake: Dict[str, asyncio.Event] = {}
+
+    def add_daily_job(
+            self,
+            name: str,
+            time_of_day: time,
+            task: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+            run_on_register: bool = False,
+    ):
+        """
+        Registers a job. The task may return a result dict, which is stored with the job.
+
+        A new job first runs at its next slot, unless `run_on_register` is set (for jobs which backfill data that
+        existed before the job was deployed). Then it runs right away when it is registered the first time.
+        """
+        assert name not in self._jobs, f"Job {name} already registered"
+        self._jobs[name] = _Job(name, time_of_day, task, run_on_register)
+
+    async def _renew_lease(self, job: _Job):
+        while True:
+            await asyncio.sleep(config.scheduler.lease_time / 3)
+            await collections.scheduled_job_collection.update_one(
+                {'_id': job.name, 'lease_owner': self.owner},
+                {'$set': {'lease_until': utc_now() + timedelta(seconds=config.scheduler.lease_time)}},
+            )
+
+    async def try_run(self, job: _Job) -> bool:
+        """Runs the job if it is due and no other worker holds the lease. Returns if the job was run."""
+        slot = due_slot(job.time_of_day)
+        now = utc_now()
+        acquired = await collections.scheduled_job_collection.find_one_and_update(
+            {
+                '_id': job.name,
+                'completed_slot': {'$lt': slot},
+                '$and': [
+                    {'$or': [{'lease_until': None}, {'lease_until': {'$lt': now}}]},
+                    {'$or': [{'retry_after': None}, {'retry_after': {'$lte': now}}]},
+                ],
+            },
+            {
+                '$set': {
+                    'lease_owner': self.owner,
+                    'lease_until': now + timedelta(seconds=config.scheduler.lease_time),
+                    'last_run_start': now,
+                }
+            },
+        )
+        if acquired is None:
+            return False
+        renew_task = asyncio.create_task(self._renew_lease(job))
+        operation_token = current_operation.set({'job': job.name})
+        start = perf_counter()
+        result = None
+        error = None
+        try:
+            result = await job.task()
+        except Exception as e:
+            traceback.print_exc()
+            error = repr(e)
+        finally:
+            current_operation.reset(operation_token)
+            renew_task.cancel()
+        update: Dict[str, Any] = {
+            'lease_owner': None,
+            'lease_until': None,
+            'last_run_duration': perf_counter() - start,
+            'last_run_error': error,
+            'last_run_result': result,
+        }
+        failed_attempts = acquired.failed_attempts + 1
+        if error is not None and failed_attempts < config.scheduler.max_attempts:
+            # The slot stays due, it is retried once the backoff passed
+            backoff = min(
+                config.scheduler.retry_backoff * 2 ** (failed_attempts - 1), config.scheduler.retry_backoff_max
+            )
+            update['failed_attempts'] = failed_attempts
+            update['retry_after'] = utc_now() + timedelta(seconds=backoff)
+        else:
+            if error is not None:
+                print(f"Job {job.name} failed {failed_attempts} times, skipping slot {slot}")
+            update['completed_slot'] = slot
+            update['failed_attempts'] = 0
+            update['retry_after'] = None
+        await collections.scheduled_job_collection.update_one(
+            {'_id': job.name, 'lease_owner': self.owner}, {'$set': update}
+        )
+        return True
+
+    async def trigger(self, name: str) -> Optional[DbScheduledJob]:
+        """
+        Makes the job due, so it runs right away on this worker (or on the next worker which polls it). A run in
+        progress is not restarted. Returns the job, None if it is not registered.
+        """
+        job = self._jobs.get(name)
+        if job is None:
+            return None
+        db_job = await collections.scheduled_job_collection.find_one_and_update(
+            {'_id': name},
+            {'$set': {
+                'completed_slot': due_slot(job.time_of_day) - timedelta(days=1),
+                'failed_attempts': 0,
+                'retry_after': None,
+            }},
+        )
+        wake = self._wake.get(name)
+        if wake is not None:
+            wake.set()
+        return db_job
+
+    async def _run_loop(self, job: _Job):
+        wake = self._wake[job.name]
+        while True:
+            wake.clear()
+            try:
+                await self.try_run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+            # Wake up for the next slot, but also regularly to take over expired leases
+            delta = (next_slot(job.time_of_day) - utc_now()).total_seconds()
+            try:
+                await asyncio.wait_for(wake.wait(), max(min(delta, config.scheduler.poll_interval), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _register(self, job: _Job):
+        completed_slot = due_slot(job.time_of_day)
+        if job.run_on_register:
+            # The current slot is due, so the first run happens right away
+            completed_slot -= timedelta(days=1)
+        try:
+            # Only sets the slot when the job was never registered before
+            await collections.scheduled_job_collection.update_one(
+                {'_id': job.name},
+                {'$setOnInsert': {'completed_slot': completed_slot}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Concurrent upsert by another worker
+            pass
+
+    async def startup(self):
+        assert not self._tasks, "Already initialized"
+        await asyncio.gather(*[self._register(job) for job in self._jobs.values()])
+        self._wake = {name: asyncio.Event() for name in self._jobs}
+        self._tasks = {name: asyncio.create_task(self._run_loop(job)) for name, job in self._jobs.items()}
+
+    async def shutdown(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks = {}
+        self._wake = {}
+
+
+scheduler = Scheduler()
+
+
+async def startup():
+    await scheduler.startup()
+
+
+async def shutdown():
+    await scheduler.shutdown()
@@ -0,0 +1,196 @@
+from collections import defaultdict
+from datetime import date, datetime
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+
+from pymongo import UpdateOne
+
+from depot_server.config import config
+from depot_server.db import collections, DbReservation
+from depot_server.helper.scheduler import scheduler
+from depot_server.helper.util import utc_now
+
+# Items whose rollups are rebuilt together
+_rebuild_batch_size = 500
+
+
+def _month(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _rollup_id(item_id: UUID, month: date) -> str:
+    return f"{item_id}/{month.isoformat()}"
+
+
+def _days_by_month(start: date, end: date) -> Dict[date, List[int]]:
+    """Splits the (inclusive) day range into day ordinals per month."""
+    days_by_month: Dict[date, List[int]] = defaultdict(list)
+    for day in range(start.toordinal(), end.toordinal() + 1):
+        days_by_month[_month(date.fromordinal(day))].append(day)
+    return days_by_month
+
+
+def _reservation_days(reservation: Optional[DbReservation]) -> Set[Tuple[UUID, date, int]]:
+    if reservation is None:
+        return set()
+    return {
+        (item_id, month, day)
+        for month, days in _days_by_month(reservation.start, reservation.end).items()
+        for item_id in reservation.items
+        for day in days
+    }
+
+
+def _group(days: Iterable[Tuple[UUID, date, int]]) -> Dict[Tuple[UUID, date], List[int]]:
+    grouped: Dict[Tuple[UUID, date], List[int]] = defaultdict(list)
+    for item_id, month, day in days:
+        grouped[item_id, month].append(day)
+    return grouped
+
+
+async def update_reservation_utilization(
+        prev_reservation: Optional[DbReservation], reservation: Optional[DbReservation]
+):
+    """
+    Applies the difference between the previous and the new state of a reservation to the daily rollups. Pass `None`
+    as previous state for a new reservation and as new state for a deleted reservation.
+    """
+    await update_reservations_utilization(
+        [] if prev_reservation is None else [prev_reservation], [] if reservation is None else [reservation]
+    )
+
+
+async def update_reservations_utilization(
+        prev_reservations: Iterable[DbReservation], reservations: Iterable[DbReservation]
+):
+    """
+    Like `update_reservation_utilization` for the non-overlapping reservations of a series (with one bulk write), the
+    removed and the added reservations are passed.
+    """
+    prev_days: Set[Tuple[UUID, date, int]] = set()
+    for prev_reservation in prev_reservations:
+        prev_days.update(_reservation_days(prev_reservation))
+    new_days: Set[Tuple[UUID, date, int]] = set()
+    for reservation in reservations:
+        new_days.update(_reservation_days(reservation))
+    # Tells a concurrent rebuild that the rollup changed after it read the reservations
+    now = utc_now()
+    requests = [
+        UpdateOne(
+            {'_id': _rollup_id(item_id, month)},
+            {
+                '$addToSet': {'days': {'$each': days}},
+                '$set': {'updated_at': now},
+                '$setOnInsert': {'item_id': item_id, 'month': month.toordinal()},
+            },
+            upsert=True,
+        )
+        for (item_id, month), days in _group(new_days - prev_days).items()
+    ] + [
+        UpdateOne({'_id': _rollup_id(item_id, month)}, {'$pull': {'days': {'$in': days}}, '$set': {'updated_at': now}})
+        for (item_id, month), days in _group(prev_days - new_days).items()
+    ]
+    await collections.item_utilization_collection.bulk_write(requests, ordered=False)
+
+
+async def _rebuild_items(item_ids: List[UUID]) -> Tuple[int, int]:
+    """Rebuilds the rollups of the items. Returns the number of read reservations and of rollups."""
+    read_time = utc_now()
+    item_id_set = set(item_ids)
+    days_by_rollup: Dict[Tuple[UUID, date], Set[int]] = defaultdict(set)
+    reservation_count = 0
+    async for reservation in collections.reservation_collection.collection.find(
+            {'items': {'$in': item_ids}}, projection={'_id': 0, 'start': 1, 'end': 1, 'items': 1}
+    ):
+        reservation_count += 1
+        for month, days in _days_by_month(
+                date.fromordinal(reservation['start']), date.fromordinal(reservation['end'])
+        ).items():
+            for item_id in reservation['items']:
+                if item_id in item_id_set:
+                    days_by_rollup[item_id, month].update(days)
+    if not days_by_rollup:
+        return reservation_count, 0
+    now = utc_now()
+    requests = []
+    for (item_id, month), day_set in days_by_rollup.items():
+        rollup_id = _rollup_id(item_id, month)
+        days = sorted(day_set)
+        # Rollups updated incrementally after the reservations were read are newer than the rebuilt days, they are
+        # kept as they are
+        requests.append(UpdateOne(
+            {'_id': rollup_id, '$or': [{'updated_at': None}, {'updated_at': {'$lt': read_time}}]},
+            {'$set': {'days': days, 'updated_at': now}},
+        ))
+        requests.append(UpdateOne(
+            {'_id': rollup_id},
+            {'$setOnInsert': {'item_id': item_id, 'month': month.toordinal(), 'days': days, 'updated_at': now}},
+            upsert=True,
+        ))
+    await collections.item_utilization_collection.bulk_write(requests, ordered=False)
+    return reservation_count, len(days_by_rollup)
+
+
+async def task_rebuild_utilization() -> dict:
+    """
+    Recomputes all rollups from the reservations, repairing any drift of the incremental updates.
+
+    The items are processed in batches, so only the reservations and rollups of one batch are held in memory. Every
+    rebuilt or incrementally updated rollup gets a newer `updated_at` than the start of the run, the remaining ones
+    belong to deleted reservations or items and are removed.
+    """
+    start_time = perf_counter()
+    run_start: datetime = utc_now()
+    # Reservations of items in several batches are read once per batch
+    stats = {'items': 0, 'reservation_reads': 0, 'rollups': 0}
+
+    async def rebuild(batch: List[UUID]):
+        reservation_count, rollup_count = await _rebuild_items(batch)
+        stats['items'] += len(batch)
+        stats['reservation_reads'] += reservation_count
+        stats['rollups'] += rollup_count
+
+    batch: List[UUID] = []
+    async for item in collections.item_collection.collection.find({}, projection={'_id': 1}):
+        batch.append(item['_id'])
+        if len(batch) >= _rebuild_batch_size:
+            await rebuild(batch)
+            batch = []
+    if batch:
+        await rebuild(batch)
+    stale_result = await collections.item_utilization_collection.collection.delete_many(
+        {'$or': [{'updated_at': None}, {'updated_at': {'$lt': run_start}}]}
+    )
+    return {
+        **stats,
+        'removed_rollups': stale_result.deleted_count,
+        'duration': perf_counter() - start_time,
+    }
+
+
+async def get_reserved_days(start: date, end: date) -> Dict[UUID, int]:
+    """Returns the number of reserved days per item in the (inclusive) day range."""
+    start_ordinal = start.toordinal()
+    end_ordinal = end.toordinal()
+    reserved_days: Dict[UUID, int] = {}
+    async for row in collections.item_utilization_collection.read_only.aggregate([
+        {'$match': {'month': {'$gte': _month(start).toordinal(), '$lte': end_ordinal}}},
+        {'$project': {
+            'item_id': 1,
+            'count': {'$size': {'$filter': {
+                'input': '$days',
+                'as': 'day',
+                'cond': {'$and': [{'$gte': ['$$day', start_ordinal]}, {'$lte': ['$$day', end_ordinal]}]},
+            }}},
+        }},
+        {'$group': {'_id': '$item_id', 'count': {'$sum': '$count'}}},
+    ]):
+        reserved_days[row['_id']] = row['count']
+    return reserved_days
+
+
+# Name of the scheduled job, it can be triggered to rebuild outside of its slot
+utilization_rebuild_job = 'utilization_rebuild'
+
+scheduler.add_daily_job(utilization_rebuild_job, config.utilization_rebuild_cron_time, task_rebuild_utilization)
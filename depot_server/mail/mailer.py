@@ -1,19 +1,47 @@
 import aiosmtplib
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from mako.lookup import TemplateLookup
-from typing import Tuple
+from mako.template import Template
+from time import perf_counter
+from typing import Tuple, Optional, Iterable, List, Dict
 
 from depot_server.config import config
+from depot_server.helper.metrics import cache_requests, smtp_send_duration
+from depot_server.mail.smtp_pool import SmtpConnectionPool
+
+
+@dataclass
+class Mail:
+    language: Optional[str]
+    name: str
+    to: str
+    context: dict
+
+
+_template_cache_hits = cache_requests.labels('mail_template', 'hit')
+_template_cache_misses = cache_requests.labels('mail_template', 'miss')
+_smtp_send_ok = smtp_send_duration.labels('ok')
+_smtp_send_error = smtp_send_duration.labels('error')
+
+_template_dir = os.path.join(os.path.dirname(__file__), 'mail_templates')
 
 
 class Mailer:
     def __init__(self):
         self.template_lookup = TemplateLookup(
-            directories=[os.path.join(os.path.dirname(__file__), 'mail_templates')],
+            directories=[_template_dir],
             strict_undefined=True,
+            filesystem_checks=False,
         )
+        # (language, name) -> template, includes the fallback to en_us for missing languages
+        self.templates: Dict[Tuple[Optional[str], str], Template] = {}
+        self.pool: Optional[SmtpConnectionPool] = None
+        self.render_executor: Optional[ThreadPoolExecutor] = None
 
     def async_mailer(self) -> aiosmtplib.SMTP:
         if config.mail.ssl:
@@ -36,18 +64,80 @@ class Mailer:
             client_key=config.mail.keyfile,
         )
 
-    def _render_template(self, language: str, name: str, **kwargs) -> Tuple[str, str]:
-        if language != 'en_us' and not self.template_lookup.has_template(f'{language}/{name}'):
-            language = 'en_us'
+    def preload_templates(self):
+        """Compiles all templates in `mail_templates/` upfront."""
+        for language in os.listdir(_template_dir):
+            if not os.path.isdir(os.path.join(_template_dir, language)):
+                continue
+            for name in os.listdir(os.path.join(_template_dir, language)):
+                self.templates[(language, name)] = self.template_lookup.get_template(f'{language}/{name}')
+
+    async def startup(self):
+        assert self.pool is None, "Already initialized"
+        self.render_executor = ThreadPoolExecutor(
+            max_workers=config.mail.render_workers, thread_name_prefix='mail_render'
+        )
+        await asyncio.get_event_loop().run_in_executor(self.render_executor, self.preload_templates)
+        self.pool = SmtpConnectionPool(
+            self.async_mailer,
+            size=config.mail.pool_size,
+            max_messages=config.mail.pool_max_messages,
+            idle_timeout=config.mail.pool_idle_timeout,
+        )
+
+    async def shutdown(self):
+        assert self.pool is not None, "Was not initialized"
+        assert self.render_executor is not None, "Was not initialized"
+        await self.pool.close()
+        self.pool = None
+        self.render_executor.shutdown(wait=False)
+        self.render_executor = None
+
+    def _get_template(self, language: Optional[str], name: str) -> Template:
+        template = self.templates.get((language, name))
+        if template is None:
+            _template_cache_misses.inc()
+            if language != 'en_us' and not self.template_lookup.has_template(f'{language}/{name}'):
+                template = self._get_template('en_us', name)
+            else:
+                template = self.template_lookup.get_template(f'{language}/{name}')
+            self.templates[(language, name)] = template
+        else:
+            _template_cache_hits.inc()
+        return template
+
+    def template_language(self, language: Optional[str], name: str) -> str:
+        """Returns the language which is used for rendering the template in `language`."""
+        return self._get_template(language, name).uri.strip('/').split('/', 1)[0]
+
+    def _render_template(self, language: Optional[str], name: str, **kwargs) -> Tuple[str, str]:
+        data = self._render_fragment(language, name, **kwargs)
+        title, body = data.split('\n', 1)
+        return title, body
 
-        template = self.template_lookup.get_template(f'{language}/{name}')
-        data = template.render(
+    def _render_fragment(self, language: Optional[str], name: str, **kwargs) -> str:
+        template = self._get_template(language, name)
+        return template.render(
             config=config,
             **kwargs,
         )
-        return data.split('\n', 1)
 
-    async def async_send_mail(self, language: str, name: str, to: str, context: dict):
+    def _render_fragments(self, language: Optional[str], name: str, context: dict) -> Tuple[str, str]:
+        return (
+            self._render_fragment(language, name + '.html', **context),
+            self._render_fragment(language, name + '.txt', **context),
+        )
+
+    async def async_render_fragments(self, language: Optional[str], name: str, context: dict) -> Tuple[str, str]:
+        """
+        Renders the html and txt template parts (without subject) in the render thread pool, e.g. for reusing them in
+        the mails to multiple recipients.
+        """
+        return await asyncio.get_event_loop().run_in_executor(
+            self.render_executor, self._render_fragments, language, name, context
+        )
+
+    def _build_message(self, language: Optional[str], name: str, context: dict) -> bytes:
         html_title, html_data = self._render_template(language, name + '.html', **context)
         txt_title, txt_data = self._render_template(language, name + '.txt', **context)
         assert txt_title == html_title
@@ -56,9 +146,47 @@ class Mailer:
         message['Subject'] = txt_title
         message.attach(MIMEText(html_data, 'html'))
         message.attach(MIMEText(txt_data, 'plain'))
+        return message.as_bytes()
+
+    async def async_build_message(self, language: Optional[str], name: str, context: dict) -> bytes:
+        """Renders the templates and assembles the MIME message in the render thread pool."""
+        return await asyncio.get_event_loop().run_in_executor(
+            self.render_executor, self._build_message, language, name, context
+        )
+
+    async def async_send_message(self, to: str, message: bytes):
+        start = perf_counter()
+        try:
+            if self.pool is None:
+                async with self.async_mailer() as connected_mailer:
+                    await connected_mailer.sendmail(config.mail.sender, [to], message)
+            else:
+                await self.pool.send(config.mail.sender, [to], message)
+        except Exception:
+            _smtp_send_error.observe(perf_counter() - start)
+            raise
+        _smtp_send_ok.observe(perf_counter() - start)
 
-        async with self.async_mailer() as connected_mailer:
-            await connected_mailer.sendmail(config.mail.sender, [to], message.as_bytes())
+    async def async_send_mail(self, language: Optional[str], name: str, to: str, context: dict):
+        await self.async_send_message(to, await self.async_build_message(language, name, context))
+
+    async def async_send_mails(self, mails: Iterable[Mail]) -> List[Optional[BaseException]]:
+        """
+        Sends all mails concurrently over the pooled connections (at most `pool_size` in flight).
+        Returns the exception for each failed mail, `None` for mails which were sent.
+        """
+        async def send(mail: Mail):
+            await self.async_send_mail(mail.language, mail.name, mail.to, mail.context)
+
+        return list(await asyncio.gather(*[send(mail) for mail in mails], return_exceptions=True))
 
 
 mailer = Mailer()
+
+
+async def startup():
+    await mailer.startup()
+
+
+async def shutdown():
+    await mailer.shutdown()
@@ -1,34 +1,75 @@
-import traceback
+import asyncio
 from dataclasses import dataclass
 
-from typing import Optional, List
+from typing import Optional, List, Dict
+from uuid import UUID
 
-from depot_server.db import DbItem, DbReservation
-from depot_server.helper.auth import get_profiles
-from depot_server.mail.mailer import mailer
+from depot_server.db import collections, DbItem, DbReservation
+from depot_server.helper.manager_roster import manager_roster
+from depot_server.mail.mailer import Mail, mailer
+from depot_server.mail.outbox import enqueue_notifications, outbox, sender_params, Notification
+from depot_server.model import ReservationReturnItemState
 
 
 @dataclass
 class ProblemItem:
     problem: bool
-    comment: str
+    comment: Optional[str]
     item: Optional[DbItem]
 
 
-async def send_manager_item_problem(sender: dict, items: List[ProblemItem], reservation: Optional[DbReservation]):
-    managers = [
-        profile
-        for profile in await get_profiles()
-        if 'manager' in profile.get('roles', ()) and profile.get('email')
+async def send_manager_item_problem(
+        sender: dict, items: List[ReservationReturnItemState], reservation: Optional[DbReservation]
+):
+    await enqueue_notifications([Notification('manager_item_problem', {
+        'sender': sender_params(sender),
+        'items': [{'item_id': item.item_id, 'problem': item.problem, 'comment': item.comment} for item in items],
+        'reservation_id': None if reservation is None else reservation.id,
+    })])
+
+
+async def _resolve(params: dict) -> List[Mail]:
+    items_by_id: Dict[UUID, DbItem] = {
+        item.id: item
+        async for item in collections.item_collection.find(
+            {'_id': {'$in': [item['item_id'] for item in params['items']]}}
+        )
+    }
+    items = [
+        ProblemItem(problem=item['problem'], comment=item['comment'], item=items_by_id[item['item_id']])
+        for item in params['items'] if item['item_id'] in items_by_id
+    ]
+    if not items:
+        return []
+    reservation = None
+    if params['reservation_id'] is not None:
+        reservation = await collections.reservation_collection.find_one({'_id': params['reservation_id']})
+
+    managers_by_language: Dict[str, List[dict]] = {}
+    for manager in await manager_roster.get():
+        language = mailer.template_language(manager.get('locale'), 'manager_item_problem_items.html')
+        managers_by_language.setdefault(language, []).append(manager)
+
+    # The item list only depends on the language, render it once per language
+    languages = list(managers_by_language.keys())
+    rendered_items = await asyncio.gather(*[
+        mailer.async_render_fragments(
+            language,
+            'manager_item_problem_items',
+            {'sender': params['sender'], 'items': items, 'reservation': reservation},
+        )
+        for language in languages
+    ])
+    return [
+        Mail(
+            language,
+            'manager_item_problem',
+            manager['email'],
+            {'user': manager, 'items_html': items_html, 'items_txt': items_txt},
+        )
+        for language, (items_html, items_txt) in zip(languages, rendered_items)
+        for manager in managers_by_language[language]
     ]
 
-    for manager in managers:
-        try:
-            await mailer.async_send_mail(
-                None,
-                'manager_item_problem',
-                manager['email'],
-                {'sender': sender, 'user': manager, 'items': items, 'reservation': reservation},
-            )
-        except BaseException:
-            traceback.print_exc()
+
+outbox.register('manager_item_problem', _resolve)
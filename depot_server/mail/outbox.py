@@ -0,0 +1,214 @@
+import asyncio
+import os
+import socket
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Iterable, List, Optional, Deque, Dict, Any, Callable, Awaitable
+from uuid import uuid4
+
+from depot_server.config import config
+from depot_server.db import collections, DbMailOutbox
+from depot_server.helper.util import utc_now
+from depot_server.mail.mailer import mailer, Mail
+from depot_server.model import MailOutboxState, MailOutboxStats
+
+
+@dataclass
+class Notification:
+    name: str
+    # Ids and small values, must be storable in mongo
+    params: Dict[str, Any]
+
+
+# Builds the mails of a notification, may fetch profiles and documents
+NotificationResolver = Callable[[Dict[str, Any]], Awaitable[List[Mail]]]
+
+
+def sender_params(sender: dict) -> dict:
+    """Returns the fields of the sending user which are used in the templates."""
+    return {key: sender[key] for key in ('sub', 'name') if key in sender}
+
+
+class MailOutbox:
+    """
+    Durable mail queue in the `mailOutbox` collection.
+
+    Notifications are enqueued as small records (name and ids) with one insert. Each process runs `outbox_workers`
+    workers, which claim pending notifications with a lease (so a crashed worker's notifications are picked up again),
+    renewed after every sent mail. A worker which lost its lease stops sending.
+    The worker resolves the recipients with the resolver registered for the name, renders and sends the mails and
+    retries failures of any of these steps with exponential backoff. Recipients which already received the mail are
+    skipped on retries.
+    """
+
+    def __init__(self):
+        self._resolvers: Dict[str, NotificationResolver] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+        self.sent_total = 0
+        self.retried_total = 0
+        self.failed_total = 0
+        self._sent_times: Deque[float] = deque()
+
+    def register(self, name: str, resolver: NotificationResolver):
+        assert name not in self._resolvers, f"Notification {name} already registered"
+        self._resolvers[name] = resolver
+
+    async def enqueue(self, notifications: Iterable[Notification]):
+        now = utc_now()
+        db_notifications = [
+            DbMailOutbox(
+                id=uuid4(), name=notification.name, params=notification.params, created=now, next_attempt=now
+            )
+            for notification in notifications
+        ]
+        if not db_notifications:
+            return
+        await collections.mail_outbox_collection.insert_many(db_notifications)
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _claim(self, worker_id: str) -> Optional[DbMailOutbox]:
+        now = utc_now()
+        return await collections.mail_outbox_collection.find_one_and_update(
+            {
+                '$or': [
+                    {'state': MailOutboxState.Pending.value, 'next_attempt': {'$lte': now}},
+                    # Lease of a crashed worker expired
+                    {'state': MailOutboxState.Sending.value, 'lease_until': {'$lt': now}},
+                ]
+            },
+            {
+                '$set': {
+                    'state': MailOutboxState.Sending.value,
+                    'lease_owner': worker_id,
+                    'lease_until': now + timedelta(seconds=config.mail.outbox_lease_time),
+                },
+                '$inc': {'attempts': 1},
+            },
+            sort=[('next_attempt', 1)],
+        )
+
+    async def _send(self, worker_id: str, job: DbMailOutbox) -> bool:
+        """Sends the mails of the notification. Returns False if the lease was lost to another worker."""
+        mails = await self._resolvers[job.name](job.params)
+        for mail in mails:
+            if mail.to in job.sent_to:
+                continue
+            message = await mailer.async_build_message(mail.language, mail.name, mail.context)
+            await mailer.async_send_message(mail.to, message)
+            job.sent_to.append(mail.to)
+            self.sent_total += 1
+            self._sent_times.append(time.monotonic())
+            # Renews the lease with every recipient, so a long notification is not taken over
+            if not await collections.mail_outbox_collection.update_one(
+                    {'_id': job.id, 'lease_owner': worker_id},
+                    {
+                        '$addToSet': {'sent_to': mail.to},
+                        '$set': {'lease_until': utc_now() + timedelta(seconds=config.mail.outbox_lease_time)},
+                    },
+            ):
+                # The lease expired and another worker took the notification over, it sends the remaining mails
+                print(f"Lost lease of notification {job.id} after sending to {mail.to}")
+                return False
+        self._prune_sent_times()
+        return True
+
+    async def _process(self, worker_id: str, job: DbMailOutbox):
+        try:
+            if not await self._send(worker_id, job):
+                return
+        except Exception as e:
+            traceback.print_exc()
+            update: dict = {'lease_owner': None, 'lease_until': None, 'last_error': repr(e)}
+            if job.attempts >= config.mail.outbox_max_attempts:
+                update['state'] = MailOutboxState.Failed.value
+                self.failed_total += 1
+            else:
+                backoff = min(
+                    config.mail.outbox_retry_backoff * 2 ** (job.attempts - 1), config.mail.outbox_retry_backoff_max
+                )
+                update['state'] = MailOutboxState.Pending.value
+                update['next_attempt'] = utc_now() + timedelta(seconds=backoff)
+                self.retried_total += 1
+        else:
+            update = {
+                'state': MailOutboxState.Sent.value, 'lease_owner': None, 'lease_until': None, 'sent_at': utc_now()
+            }
+        await collections.mail_outbox_collection.update_one(
+            {'_id': job.id, 'lease_owner': worker_id}, {'$set': update}
+        )
+
+    async def _worker(self, worker_id: str):
+        assert self._wake is not None
+        while True:
+            self._wake.clear()
+            try:
+                job = await self._claim(worker_id)
+                if job is not None:
+                    await self._process(worker_id, job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+            try:
+                await asyncio.wait_for(self._wake.wait(), config.mail.outbox_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _prune_sent_times(self):
+        min_time = time.monotonic() - 60
+        while self._sent_times and self._sent_times[0] < min_time:
+            self._sent_times.popleft()
+
+    async def stats(self) -> MailOutboxStats:
+        pending, sending, failed = await asyncio.gather(*[
+            collections.mail_outbox_collection.count_documents({'state': state.value})
+            for state in (MailOutboxState.Pending, MailOutboxState.Sending, MailOutboxState.Failed)
+        ])
+        self._prune_sent_times()
+        return MailOutboxStats(
+            pending=pending,
+            sending=sending,
+            failed=failed,
+            sent_total=self.sent_total,
+            retried_total=self.retried_total,
+            failed_total=self.failed_total,
+            sent_last_minute=len(self._sent_times),
+        )
+
+    async def startup(self):
+        assert not self._workers, "Already initialized"
+        self._wake = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker(f"{self._worker_prefix}:{idx}"))
+            for idx in range(config.mail.outbox_workers)
+        ]
+
+    async def shutdown(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wake = None
+
+
+outbox = MailOutbox()
+
+
+async def enqueue_notifications(notifications: Iterable[Notification]):
+    await outbox.enqueue(notifications)
+
+
+async def startup():
+    await outbox.startup()
+
+
+async def shutdown():
+    await outbox.shutdown()
@@ -1,21 +1,36 @@
-import traceback
+from typing import List
+from uuid import UUID
 
-from depot_server.db import DbItem, DbReservation
+from depot_server.db import collections, DbItem
 from depot_server.helper.auth import get_profile
-from depot_server.mail.mailer import mailer
+from depot_server.mail.mailer import Mail
+from depot_server.mail.outbox import enqueue_notifications, outbox, sender_params, Notification
 
 
-async def send_reservation_item_removed(sender: dict, item: DbItem, reservation: DbReservation):
+async def send_reservation_item_removed(sender: dict, item: DbItem, reservation_ids: List[UUID]):
+    await enqueue_notifications(
+        Notification(
+            'reservation_item_removed',
+            {'sender': sender_params(sender), 'item_id': item.id, 'reservation_id': reservation_id},
+        )
+        for reservation_id in reservation_ids
+    )
+
+
+async def _resolve(params: dict) -> List[Mail]:
+    item = await collections.item_collection.find_one({'_id': params['item_id']})
+    reservation = await collections.reservation_collection.find_one({'_id': params['reservation_id']})
+    if item is None or reservation is None:
+        return []
     target_user = await get_profile(reservation.user_id)
     if not target_user.get('email'):
-        return
+        return []
+    return [Mail(
+        target_user.get('locale'),
+        'reservation_item_removed',
+        target_user['email'],
+        {'sender': params['sender'], 'user': target_user, 'item': item, 'reservation': reservation},
+    )]
 
-    try:
-        await mailer.async_send_mail(
-            None,
-            'manager_item_problem',
-            target_user['email'],
-            {'sender': sender, 'user': target_user, 'item': item, 'reservation': reservation},
-        )
-    except BaseException:
-        traceback.print_exc()
+
+outbox.register('reservation_item_removed', _resolve)
@@ -1,76 +1,78 @@
-import traceback
-from asyncio import Task
-
-import asyncio
-from datetime import datetime, date, time, timedelta
-from typing import Callable, Awaitable, Optional, Dict
+from datetime import date, timedelta
+from time import perf_counter
+from typing import Dict, List, AsyncIterable
 
 from depot_server.config import config
-from depot_server.db import collections
-from depot_server.helper.auth import get_profile
-from depot_server.mail.mailer import mailer
+from depot_server.db import collections, DbReservation
+from depot_server.helper.auth import get_profiles_by_id
+from depot_server.helper.scheduler import scheduler
+from depot_server.mail.mailer import Mail
+from depot_server.mail.outbox import enqueue_notifications, outbox, Notification
 
+_batch_size = 100
 
-async def dayly_cron(time_of_day: time, task: Callable[[], Awaitable]):
-    last_task: Optional[Task] = None
-    while True:
-        now = datetime.now()
-        next = datetime.combine(date.today(), time_of_day)
-        if next < now:
-            next = datetime.combine(date.today() + timedelta(days=1), time_of_day)
-        delta = (next - now).total_seconds()
-        await asyncio.sleep(delta)
-        if last_task is None or last_task.done():
-            last_task = asyncio.create_task(task())
-        else:
-            print("Skipping to run next task, last did not finish")
 
+async def _batches(reservations: AsyncIterable[DbReservation]) -> AsyncIterable[List[DbReservation]]:
+    batch: List[DbReservation] = []
+    async for reservation in reservations:
+        batch.append(reservation)
+        if len(batch) >= _batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-async def task_send_reminder_mail():
-    user_cache: Dict[str, dict] = {}
-    send_mails = []
-    async for reservation in collections.reservation_collection.find({'returned': False, 'end': date.today() - timedelta(days=1)}):
-        user = user_cache.get(reservation.user_id)
-        if user is None:
-            try:
-                user = await get_profile(reservation.user_id)
-            except BaseException:
-                traceback.print_exc()
-        if user is None:
-            continue
-        email = user.get('email')
-        if email is None:
-            continue
-        send_mails.append(mailer.async_send_mail(
-            user.get('locale'),
-            'return_reservation_reminder',
-            email,
-            {'user': user, 'reservation': reservation},
-        ))
-    for send_mail in send_mails:
-        try:
-            await send_mail
-        except BaseException:
-            traceback.print_exc()
 
+async def task_send_reminder_mail() -> dict:
+    start = perf_counter()
+    user_cache: Dict[str, dict] = {}
+    stats: dict = {'reservations': 0, 'users': 0, 'missing_users': 0, 'missing_emails': 0, 'mails': 0}
+    # Served by the (returned, end) index
+    reservations = collections.reservation_collection.find(
+        {'returned': False, 'end': (date.today() - timedelta(days=1)).toordinal()}, batch_size=_batch_size
+    )
+    async for batch in _batches(reservations):
+        missing_user_ids = {reservation.user_id for reservation in batch} - user_cache.keys()
+        if missing_user_ids:
+            user_cache.update(await get_profiles_by_id(missing_user_ids))
+        notifications = []
+        for reservation in batch:
+            user = user_cache.get(reservation.user_id)
+            if user is None:
+                stats['missing_users'] += 1
+                continue
+            email = user.get('email')
+            if email is None:
+                stats['missing_emails'] += 1
+                continue
+            # The profile is already fetched in bulk, pass on what the template needs
+            notifications.append(Notification('return_reservation_reminder', {
+                'user': {key: user[key] for key in ('sub', 'name', 'email', 'locale') if key in user},
+                'reservation_id': reservation.id,
+            }))
+        # The outbox workers send with bounded concurrency
+        await enqueue_notifications(notifications)
+        stats['reservations'] += len(batch)
+        stats['mails'] += len(notifications)
+    stats['users'] = len(user_cache)
+    stats['duration'] = perf_counter() - start
+    print(f"Reminder mails: {stats}")
+    return stats
 
-# TODO: Well, this unfortunately does not scale property, would need to run in a separate server cron job. (otherwise
-#   mails will be duplicated)
-#   Note: If the backend should scale, move that away.
-_reminder_mail_task: Optional[Task] = None
 
+async def _resolve(params: dict) -> List[Mail]:
+    reservation = await collections.reservation_collection.find_one({'_id': params['reservation_id']})
+    # Returned in the meantime
+    if reservation is None or reservation.returned:
+        return []
+    user = params['user']
+    return [Mail(
+        user.get('locale'), 'return_reservation_reminder', user['email'], {'user': user, 'reservation': reservation}
+    )]
 
-async def startup():
-    global _reminder_mail_task
-    if _reminder_mail_task is not None:
-        _reminder_mail_task.cancel()
-    _reminder_mail_task = asyncio.create_task(
-        dayly_cron(config.return_reservation_reminder_cron_time, task_send_reminder_mail)
-    )
 
+outbox.register('return_reservation_reminder', _resolve)
 
-async def shutdown():
-    global _reminder_mail_task
-    if _reminder_mail_task is not None:
-        _reminder_mail_task.cancel()
-    _reminder_mail_task = None
+scheduler.add_daily_job(
+    'return_reservation_reminder', config.return_reservation_reminder_cron_time, task_send_reminder_mail
+)
@@ -0,0 +1,92 @@
+import asyncio
+import time
+from typing import Callable, List, Optional, Sequence
+
+import aiosmtplib
+
+
+class _PooledConnection:
+    def __init__(self, smtp: aiosmtplib.SMTP):
+        self.smtp = smtp
+        self.sent_count = 0
+        self.last_used = time.monotonic()
+
+
+class SmtpConnectionPool:
+    """
+    Keeps up to `size` authenticated SMTP connections open and reuses them for consecutive messages.
+
+    A connection is closed after `max_messages` messages or when it was idle for more than `idle_timeout` seconds.
+    If the server dropped a connection, the message is transparently retried once on a fresh connection.
+    """
+
+    def __init__(
+            self,
+            connection_factory: Callable[[], aiosmtplib.SMTP],
+            size: int,
+            max_messages: int,
+            idle_timeout: float,
+    ):
+        self.connection_factory = connection_factory
+        self.size = size
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+
+        self._idle: List[_PooledConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._closed = False
+
+    async def _connect(self) -> _PooledConnection:
+        smtp = self.connection_factory()
+        await smtp.connect()
+        return _PooledConnection(smtp)
+
+    @staticmethod
+    async def _disconnect(connection: _PooledConnection):
+        try:
+            if connection.smtp.is_connected:
+                await connection.smtp.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            connection.smtp.close()
+
+    async def _acquire(self) -> _PooledConnection:
+        while self._idle:
+            # Most recently used first, stale ones at the bottom will expire
+            connection = self._idle.pop()
+            if connection.smtp.is_connected and time.monotonic() - connection.last_used < self.idle_timeout:
+                return connection
+            await self._disconnect(connection)
+        return await self._connect()
+
+    async def _release(self, connection: _PooledConnection, reusable: bool):
+        connection.last_used = time.monotonic()
+        if not reusable or self._closed or connection.sent_count >= self.max_messages:
+            await self._disconnect(connection)
+        else:
+            self._idle.append(connection)
+
+    async def send(self, sender: str, recipients: Sequence[str], message: bytes):
+        if self._closed:
+            raise RuntimeError("SMTP pool is closed")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            connection = await self._acquire()
+            try:
+                try:
+                    await connection.smtp.sendmail(sender, recipients, message)
+                except aiosmtplib.SMTPServerDisconnected:
+                    # Server closed the connection in between, reconnect once
+                    connection.smtp.close()
+                    connection = await self._connect()
+                    await connection.smtp.sendmail(sender, recipients, message)
+            except BaseException:
+                await self._release(connection, False)
+                raise
+            connection.sent_count += 1
+            await self._release(connection, True)
+
+    async def close(self):
+        self._closed = True
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*[self._disconnect(connection) for connection in idle])
@@ -5,4 +5,12 @@ from .item_state import ItemState, ItemStateChanges, StrChange, DateChange, Item
 from .report_element import ReportElement, ReportElementInWrite, ReportState
 from .report_profile import ReportProfile, ReportProfileInWrite, TotalReportState
 from .reservation import Reservation, ReservationInWrite, ReservationType, ReservationReturnInWrite, \
-    ReservationReturnItemState
+    ReservationReturnItemState, GroupReservationInWrite, GroupDayAvailability, Recurrence, RecurrenceFrequency, \
+    ReservationConflict, ReservationValidation, FreeWindow
+from .mail_outbox import MailOutboxState, MailOutboxStats
+from .scheduled_job import ScheduledJob
+from .utilization import Utilization, UtilizationGroupBy
+from .health import IndexBuildState, IndexStatus, Readiness
+from .cascade_job import CascadeJob, CascadeKind, CascadeJobState
+from .change_event import ChangeEvent, ChangeEventType
+from .batch import Batch
@@ -0,0 +1,16 @@
+from typing import Generic, List, TypeVar
+from uuid import UUID
+
+from pydantic import Field
+from pydantic.generics import GenericModel
+
+from .base import BaseModel
+
+TResult = TypeVar('TResult')
+
+
+class Batch(BaseModel, GenericModel, Generic[TResult]):
+    # Found documents in the order of the requested ids
+    results: List[TResult] = Field(...)
+    # Requested ids which do not exist
+    missing: List[UUID] = Field(...)
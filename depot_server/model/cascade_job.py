@@ -0,0 +1,37 @@
+from enum import Enum
+
+from datetime import datetime
+from pydantic import Field
+from typing import Optional
+from uuid import UUID
+
+from .base import BaseModel
+
+
+class CascadeKind(str, Enum):
+    Bay = 'bay'
+    ReportProfile = 'report_profile'
+    ReportElement = 'report_element'
+
+
+class CascadeJobState(str, Enum):
+    Pending = 'pending'
+    Running = 'running'
+    Done = 'done'
+    Failed = 'failed'
+
+
+class CascadeJob(BaseModel):
+    id: UUID = Field(...)
+    kind: CascadeKind = Field(...)
+    # Id of the deleted bay, report profile or report element
+    target_id: UUID = Field(...)
+
+    state: CascadeJobState = Field(...)
+    # Index of the current cascade step and number of documents updated by all steps
+    step: int = Field(...)
+    processed: int = Field(...)
+
+    created: datetime = Field(...)
+    finished_at: Optional[datetime] = None
+    last_error: Optional[str] = None
@@ -0,0 +1,30 @@
+from enum import Enum
+
+from pydantic import Field
+from typing import Optional
+from uuid import UUID
+
+from .base import BaseModel
+from .item import Item
+from .reservation import Reservation
+
+
+class ChangeEventType(str, Enum):
+    ItemCreated = 'item_created'
+    ItemUpdated = 'item_updated'
+    ItemDeleted = 'item_deleted'
+    ReservationCreated = 'reservation_created'
+    ReservationUpdated = 'reservation_updated'
+    ReservationReturned = 'reservation_returned'
+    ReservationDeleted = 'reservation_deleted'
+    # Events were dropped because the client did not keep up, it must reload
+    Overflow = 'overflow'
+
+
+class ChangeEvent(BaseModel):
+    type: ChangeEventType = Field(...)
+    # Id of the item or reservation
+    id: Optional[UUID] = None
+    # The changed item or reservation, not set for deletes
+    item: Optional[Item] = None
+    reservation: Optional[Reservation] = None
@@ -0,0 +1,29 @@
+from enum import Enum
+
+from pydantic import Field
+from typing import Optional, List
+
+from .base import BaseModel
+
+
+class IndexBuildState(str, Enum):
+    Pending = 'pending'
+    Building = 'building'
+    Ready = 'ready'
+    Failed = 'failed'
+
+
+class IndexStatus(BaseModel):
+    collection: str = Field(...)
+    state: IndexBuildState = Field(...)
+    created: List[str] = []
+    dropped: List[str] = []
+    # Progress message of a running index build, as reported by the server
+    progress: Optional[str] = None
+    error: Optional[str] = None
+
+
+class Readiness(BaseModel):
+    ready: bool = Field(...)
+    mongo: bool = Field(...)
+    indexes: List[IndexStatus] = Field(...)
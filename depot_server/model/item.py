@@ -38,6 +38,13 @@ class Item(BaseModel):
 
     bay_id: Optional[UUID] = None
 
+    # Not returned reservation which has started
+    current_reservation_id: Optional[UUID] = None
+    # Start of the next reservation
+    next_reservation_start: Optional[date] = None
+    # Last day the item is available, if it is not reserved now and has a next reservation
+    available_until: Optional[date] = None
+
 
 class ItemInWrite(BaseModel):
     external_id: Optional[str] = None
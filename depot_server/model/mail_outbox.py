@@ -0,0 +1,23 @@
+from enum import Enum
+
+from pydantic import Field
+
+from .base import BaseModel
+
+
+class MailOutboxState(str, Enum):
+    Pending = 'pending'
+    Sending = 'sending'
+    Sent = 'sent'
+    Failed = 'failed'
+
+
+class MailOutboxStats(BaseModel):
+    pending: int = Field(...)
+    sending: int = Field(...)
+    failed: int = Field(...)
+
+    sent_total: int = Field(...)
+    retried_total: int = Field(...)
+    failed_total: int = Field(...)
+    sent_last_minute: int = Field(...)
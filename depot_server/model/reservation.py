@@ -13,6 +13,20 @@ class ReservationType(str, Enum):
     TEAM = 'team'
 
 
+class RecurrenceFrequency(str, Enum):
+    Daily = 'daily'
+    Weekly = 'weekly'
+
+
+class Recurrence(BaseModel):
+    frequency: RecurrenceFrequency = Field(...)
+    # Every `interval` days or weeks
+    interval: int = Field(1, gt=0)
+    # Number of occurrences (including the first) or last day an occurrence may start, one of them is required
+    count: Optional[int] = Field(None, gt=0)
+    until: Optional[date] = None
+
+
 class Reservation(BaseModel):
     id: UUID = Field(...)
     type: ReservationType = Field(...)
@@ -30,6 +44,9 @@ class Reservation(BaseModel):
 
     returned: bool = Field(...)
 
+    # Set for the occurrences of a recurring reservation
+    series_id: Optional[UUID] = None
+
 
 class ReservationInWrite(BaseModel):
     type: ReservationType = Field(...)
@@ -45,6 +62,9 @@ class ReservationInWrite(BaseModel):
 
     items: List[UUID] = Field(...)
 
+    # Creates a series of reservations, start and end are those of the first occurrence
+    recurrence: Optional[Recurrence] = None
+
 
 class ReservationReturnItemState(BaseModel):
     item_id: UUID
@@ -54,3 +74,52 @@ class ReservationReturnItemState(BaseModel):
 
 class ReservationReturnInWrite(BaseModel):
     items: List[ReservationReturnItemState] = Field(...)
+
+
+class GroupReservationInWrite(BaseModel):
+    type: ReservationType = Field(...)
+    name: str = Field(...)
+
+    start: date = Field(...)
+    end: date = Field(...)
+
+    user_id: Optional[str] = None
+    team_id: Optional[str] = None
+
+    contact: str = Field(...)
+
+    # The server allocates `count` free items of the group
+    group_id: str = Field(...)
+    count: int = Field(..., gt=0)
+
+
+class GroupDayAvailability(BaseModel):
+    day: date = Field(...)
+    # Items of the group which can be reserved (not gone or bad)
+    total: int = Field(...)
+    available: int = Field(...)
+
+
+class FreeWindow(BaseModel):
+    # Any reservation of the requested duration within these (inclusive) days is possible
+    start: date = Field(...)
+    end: date = Field(...)
+
+
+class ReservationConflict(BaseModel):
+    reservation_id: UUID = Field(...)
+    # Only reported to the owner, the team, managers and admins
+    user_id: Optional[str] = None
+    team_id: Optional[str] = None
+    # Requested items which the reservation reserves
+    item_ids: List[UUID] = Field(...)
+    # Overlapping days
+    start: date = Field(...)
+    end: date = Field(...)
+
+
+class ReservationValidation(BaseModel):
+    valid: bool = Field(...)
+    # Requested items which do not exist
+    missing_items: List[UUID] = []
+    conflicts: List[ReservationConflict] = []
@@ -0,0 +1,22 @@
+from datetime import datetime
+from pydantic import Field
+from typing import Optional
+
+from .base import BaseModel
+
+
+class ScheduledJob(BaseModel):
+    id: str = Field(...)
+    completed_slot: datetime = Field(...)
+
+    lease_owner: Optional[str] = None
+    lease_until: Optional[datetime] = None
+
+    last_run_start: Optional[datetime] = None
+    last_run_duration: Optional[float] = None
+    last_run_error: Optional[str] = None
+    last_run_result: Optional[dict] = None
+
+    # Failed runs since the last completed slot, retried after `retry_after`
+    failed_attempts: int = 0
+    retry_after: Optional[datetime] = None
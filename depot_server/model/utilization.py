@@ -0,0 +1,21 @@
+from enum import Enum
+
+from pydantic import Field
+from typing import Optional
+
+from .base import BaseModel
+
+
+class UtilizationGroupBy(str, Enum):
+    Item = 'item'
+    Group = 'group'
+    Bay = 'bay'
+
+
+class Utilization(BaseModel):
+    # Item id, group id or bay id. None for items without group/bay.
+    key: Optional[str] = Field(...)
+    item_count: int = Field(...)
+    reserved_days: int = Field(...)
+    available_days: int = Field(...)
+    utilization: float = Field(...)
@@ -8,6 +8,12 @@ async def _clear_all():
     await collections.item_collection.delete_many({})
     await collections.item_state_collection.delete_many({})
     await collections.reservation_collection.delete_many({})
+    await collections.mail_outbox_collection.delete_many({})
+    await collections.item_utilization_collection.delete_many({})
+    await collections.cascade_job_collection.delete_many({})
+    await collections.scheduled_job_collection.delete_many(
+        {'_id': {'$nin': ['return_reservation_reminder', 'utilization_rebuild', 'item_reservation_status']}}
+    )
 
 
 def clear_all():
@@ -123,6 +123,12 @@ class AgnosticCollection(AgnosticBase):
     def find(self, *args, **kwargs):
         return AsyncIOMotorCursor(self.delegate.find(*args, **kwargs))
 
+    def aggregate(self, *args, **kwargs):
+        return AsyncIOMotorCursor(self.delegate.aggregate(*args, **kwargs))
+
+    def list_indexes(self, *args, **kwargs):
+        return AsyncIOMotorCursor(self.delegate.list_indexes(*args, **kwargs))
+
 
 class AgnosticCursorBase(AgnosticBase):
 
@@ -257,8 +263,8 @@ AsyncIOMotorGridOut = motor.motor_asyncio.create_asyncio_class(AgnosticGridOut)
 AsyncIOMotorGridOutCursor = motor.motor_asyncio.create_asyncio_class(AgnosticGridOutCursor)
 
 
-@pytest.fixture()
-def motor_mock():
+def patch_motor() -> MonkeyPatch:
+    """Replaces the motor client classes by the mongomock based stand-ins. Undo with `.undo()`."""
     mp = MonkeyPatch()
     import motor.motor_asyncio
     mp.setattr(motor.motor_asyncio, 'AsyncIOMotorClient', AsyncIOMotorClient)
@@ -270,6 +276,11 @@ def motor_mock():
     mp.setattr(motor.motor_asyncio, 'AsyncIOMotorGridIn', AsyncIOMotorGridIn)
     mp.setattr(motor.motor_asyncio, 'AsyncIOMotorGridOut', AsyncIOMotorGridOut)
     mp.setattr(motor.motor_asyncio, 'AsyncIOMotorGridOutCursor', AsyncIOMotorGridOutCursor)
+    return mp
 
+
+@pytest.fixture()
+def motor_mock():
+    mp = patch_motor()
     yield
     mp.undo()
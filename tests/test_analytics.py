@@ -0,0 +1,139 @@
+import asyncio
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+from fastapi.testclient import TestClient
+
+from depot_server.api import app
+from depot_server.db import collections
+from depot_server.helper import utilization
+from depot_server.helper.auth import Authentication
+from depot_server.helper.util import utc_now
+from depot_server.model import ReservationInWrite, Reservation, ItemCondition, Item, ReservationType, \
+    ReportItemInWrite, TotalReportState, Utilization, ScheduledJob
+from tests.db_helper import clear_all
+from tests.mock_auth import MockAuthentication, MockAuth
+
+
+def _utilization(client: TestClient, start: date, end: date, group_by: str) -> Dict[Optional[str], Utilization]:
+    resp = client.get(
+        '/api/v1/depot/analytics/utilization',
+        params={'start': start.isoformat(), 'end': end.isoformat(), 'group_by': group_by},
+        auth=MockAuth(sub='manager1', roles=['manager']),
+    )
+    assert resp.status_code == 200, resp.text
+    return {utilization.key: utilization for utilization in (Utilization.validate(row) for row in resp.json())}
+
+
+def test_utilization(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+
+        item_ids = []
+        for i in range(3):
+            create_item = ReportItemInWrite(
+                external_id=f'item_{i}',
+                name=f"Item {i}",
+                total_report_state=TotalReportState.Fit,
+                condition=ItemCondition.Good,
+                group_id='group_1' if i < 2 else None,
+                tags=[],
+                change_comment="Created",
+                report=[],
+            )
+            resp = client.post(
+                '/api/v1/depot/items', data=create_item.json(), auth=MockAuth(sub='admin1', roles=['admin']),
+            )
+            assert resp.status_code == 201, resp.text
+            item_ids.append(Item.validate(resp.json()).id)
+
+        # Spans a month boundary
+        start = date(2030, 1, 30)
+        create_reservation = ReservationInWrite(
+            type=ReservationType.PRIVATE,
+            name="My Reservation",
+            start=start,
+            end=start + timedelta(days=4),
+            contact="12345",
+            items=item_ids[:2],
+        )
+        resp = client.post(
+            '/api/v1/depot/reservations', data=create_reservation.json(), auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 201, resp.text
+        reservation = Reservation.validate(resp.json())
+
+        end = date(2030, 2, 28)
+        by_item = _utilization(client, start, end, 'item')
+        assert by_item[str(item_ids[0])].reserved_days == 5
+        assert by_item[str(item_ids[0])].available_days == 30
+        assert by_item[str(item_ids[2])].reserved_days == 0
+
+        # Shrink the reservation and move one item
+        create_reservation.end = start + timedelta(days=1)
+        create_reservation.items = item_ids[1:]
+        resp = client.put(
+            f'/api/v1/depot/reservations/{reservation.id}',
+            data=create_reservation.json(),
+            auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        by_group = _utilization(client, start, end, 'group')
+        assert by_group['group_1'].item_count == 2
+        assert by_group['group_1'].reserved_days == 2
+        assert by_group['group_1'].utilization == 2 / 60
+        assert by_group[None].reserved_days == 2
+        # Only the part in the range is counted
+        assert _utilization(client, start + timedelta(days=1), end, 'item')[str(item_ids[1])].reserved_days == 1
+
+        # Rebuilding yields the same rollups
+        loop = asyncio.get_event_loop()
+        rollups = loop.run_until_complete(_rollups())
+        loop.run_until_complete(collections.item_utilization_collection.update_many({}, {'$set': {'days': []}}))
+        resp = client.post('/api/v1/depot/analytics/utilization/rebuild', auth=MockAuth(sub='user1'))
+        assert resp.status_code == 403, resp.text
+        resp = client.post(
+            '/api/v1/depot/analytics/utilization/rebuild', auth=MockAuth(sub='admin1', roles=['admin'])
+        )
+        # The rebuild runs in the background, the caller polls the scheduled job
+        assert resp.status_code == 202, resp.text
+        triggered = ScheduledJob.validate(resp.json())
+        assert triggered.id == 'utilization_rebuild'
+        for _ in range(100):
+            resp = client.get(
+                '/api/v1/depot/scheduler/jobs/utilization_rebuild', auth=MockAuth(sub='admin1', roles=['admin'])
+            )
+            assert resp.status_code == 200, resp.text
+            job = ScheduledJob.validate(resp.json())
+            if job.completed_slot > triggered.completed_slot:
+                break
+            loop.run_until_complete(asyncio.sleep(0.01))
+        assert job.completed_slot > triggered.completed_slot
+        assert job.last_run_result['removed_rollups'] == 3
+        assert loop.run_until_complete(_rollups()) == {key: days for key, days in rollups.items() if days}
+
+        # A rollup which was updated incrementally while the rebuild ran is not overwritten or removed
+        monkeypatch.setattr(utilization, '_rebuild_batch_size', 1)
+        concurrent_id = next(key for key, days in rollups.items() if days)
+        loop.run_until_complete(collections.item_utilization_collection.update_one(
+            {'_id': concurrent_id}, {'$set': {'days': [1], 'updated_at': utc_now() + timedelta(minutes=1)}}
+        ))
+        stats = loop.run_until_complete(utilization.task_rebuild_utilization())
+        assert stats['items'] == 3
+        assert stats['removed_rollups'] == 0
+        assert loop.run_until_complete(_rollups())[concurrent_id] == [1]
+
+        resp = client.delete(
+            f'/api/v1/depot/reservations/{reservation.id}', auth=MockAuth(sub='admin1', roles=['admin'])
+        )
+        assert resp.status_code == 200, resp.text
+        assert _utilization(client, start, end, 'bay')[None].reserved_days == 0
+
+
+async def _rollups():
+    return {
+        rollup.id: sorted(rollup.days)
+        async for rollup in collections.item_utilization_collection.find({})
+    }
@@ -1,8 +1,13 @@
+import asyncio
+
 from fastapi.testclient import TestClient
 
 from depot_server.api import app
+from depot_server.config import config
+from depot_server.db import collections
 from depot_server.helper.auth import Authentication
-from depot_server.model import BayInWrite, Bay
+from depot_server.model import BayInWrite, Bay, CascadeJob, CascadeKind, CascadeJobState, ReportItemInWrite, \
+    ItemCondition, TotalReportState
 from tests.db_helper import clear_all
 from tests.mock_auth import MockAuthentication, MockAuth
 
@@ -47,3 +52,52 @@ def test_bay(monkeypatch, motor_mock):
         resp = client.get('/api/v1/depot/bays', auth=MockAuth(sub='user1'))
         assert resp.status_code == 200, resp.text
         assert len(resp.json()) == 0
+
+
+def test_delete_bay_cascade(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+    # Multiple batches
+    monkeypatch.setattr(config.cascade, 'batch_size', 2)
+
+    with TestClient(app) as client:
+        clear_all()
+
+        resp = client.post(
+            '/api/v1/depot/bays', data=BayInWrite(name="Bay 1").json(), auth=MockAuth(sub='admin1', roles=['admin']),
+        )
+        assert resp.status_code == 201, resp.text
+        bay = Bay.validate(resp.json())
+        for idx in range(5):
+            resp = client.post(
+                '/api/v1/depot/items',
+                data=ReportItemInWrite(
+                    name=f"Item {idx}", condition=ItemCondition.Good, bay_id=bay.id, change_comment="Create",
+                    total_report_state=TotalReportState.Fit, report=[],
+                ).json(),
+                auth=MockAuth(sub='admin1', roles=['admin']),
+            )
+            assert resp.status_code == 201, resp.text
+
+        resp = client.delete(f'/api/v1/depot/bays/{bay.id}', auth=MockAuth(sub='admin1', roles=['admin']))
+        assert resp.status_code == 200, resp.text
+        job = CascadeJob.validate(resp.json())
+        assert job.kind == CascadeKind.Bay
+        assert job.target_id == bay.id
+
+        async def wait_done():
+            for _ in range(100):
+                db_job = await collections.cascade_job_collection.find_one({'_id': job.id})
+                if db_job.state not in (CascadeJobState.Pending, CascadeJobState.Running):
+                    return
+                await asyncio.sleep(0.01)
+
+        asyncio.get_event_loop().run_until_complete(wait_done())
+        resp = client.get(f'/api/v1/depot/cascade-jobs/{job.id}', auth=MockAuth(sub='admin1', roles=['admin']))
+        assert resp.status_code == 200, resp.text
+        job = CascadeJob.validate(resp.json())
+        assert job.state == CascadeJobState.Done
+        assert job.processed == 5
+
+        resp = client.get('/api/v1/depot/items', auth=MockAuth(sub='user1'))
+        assert resp.status_code == 200, resp.text
+        assert [item['bayId'] for item in resp.json()] == [None] * 5
@@ -0,0 +1,68 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse, StreamingResponse, Response
+
+from depot_server.api.compression import CompressionMiddleware, _accepted_encodings
+
+_app = FastAPI()
+_app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+
+@_app.get('/small')
+async def _small():
+    return PlainTextResponse("small")
+
+
+@_app.get('/large')
+async def _large():
+    return PlainTextResponse("large " * 100)
+
+
+@_app.get('/picture')
+async def _picture():
+    return Response(b'\x89PNG' + bytes(1000), media_type='image/png')
+
+
+@_app.get('/stream')
+async def _stream():
+    async def chunks():
+        for idx in range(10):
+            yield f"chunk {idx} ".encode() * 10
+
+    return StreamingResponse(chunks(), media_type='text/plain')
+
+
+def test_accepted_encodings():
+    assert _accepted_encodings('gzip;q=0.5, br;q=0, identity') == ['gzip', 'identity']
+
+
+def test_compression():
+    with TestClient(_app) as client:
+        resp = client.get('/small', headers={'accept-encoding': 'gzip'})
+        assert resp.status_code == 200, resp.text
+        assert 'content-encoding' not in resp.headers
+        assert resp.text == "small"
+
+        resp = client.get('/large', headers={'accept-encoding': 'gzip'})
+        assert resp.status_code == 200, resp.text
+        assert resp.headers['content-encoding'] == 'gzip'
+        assert resp.headers['vary'] == 'Accept-Encoding'
+        assert int(resp.headers['content-length']) < 100
+        assert resp.text == "large " * 100
+
+        resp = client.get('/large', headers={'accept-encoding': 'identity'})
+        assert 'content-encoding' not in resp.headers
+        assert resp.text == "large " * 100
+
+        # Pictures are already compressed
+        resp = client.get('/picture', headers={'accept-encoding': 'gzip'})
+        assert 'content-encoding' not in resp.headers
+        assert resp.content == b'\x89PNG' + bytes(1000)
+
+        resp = client.get('/stream', headers={'accept-encoding': 'gzip'}, stream=True)
+        assert resp.headers['content-encoding'] == 'gzip'
+        assert 'content-length' not in resp.headers
+        raw = resp.raw.read(decode_content=False)
+        assert gzip.decompress(raw).decode() == ''.join(f"chunk {idx} " * 10 for idx in range(10))
@@ -0,0 +1,23 @@
+import pytest
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from depot_server.config import config
+from depot_server.config.config import MongoReadConfig
+from depot_server.db.connection import _client_options, _read_preference
+
+
+def test_client_options(monkeypatch):
+    monkeypatch.setattr(config.mongo, 'max_pool_size', 50)
+    monkeypatch.setattr(config.mongo, 'wait_queue_timeout', 2.5)
+    monkeypatch.setattr(config.mongo, 'compressors', ['zstd', 'snappy'])
+    assert _client_options() == {'maxPoolSize': 50, 'waitQueueTimeoutMS': 2500, 'compressors': 'zstd,snappy'}
+
+
+def test_read_preference():
+    assert _read_preference(MongoReadConfig()) == Primary()
+    assert _read_preference(MongoReadConfig(read_preference='secondaryPreferred', max_staleness=120)) == \
+        SecondaryPreferred(max_staleness=120)
+    with pytest.raises(ValueError):
+        _read_preference(MongoReadConfig(max_staleness=120))
+    with pytest.raises(ValueError):
+        _read_preference(MongoReadConfig(read_preference='secondaries'))
@@ -0,0 +1,141 @@
+import asyncio
+import json
+from datetime import date
+from uuid import uuid4, UUID
+
+from fastapi.testclient import TestClient
+
+from depot_server.api import app
+from depot_server.api.events import format_event
+from depot_server.config import config
+from depot_server.db import DbReservation
+from depot_server.helper.auth import Authentication
+from depot_server.helper.change_feed import change_feed, _change_stream_event
+from depot_server.model import ReportItemInWrite, ItemCondition, TotalReportState, ChangeEventType, ReservationType, \
+    BayInWrite, ReservationInWrite
+from tests.db_helper import clear_all
+from tests.mock_auth import MockAuthentication, MockAuth
+
+
+def test_item_events(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+    monkeypatch.setattr(config.events, 'queue_size', 2)
+
+    with TestClient(app) as client:
+        clear_all()
+        assert not change_feed.uses_change_stream
+        subscription = change_feed.subscribe()
+        other_item_subscription = change_feed.subscribe(item_id=uuid4())
+
+        resp = client.post(
+            '/api/v1/depot/items',
+            data=ReportItemInWrite(
+                name="Item 1", condition=ItemCondition.Good, change_comment="Create",
+                total_report_state=TotalReportState.Fit, report=[],
+            ).json(),
+            auth=MockAuth(sub='admin1', roles=['admin']),
+        )
+        assert resp.status_code == 201, resp.text
+        item_id = resp.json()['id']
+
+        event = subscription.queue.get_nowait()
+        assert event.type == ChangeEventType.ItemCreated
+        assert str(event.id) == item_id
+        assert event.item.name == "Item 1"
+        assert other_item_subscription.queue.empty()
+        message = format_event(event).decode()
+        assert message.startswith('event: item_created\ndata: ')
+        assert json.loads(message.split('data: ', 1)[1])['item']['id'] == item_id
+
+        resp = client.delete(f'/api/v1/depot/items/{item_id}', auth=MockAuth(sub='admin1', roles=['admin']))
+        assert resp.status_code == 200, resp.text
+        resp = client.delete(f'/api/v1/depot/items/{item_id}', auth=MockAuth(sub='admin1', roles=['admin']))
+        assert resp.status_code == 404, resp.text
+        assert subscription.queue.get_nowait().type == ChangeEventType.ItemDeleted
+        assert subscription.queue.empty()
+
+        # The client does not keep up
+        subscription.queue.put_nowait(event)
+        subscription.queue.put_nowait(event)
+        change_feed.publish(_change_stream_event({
+            'ns': {'coll': 'item'}, 'operationType': 'delete', 'documentKey': {'_id': uuid4()},
+        }))
+        assert subscription.overflowed
+        assert subscription.queue.get_nowait().type == ChangeEventType.ItemCreated
+        assert subscription.queue.get_nowait().type == ChangeEventType.Overflow
+        change_feed.unsubscribe(subscription)
+        change_feed.unsubscribe(other_item_subscription)
+
+
+def test_bulk_item_events(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+        loop = asyncio.get_event_loop()
+
+        resp = client.post(
+            '/api/v1/depot/bays', data=BayInWrite(name="Bay 1").json(), auth=MockAuth(sub='admin1', roles=['admin']),
+        )
+        assert resp.status_code == 201, resp.text
+        bay_id = UUID(resp.json()['id'])
+        resp = client.post(
+            '/api/v1/depot/items',
+            data=ReportItemInWrite(
+                name="Item 1", condition=ItemCondition.Good, bay_id=bay_id, change_comment="Create",
+                total_report_state=TotalReportState.Fit, report=[],
+            ).json(),
+            auth=MockAuth(sub='admin1', roles=['admin']),
+        )
+        assert resp.status_code == 201, resp.text
+        item_id = UUID(resp.json()['id'])
+        item_subscription = change_feed.subscribe(item_id=item_id)
+        bay_subscription = change_feed.subscribe(bay_id=bay_id)
+
+        # The reservation status written for the reserved items
+        resp = client.post(
+            '/api/v1/depot/reservations',
+            data=ReservationInWrite(
+                type=ReservationType.PRIVATE, name="Reservation", start=date.today(), end=date.today(),
+                contact="12345", items=[item_id],
+            ).json(),
+            auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 201, resp.text
+        reservation_id = UUID(resp.json()['id'])
+        events = [item_subscription.queue.get_nowait() for _ in range(2)]
+        assert sorted(event.type.value for event in events) == sorted(
+            [ChangeEventType.ReservationCreated.value, ChangeEventType.ItemUpdated.value]
+        )
+        item_updated = next(event for event in events if event.type == ChangeEventType.ItemUpdated)
+        assert item_updated.item.current_reservation_id == reservation_id
+        assert bay_subscription.queue.get_nowait().type == ChangeEventType.ItemUpdated
+
+        # The cascade of a deleted bay reaches the subscriptions of the bay
+        resp = client.delete(f'/api/v1/depot/bays/{bay_id}', auth=MockAuth(sub='admin1', roles=['admin']))
+        assert resp.status_code == 200, resp.text
+
+        async def wait_event():
+            return await asyncio.wait_for(bay_subscription.queue.get(), 1)
+
+        event = loop.run_until_complete(wait_event())
+        assert event.type == ChangeEventType.ItemUpdated
+        assert event.item.id == item_id
+        assert event.item.bay_id is None
+        change_feed.unsubscribe(item_subscription)
+        change_feed.unsubscribe(bay_subscription)
+
+
+def test_change_stream_event():
+    reservation = DbReservation(
+        id=uuid4(), type=ReservationType.PRIVATE, name="Reservation", start=date.today(), end=date.today(),
+        user_id='user1', contact="12345", items=[uuid4()], returned=True,
+    )
+    event = _change_stream_event({
+        'ns': {'coll': 'reservation'}, 'operationType': 'replace', 'documentKey': {'_id': reservation.id},
+        'fullDocument': reservation.document(),
+    })
+    assert event.event.type == ChangeEventType.ReservationReturned
+    assert event.event.reservation.id == reservation.id
+    assert event.user_id == 'user1'
+    assert event.item_ids == reservation.items
@@ -0,0 +1,41 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from pymongo import ASCENDING, DESCENDING
+
+from depot_server.api import app
+from depot_server.db import collections
+from depot_server.model import Readiness, IndexBuildState
+
+
+def test_health(motor_mock):
+    with TestClient(app) as client:
+        resp = client.get('/healthz')
+        assert resp.status_code == 200, resp.text
+
+        asyncio.get_event_loop().run_until_complete(collections.wait_for_indexes())
+        resp = client.get('/readyz')
+        assert resp.status_code == 200, resp.text
+        readiness = Readiness.validate(resp.json())
+        assert readiness.ready
+        assert readiness.mongo
+        assert {status.collection for status in readiness.indexes} >= {'item', 'item_state', 'reservation'}
+        assert all(status.state == IndexBuildState.Ready for status in readiness.indexes)
+
+
+def test_reconcile_indexes(motor_mock):
+    async def run():
+        collection = collections.reservation_collection
+        await collection.collection.drop_index('end_1_start_1')
+        # Same name, different definition
+        await collection.collection.drop_index('returned_1_end_1')
+        await collection.collection.create_index([('end', DESCENDING)], name='returned_1_end_1')
+        await collection.collection.create_index([('obsolete', ASCENDING)])
+        changes = await collection.reconcile_indexes()
+        assert sorted(changes['created']) == ['end_1_start_1', 'returned_1_end_1']
+        assert sorted(changes['dropped']) == ['obsolete_1', 'returned_1_end_1']
+        assert await collection.reconcile_indexes() == {'created': [], 'dropped': []}
+
+    with TestClient(app):
+        asyncio.get_event_loop().run_until_complete(collections.wait_for_indexes())
+        asyncio.get_event_loop().run_until_complete(run())
@@ -0,0 +1,62 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from depot_server.api import app
+from depot_server.config import config
+from depot_server.db import collections
+from depot_server.db.cache import report_profile_cache
+from depot_server.db.invalidation import invalidation_bus, InvalidationBus, MemoryInvalidationBackend
+from depot_server.helper.auth import Authentication
+from depot_server.model import ReportProfileInWrite, ReportProfile
+from tests.mock_auth import MockAuthentication, MockAuth
+
+
+def test_invalidation(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+    monkeypatch.setattr(config.invalidation, 'backend', 'memory')
+    loop = asyncio.get_event_loop()
+
+    with TestClient(app) as client:
+        assert isinstance(invalidation_bus.backend, MemoryInvalidationBackend)
+        # Another worker
+        other_bus = InvalidationBus()
+        received = []
+        other_bus.subscribe('reportProfile', received.append)
+        loop.run_until_complete(other_bus.startup(invalidation_bus.backend))
+        # Starting evicts everything
+        assert received == [None]
+        received.clear()
+
+        resp = client.post(
+            '/api/v1/depot/report-profiles',
+            data=ReportProfileInWrite(name="Prof1", description="Desc1", elements=[]).json(),
+            auth=MockAuth(sub='admin1', roles=['admin']),
+        )
+        assert resp.status_code == 201, resp.text
+        report_profile = ReportProfile.validate(resp.json())
+        assert received == [[report_profile.id]]
+
+        assert loop.run_until_complete(report_profile_cache.get(report_profile.id)).name == "Prof1"
+        resp = client.put(
+            f'/api/v1/depot/report-profiles/{report_profile.id}',
+            data=ReportProfileInWrite(name="Prof2", description="Desc1", elements=[]).json(),
+            auth=MockAuth(sub='admin1', roles=['admin']),
+        )
+        assert resp.status_code == 200, resp.text
+        assert received == [[report_profile.id], [report_profile.id]]
+        assert loop.run_until_complete(report_profile_cache.get(report_profile.id)).name == "Prof2"
+
+        # Written by the other worker (bypassing the local bus)
+        loop.run_until_complete(report_profile_cache.get(report_profile.id))
+        loop.run_until_complete(collections.report_profile_collection.collection.update_one(
+            {'_id': report_profile.id}, {'$set': {'name': "Prof3"}}
+        ))
+        assert loop.run_until_complete(report_profile_cache.get(report_profile.id)).name == "Prof2"
+        loop.run_until_complete(other_bus.publish('reportProfile', None))
+        assert loop.run_until_complete(report_profile_cache.get(report_profile.id)).name == "Prof3"
+
+        # Collections without caches publish nothing
+        assert not invalidation_bus.subscribed('item')
+
+        loop.run_until_complete(other_bus.shutdown())
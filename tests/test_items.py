@@ -1,16 +1,19 @@
 from datetime import date, timedelta
+from uuid import uuid4
 
 from fastapi.testclient import TestClient
 
 from depot_server.api import app
 from depot_server.helper.auth import Authentication
 from depot_server.model import ItemInWrite, Item, ItemCondition, ItemState, BayInWrite, Bay, TotalReportState, \
-    ReportItemInWrite, ReportState
+    ReportItemInWrite, ReportState, Batch
 from depot_server.model.item_state import ItemReport
 from tests.db_helper import clear_all
 from tests.mock_auth import MockAuthentication, MockAuth
 from tests.test_report import _create_report_profile
 
+_reservation_status = {'current_reservation_id', 'next_reservation_start', 'available_until'}
+
 
 def test_item(monkeypatch, motor_mock):
     monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
@@ -52,7 +55,8 @@ def test_item(monkeypatch, motor_mock):
         )
         assert resp.status_code == 201, resp.text
         created_item = Item.validate(resp.json())
-        assert created_item.dict(exclude={'id'}) == create_item.dict(exclude={'change_comment', 'report'})
+        assert created_item.dict(exclude={'id', *_reservation_status}) == \
+            create_item.dict(exclude={'change_comment', 'report'})
 
         resp = client.get('/api/v1/depot/items', auth=MockAuth(sub='user1'))
         assert resp.status_code == 200, resp.text
@@ -60,6 +64,13 @@ def test_item(monkeypatch, motor_mock):
         assert len(items) == 1
         assert items[0] == created_item
 
+        resp = client.get('/api/v1/depot/items', params={'fields': 'name,bayId'}, auth=MockAuth(sub='user1'))
+        assert resp.status_code == 200, resp.text
+        assert resp.json() == [{'id': str(created_item.id), 'name': "Item 1", 'bayId': str(created_bay_1.id)}]
+
+        resp = client.get('/api/v1/depot/items', params={'fields': 'name,unknown'}, auth=MockAuth(sub='user1'))
+        assert resp.status_code == 400, resp.text
+
         resp = client.get(f'/api/v1/depot/items/{created_item.id}', auth=MockAuth(sub='user1'))
         assert resp.status_code == 200, resp.text
         assert Item.validate(resp.json()) == created_item
@@ -84,7 +95,9 @@ def test_item(monkeypatch, motor_mock):
         )
         assert resp.status_code == 200, resp.text
         updated_item = Item.validate(resp.json())
-        assert updated_item.dict(exclude={'id', 'total_report_state', 'last_service'}) == update_item.dict(exclude={'change_comment'})
+        assert updated_item.dict(
+            exclude={'id', 'total_report_state', 'last_service', *_reservation_status}
+        ) == update_item.dict(exclude={'change_comment'})
 
         report_item = ReportItemInWrite(
             external_id='item_1_rprt',
@@ -113,7 +126,8 @@ def test_item(monkeypatch, motor_mock):
         )
         assert resp.status_code == 200, resp.text
         reported_item = Item.validate(resp.json())
-        assert reported_item.dict(exclude={'id'}) == report_item.dict(exclude={'change_comment', 'report'})
+        assert reported_item.dict(exclude={'id', *_reservation_status}) == \
+            report_item.dict(exclude={'change_comment', 'report'})
 
         resp = client.get(f'/api/v1/depot/items/{created_item.id}/history', auth=MockAuth(sub='user1'))
         assert resp.status_code == 200, resp.text
@@ -163,3 +177,40 @@ def test_item(monkeypatch, motor_mock):
         resp = client.get('/api/v1/depot/items', auth=MockAuth(sub='user1'))
         assert resp.status_code == 200, resp.text
         assert len(resp.json()) == 0
+
+
+def test_items_batch(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+
+        created_items = []
+        for name in ("Item 1", "Item 2", "Item 3"):
+            resp = client.post(
+                '/api/v1/depot/items',
+                data=ReportItemInWrite(
+                    name=name, condition=ItemCondition.Good, change_comment="Created",
+                    total_report_state=TotalReportState.Fit, report=[],
+                ).json(),
+                auth=MockAuth(sub='admin1', roles=['admin']),
+            )
+            assert resp.status_code == 201, resp.text
+            created_items.append(Item.validate(resp.json()))
+
+        missing_id = uuid4()
+        ids = [created_items[2].id, missing_id, created_items[0].id, created_items[2].id]
+        resp = client.get(
+            '/api/v1/depot/items/batch', params={'ids': [str(id) for id in ids]}, auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        batch = Batch[Item].validate(resp.json())
+        assert batch.results == [created_items[2], created_items[0]]
+        assert batch.missing == [missing_id]
+
+        resp = client.get(
+            '/api/v1/depot/items/batch', params={'ids': [str(created_items[1].id)], 'fields': 'name'},
+            auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        assert resp.json() == {'results': [{'id': str(created_items[1].id), 'name': "Item 2"}], 'missing': []}
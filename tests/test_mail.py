@@ -0,0 +1,329 @@
+import asyncio
+from datetime import date, timedelta
+from email import message_from_bytes
+from typing import List
+from uuid import uuid4
+
+import aiosmtplib
+from fastapi.testclient import TestClient
+
+from depot_server.api import app
+from depot_server.config import config
+from depot_server.db import DbReservation, DbItem, DbMailOutbox, collections
+from depot_server.helper.auth import Authentication
+from depot_server.helper.util import utc_now
+from depot_server.mail.mailer import Mail, Mailer, mailer
+from depot_server.mail.outbox import enqueue_notifications, Notification, outbox
+from depot_server.mail.smtp_pool import SmtpConnectionPool
+from depot_server.model import ReservationType, MailOutboxStats, MailOutboxState, ReservationReturnItemState
+from tests.db_helper import clear_all
+from tests.mock_auth import MockAuthentication, MockAuth
+
+
+class FakeSmtp:
+    instances: List['FakeSmtp'] = []
+
+    def __init__(self):
+        self.is_connected = False
+        self.sent: List[bytes] = []
+        self.drop_next = False
+        FakeSmtp.instances.append(self)
+
+    async def connect(self):
+        self.is_connected = True
+
+    async def sendmail(self, sender, recipients, message):
+        assert self.is_connected
+        if self.drop_next:
+            self.is_connected = False
+            raise aiosmtplib.SMTPServerDisconnected("Connection lost")
+        self.sent.append(message)
+
+    async def quit(self):
+        self.is_connected = False
+
+    def close(self):
+        self.is_connected = False
+
+
+def test_smtp_pool():
+    FakeSmtp.instances.clear()
+
+    async def run():
+        pool = SmtpConnectionPool(FakeSmtp, size=2, max_messages=3, idle_timeout=60)
+        # Sequential messages reuse one connection until the message cap is reached
+        for i in range(4):
+            await pool.send('sender@localhost', ['to@localhost'], f'msg {i}'.encode())
+        assert [len(smtp.sent) for smtp in FakeSmtp.instances] == [3, 1]
+        assert not FakeSmtp.instances[0].is_connected
+
+        # Dropped connections are reconnected transparently
+        FakeSmtp.instances[1].drop_next = True
+        await pool.send('sender@localhost', ['to@localhost'], b'msg reconnect')
+        assert len(FakeSmtp.instances) == 3
+        assert FakeSmtp.instances[2].sent == [b'msg reconnect']
+
+        # Concurrent sends are limited by the pool size
+        await asyncio.gather(*[
+            pool.send('sender@localhost', ['to@localhost'], f'msg batch {i}'.encode()) for i in range(6)
+        ])
+        assert sum(len(smtp.sent) for smtp in FakeSmtp.instances) == 11
+        assert sum(smtp.is_connected for smtp in FakeSmtp.instances) <= 2
+
+        await pool.close()
+        assert not any(smtp.is_connected for smtp in FakeSmtp.instances)
+
+    asyncio.get_event_loop().run_until_complete(run())
+
+
+def _reservation() -> DbReservation:
+    return DbReservation(
+        id=uuid4(),
+        type=ReservationType.PRIVATE,
+        name="My Reservation",
+        start=date.today() - timedelta(days=3),
+        end=date.today() - timedelta(days=1),
+        user_id='user1',
+        contact="12345",
+        items=[],
+    )
+
+
+def test_render_mail():
+    test_mailer = Mailer()
+    test_mailer.preload_templates()
+    assert ('en_us', 'return_reservation_reminder.html') in test_mailer.templates
+    assert ('en_us', 'return_reservation_reminder.txt') in test_mailer.templates
+
+    reservation = _reservation()
+    data = test_mailer._build_message(
+        'de_de', 'return_reservation_reminder', {'user': {'name': "User 1"}, 'reservation': reservation}
+    )
+    # Unknown languages fall back to en_us and are cached under the requested language
+    assert test_mailer.templates[('de_de', 'return_reservation_reminder.txt')] is \
+        test_mailer.templates[('en_us', 'return_reservation_reminder.txt')]
+    message = message_from_bytes(data)
+    assert message['Subject'] == "Please Return Reservation"
+    assert str(reservation.id) in message.get_payload()[1].get_payload()
+
+
+async def _wait_sent(count: int):
+    for _ in range(200):
+        if await collections.mail_outbox_collection.count_documents({'state': MailOutboxState.Sent.value}) == count:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_outbox(monkeypatch, motor_mock):
+    from depot_server.mail import reservation_item_removed
+
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+    monkeypatch.setattr(config.mail, 'outbox_retry_backoff', 0)
+    monkeypatch.setattr(config.mail, 'outbox_poll_interval', 0.01)
+    sent = []
+    fail_once = {'fail@localhost', 'user3'}
+
+    async def async_send_message(to: str, message: bytes):
+        if to in fail_once:
+            fail_once.remove(to)
+            raise aiosmtplib.SMTPServerDisconnected("Connection lost")
+        sent.append(to)
+
+    async def get_profile(user_id: str):
+        if user_id in fail_once:
+            fail_once.remove(user_id)
+            raise RuntimeError("Profile not available")
+        return {'sub': user_id, 'name': user_id, 'email': f'{user_id}@localhost'}
+
+    monkeypatch.setattr(mailer, 'async_send_message', async_send_message)
+    monkeypatch.setattr(reservation_item_removed, 'get_profile', get_profile)
+
+    with TestClient(app) as client:
+        clear_all()
+
+        reservation = _reservation()
+        reservation.user_id = 'user3'
+        item = DbItem(id=uuid4(), external_id='item_1', name="Item 1")
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(collections.reservation_collection.insert_one(reservation))
+        loop.run_until_complete(collections.item_collection.insert_one(item))
+        loop.run_until_complete(enqueue_notifications([
+            Notification('return_reservation_reminder', {
+                'user': {'name': "User", 'email': to}, 'reservation_id': reservation.id,
+            })
+            for to in ['user1@localhost', 'user2@localhost', 'fail@localhost']
+        ]))
+        loop.run_until_complete(reservation_item_removed.send_reservation_item_removed(
+            {'sub': 'manager1', 'name': "Manager 1", 'roles': ['manager']}, item, [reservation.id]
+        ))
+
+        loop.run_until_complete(_wait_sent(4))
+        assert sorted(sent) == ['fail@localhost', 'user1@localhost', 'user2@localhost', 'user3@localhost']
+        # Failed sends and failed profile fetches are retried
+        for retried_to in ('fail@localhost', 'user3@localhost'):
+            retried = loop.run_until_complete(
+                collections.mail_outbox_collection.find_one({'sent_to': retried_to})
+            )
+            assert retried is not None
+            assert retried.attempts == 2
+            assert retried.last_error is not None
+
+        resp = client.get('/api/v1/depot/mail-outbox/stats', auth=MockAuth(sub='user1'))
+        assert resp.status_code == 403, resp.text
+        resp = client.get('/api/v1/depot/mail-outbox/stats', auth=MockAuth(sub='admin1', roles=['admin']))
+        assert resp.status_code == 200, resp.text
+        stats = MailOutboxStats.validate(resp.json())
+        assert stats.pending == 0
+        assert stats.failed == 0
+        assert stats.sent_total >= 4
+        assert stats.retried_total >= 1
+
+
+def test_outbox_lease_lost(monkeypatch, motor_mock):
+    sent = []
+
+    async def resolve(params: dict):
+        return [Mail(None, 'return_reservation_reminder', to, {}) for to in params['to']]
+
+    async def async_build_message(language, name, context):
+        return b''
+
+    async def async_send_message(to: str, message: bytes):
+        sent.append(to)
+        if to == 'user1@localhost':
+            # The send took longer than the lease, another worker took the notification over
+            await collections.mail_outbox_collection.update_one(
+                {'_id': job.id}, {'$set': {'lease_owner': 'worker2', 'lease_until': utc_now() + timedelta(minutes=1)}}
+            )
+
+    monkeypatch.setitem(outbox._resolvers, 'test_lease_lost', resolve)
+    monkeypatch.setattr(mailer, 'async_build_message', async_build_message)
+    monkeypatch.setattr(mailer, 'async_send_message', async_send_message)
+
+    with TestClient(app):
+        clear_all()
+        loop = asyncio.get_event_loop()
+        now = utc_now()
+        job = DbMailOutbox(
+            id=uuid4(),
+            name='test_lease_lost',
+            params={'to': ['user0@localhost', 'user1@localhost', 'user2@localhost']},
+            state=MailOutboxState.Sending,
+            attempts=1,
+            created=now,
+            next_attempt=now,
+            lease_owner='worker1',
+            lease_until=now + timedelta(minutes=1),
+        )
+        loop.run_until_complete(collections.mail_outbox_collection.insert_one(job))
+        retried_total = outbox.retried_total
+
+        loop.run_until_complete(outbox._process('worker1', job))
+        # The worker stops sending after it lost the lease and leaves the notification to the new owner
+        assert sent == ['user0@localhost', 'user1@localhost']
+        db_job = loop.run_until_complete(collections.mail_outbox_collection.find_one({'_id': job.id}))
+        assert db_job.state == MailOutboxState.Sending
+        assert db_job.lease_owner == 'worker2'
+        assert db_job.sent_to == ['user0@localhost']
+        assert outbox.retried_total == retried_total
+
+
+def test_reminder_mail(monkeypatch, motor_mock):
+    from depot_server.mail import return_reservation_mail
+
+    profile_requests = []
+
+    async def get_profiles_by_id(user_ids):
+        profile_requests.append(set(user_ids))
+        # user3 has no email, user4 has no profile
+        return {
+            user_id: {'sub': user_id, 'name': user_id, 'email': None if user_id == 'user3' else f'{user_id}@localhost'}
+            for user_id in user_ids if user_id != 'user4'
+        }
+
+    monkeypatch.setattr(return_reservation_mail, 'get_profiles_by_id', get_profiles_by_id)
+    monkeypatch.setattr(return_reservation_mail, '_batch_size', 4)
+    monkeypatch.setattr(mailer, 'async_send_message', lambda to, message: asyncio.sleep(0))
+
+    with TestClient(app):
+        clear_all()
+        loop = asyncio.get_event_loop()
+
+        reservations = []
+        for i, user_id in enumerate(['user1', 'user2', 'user1', 'user3', 'user4', 'user1', 'user2']):
+            reservation = _reservation()
+            reservation.user_id = user_id
+            reservations.append(reservation)
+        returned = _reservation()
+        returned.returned = True
+        not_expired = _reservation()
+        not_expired.end = date.today()
+        loop.run_until_complete(
+            collections.reservation_collection.insert_many(reservations + [returned, not_expired])
+        )
+
+        stats = loop.run_until_complete(return_reservation_mail.task_send_reminder_mail())
+        assert stats['reservations'] == 7
+        assert stats['mails'] == 5
+        assert stats['missing_emails'] == 1
+        assert stats['missing_users'] == 1
+        # Every user is only requested once
+        assert sum(len(request) for request in profile_requests) == 4
+        assert loop.run_until_complete(collections.mail_outbox_collection.count_documents({})) == 5
+
+
+def test_manager_item_problem(monkeypatch, motor_mock):
+    from depot_server.helper import manager_roster as manager_roster_module
+    from depot_server.mail.manager_item_problem import send_manager_item_problem
+
+    profile_requests = []
+
+    async def get_profiles():
+        profile_requests.append(1)
+        return [
+            {'sub': 'manager1', 'name': "Manager 1", 'roles': ['manager'], 'email': 'manager1@localhost'},
+            {'sub': 'manager2', 'name': "Manager 2", 'roles': ['manager'], 'email': 'manager2@localhost',
+             'locale': 'de_de'},
+            {'sub': 'manager3', 'name': "Manager 3", 'roles': ['manager']},
+            {'sub': 'user1', 'name': "User 1", 'roles': [], 'email': 'user1@localhost'},
+        ]
+
+    rendered = []
+    render_fragments = mailer.async_render_fragments
+
+    async def async_render_fragments(language, name, context):
+        rendered.append((language, name))
+        return await render_fragments(language, name, context)
+
+    monkeypatch.setattr(manager_roster_module, 'get_profiles', get_profiles)
+    monkeypatch.setattr(mailer, 'async_render_fragments', async_render_fragments)
+    sent = []
+
+    async def async_send_message(to: str, message: bytes):
+        sent.append((to, message))
+
+    monkeypatch.setattr(mailer, 'async_send_message', async_send_message)
+    monkeypatch.setattr(config.mail, 'outbox_poll_interval', 0.01)
+
+    with TestClient(app):
+        clear_all()
+        loop = asyncio.get_event_loop()
+
+        item = DbItem(id=uuid4(), external_id='item_1', name="Item 1")
+        reservation = _reservation()
+        loop.run_until_complete(collections.item_collection.insert_one(item))
+        loop.run_until_complete(collections.reservation_collection.insert_one(reservation))
+        problem_items = [ReservationReturnItemState(item_id=item.id, problem=True, comment="Broken")]
+        for _ in range(2):
+            loop.run_until_complete(send_manager_item_problem({'name': "User 1"}, problem_items, reservation))
+        # Only a small record is enqueued, the roster is read by the outbox worker
+        assert not profile_requests
+
+        loop.run_until_complete(_wait_sent(2))
+        # The directory is read once, the item list is rendered once per language and broadcast
+        assert len(profile_requests) == 1
+        assert rendered == [('en_us', 'manager_item_problem_items')] * 2
+        assert sorted(to for to, _ in sent) == ['manager1@localhost', 'manager1@localhost',
+                                                'manager2@localhost', 'manager2@localhost']
+        message = message_from_bytes(sent[0][1])
+        assert "Item 1 (item_1" in message.get_payload()[1].get_payload()
@@ -0,0 +1,61 @@
+from typing import Dict
+
+from fastapi.testclient import TestClient
+
+from depot_server.api import app
+from depot_server.helper.auth import Authentication
+from depot_server.helper.metrics import Histogram
+from tests.db_helper import clear_all
+from tests.mock_auth import MockAuthentication, MockAuth
+
+
+def test_histogram():
+    histogram = Histogram('test_seconds', "Test.", ('label',), buckets=(0.1, 1))
+    child = histogram.labels('a"b')
+    assert histogram.labels('a"b') is child
+    for value in (0.05, 0.1, 0.5, 2):
+        child.observe(value)
+    assert list(histogram.render()) == [
+        '# HELP test_seconds Test.',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{label="a\\"b",le="0.1"} 2',
+        'test_seconds_bucket{label="a\\"b",le="1.0"} 3',
+        'test_seconds_bucket{label="a\\"b",le="+Inf"} 4',
+        'test_seconds_sum{label="a\\"b"} 2.65',
+        'test_seconds_count{label="a\\"b"} 4',
+    ]
+
+
+def _samples(client: TestClient) -> Dict[str, float]:
+    resp = client.get('/metrics')
+    assert resp.status_code == 200, resp.text
+    return {
+        sample: float(value)
+        for sample, value in (line.rsplit(' ', 1) for line in resp.text.splitlines() if not line.startswith('#'))
+    }
+
+
+def test_metrics(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+
+        items_ok = 'depot_http_requests_total{method="GET",route="/api/v1/depot/items",status="2xx"}'
+        item_invalid = 'depot_http_requests_total{method="GET",route="/api/v1/depot/items/{item_id}",status="4xx"}'
+        items_count = 'depot_http_request_duration_seconds_count{method="GET",route="/api/v1/depot/items"}'
+        item_finds = 'depot_mongo_operation_duration_seconds_count{collection="item",operation="find"}'
+        before = _samples(client)
+
+        resp = client.get('/api/v1/depot/items', auth=MockAuth(sub='user1'))
+        assert resp.status_code == 200, resp.text
+        resp = client.get('/api/v1/depot/items/not-an-id', auth=MockAuth(sub='user1'))
+        assert resp.status_code == 422, resp.text
+
+        after = _samples(client)
+        assert after[items_ok] == before[items_ok] + 1
+        assert after[item_invalid] == before[item_invalid] + 1
+        assert after[items_count] == before[items_count] + 1
+        assert after[item_finds] == before.get(item_finds, 0) + 1
+        # The metrics request itself
+        assert after['depot_http_requests_in_flight'] == 1
@@ -0,0 +1,70 @@
+import asyncio
+from datetime import timedelta
+
+from pymongo.monitoring import CommandStartedEvent, CommandSucceededEvent
+
+from depot_server.config import config
+from depot_server.db import connection
+from depot_server.db.monitoring import CommandMonitor, current_operation, filter_shape, mongo_collscans, \
+    mongo_slow_commands
+
+
+def test_filter_shape():
+    assert filter_shape({'returned': False, 'end': {'$lt': 737000}, '$or': [{'a': 1}, {'b': {'$in': [1, 2]}}]}) == {
+        'returned': 1, 'end': {'$lt': 1}, '$or': [{'a': 1}, {'b': {'$in': 1}}],
+    }
+
+
+class _FakeDb:
+    def __init__(self):
+        self.commands = []
+
+    async def command(self, command: dict):
+        self.commands.append(command)
+        return {'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'COLLSCAN'}}}}
+
+
+def test_slow_command(monkeypatch, capsys):
+    monkeypatch.setattr(config.mongo, 'slow_command_threshold', 0.1)
+    monkeypatch.setattr(config.mongo, 'explain_slow_commands', True)
+    fake_db = _FakeDb()
+    monkeypatch.setattr(connection, 'async_db', fake_db)
+    monitor = CommandMonitor()
+    command = {'find': 'reservation', 'filter': {'returned': False, 'end': 737000}, 'lsid': {'id': 1}, '$db': 'depot'}
+
+    def run_command(request_id: int, duration: float):
+        monitor.started(CommandStartedEvent(command, 'depot', request_id, ('localhost', 27017), request_id))
+        monitor.succeeded(CommandSucceededEvent(
+            timedelta(seconds=duration), {'ok': 1}, 'find', request_id, ('localhost', 27017), request_id
+        ))
+
+    slow_commands = mongo_slow_commands.labels('find', 'reservation', 'job:reminder')
+    collscans = mongo_collscans.labels('reservation')
+    slow_count = slow_commands.value
+    collscan_count = collscans.value
+
+    async def run():
+        monitor.startup()
+        token = current_operation.set({'job': 'reminder'})
+        try:
+            run_command(1, 0.01)
+            run_command(2, 0.5)
+            # Same shape is only explained once
+            run_command(3, 0.5)
+        finally:
+            current_operation.reset(token)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        monitor.shutdown()
+
+    asyncio.get_event_loop().run_until_complete(run())
+    assert slow_commands.value == slow_count + 2
+    assert collscans.value == collscan_count + 1
+    assert fake_db.commands == [{
+        'explain': {'find': 'reservation', 'filter': {'returned': False, 'end': 737000}},
+        'verbosity': 'queryPlanner',
+    }]
+    output = capsys.readouterr().out
+    assert 'Slow Mongo command find on reservation from job:reminder: 500.0ms, filter {"end": 1, "returned": 1}' \
+        in output
+    assert 'COLLSCAN for find on reservation' in output
@@ -1,10 +1,15 @@
+import asyncio
 from datetime import date, timedelta
+from uuid import uuid4
+
 from fastapi.testclient import TestClient
 
-from depot_server.api import app
+from depot_server.api import app, items as items_api
+from depot_server.db import collections, DbReservation
 from depot_server.helper.auth import Authentication
-from depot_server.model import ReservationInWrite, Reservation, Bay, BayInWrite, ItemCondition, Item, ReservationType, \
-    ReportItemInWrite, TotalReportState
+from depot_server.model import ReservationInWrite, Reservation, Bay, BayInWrite, ItemCondition, Item, ItemInWrite, \
+    ReservationType, ReportItemInWrite, TotalReportState, GroupReservationInWrite, GroupDayAvailability, Recurrence, \
+    RecurrenceFrequency, ReservationConflict, ReservationValidation, FreeWindow
 from tests.db_helper import clear_all
 from tests.mock_auth import MockAuthentication, MockAuth
 
@@ -220,3 +225,582 @@ def test_overlap(monkeypatch, motor_mock):
         )
         assert resp.status_code == 200, resp.text
         assert set(resp.json()) == set()
+
+
+def test_reservation_window(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+
+        create_item = ReportItemInWrite(
+            external_id='item_1',
+            name="Item 1",
+            total_report_state=TotalReportState.Fit,
+            condition=ItemCondition.Good,
+            change_comment="Created",
+            report=[],
+        )
+        resp = client.post(
+            '/api/v1/depot/items', data=create_item.json(), auth=MockAuth(sub='admin1', roles=['admin']),
+        )
+        assert resp.status_code == 201, resp.text
+        item_id = Item.validate(resp.json()).id
+
+        reservation_ids = []
+        for i in range(7):
+            create_reservation = ReservationInWrite(
+                type=ReservationType.PRIVATE,
+                name=f"Reservation {i}",
+                start=date.today() + timedelta(days=10 * i + 1),
+                end=date.today() + timedelta(days=10 * i + 2),
+                contact="12345",
+                items=[item_id],
+            )
+            resp = client.post(
+                '/api/v1/depot/reservations', data=create_reservation.json(), auth=MockAuth(sub='user1'),
+            )
+            assert resp.status_code == 201, resp.text
+            reservation_ids.append(Reservation.validate(resp.json()).id)
+
+        start = (date.today() + timedelta(days=25)).isoformat()
+        end = (date.today() + timedelta(days=45)).isoformat()
+        resp = client.get(
+            f'/api/v1/depot/reservations?start={start}&end={end}&limit_before_start=2&limit_after_end=2',
+            auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        # Descending by start: before window, the range itself, the following ones
+        assert [Reservation.validate(r).id for r in resp.json()] == [
+            reservation_ids[i] for i in [2, 1, 4, 3, 6, 5]
+        ]
+
+        resp = client.get(
+            f'/api/v1/depot/reservations?end={end}&limit_before_start=2', auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 400, resp.text
+
+
+def test_item_reservation_status(monkeypatch, motor_mock):
+    from depot_server.helper.item_reservation_status import task_sweep_item_reservation_status
+
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+
+        item_ids = []
+        for i in range(2):
+            create_item = ReportItemInWrite(
+                external_id=f'item_{i}',
+                name=f"Item {i}",
+                total_report_state=TotalReportState.Fit,
+                condition=ItemCondition.Good,
+                change_comment="Created",
+                report=[],
+            )
+            resp = client.post(
+                '/api/v1/depot/items', data=create_item.json(), auth=MockAuth(sub='admin1', roles=['admin']),
+            )
+            assert resp.status_code == 201, resp.text
+            item_ids.append(Item.validate(resp.json()).id)
+
+        def get_items(query: str = ''):
+            resp = client.get(f'/api/v1/depot/items{query}', auth=MockAuth(sub='user1'))
+            assert resp.status_code == 200, resp.text
+            return {item.id: item for item in (Item.validate(item) for item in resp.json())}
+
+        create_reservation = ReservationInWrite(
+            type=ReservationType.PRIVATE,
+            name="Current Reservation",
+            start=date.today() - timedelta(days=1),
+            end=date.today() + timedelta(days=1),
+            contact="12345",
+            items=[item_ids[0]],
+        )
+        resp = client.post(
+            '/api/v1/depot/reservations', data=create_reservation.json(),
+            auth=MockAuth(sub='admin1', roles=['admin']),
+        )
+        assert resp.status_code == 201, resp.text
+        current_reservation = Reservation.validate(resp.json())
+        create_reservation.name = "Next Reservation"
+        create_reservation.start = date.today() + timedelta(days=5)
+        create_reservation.end = date.today() + timedelta(days=6)
+        create_reservation.items = item_ids
+        resp = client.post(
+            '/api/v1/depot/reservations', data=create_reservation.json(), auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 201, resp.text
+        next_reservation = Reservation.validate(resp.json())
+
+        items = get_items()
+        assert items[item_ids[0]].current_reservation_id == current_reservation.id
+        assert items[item_ids[0]].next_reservation_start == next_reservation.start
+        assert items[item_ids[0]].available_until is None
+        assert items[item_ids[1]].current_reservation_id is None
+        assert items[item_ids[1]].available_until == next_reservation.start - timedelta(days=1)
+        assert set(get_items('?available=true')) == {item_ids[1]}
+        assert set(get_items('?available=false')) == {item_ids[0]}
+        assert set(get_items(f'?available_until={date.today() + timedelta(days=4)}')) == {item_ids[1]}
+        assert set(get_items(f'?available_until={date.today() + timedelta(days=5)}')) == set()
+
+        resp = client.put(
+            f'/api/v1/depot/reservations/{current_reservation.id}/return',
+            json={'items': [{'itemId': str(item_ids[0]), 'problem': False}]},
+            auth=MockAuth(sub='admin1', roles=['admin']),
+        )
+        assert resp.status_code == 200, resp.text
+        assert set(get_items('?available=true')) == set(item_ids)
+
+        resp = client.delete(
+            f'/api/v1/depot/reservations/{next_reservation.id}', auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        assert all(item.next_reservation_start is None for item in get_items().values())
+
+        # The sweep repairs a stale status
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(collections.item_collection.update_one(
+            {'_id': item_ids[0]}, {'$set': {'current_reservation_id': current_reservation.id}}
+        ))
+        stats = loop.run_until_complete(task_sweep_item_reservation_status())
+        assert stats['updated'] == 1
+        assert set(get_items('?available=true')) == set(item_ids)
+
+        # An item update does not overwrite the status written by a concurrent reservation change
+        save_state = items_api._save_state
+
+        async def save_state_with_concurrent_reservation(*args, **kwargs):
+            await collections.item_collection.update_one(
+                {'_id': item_ids[0]}, {'$set': {'current_reservation_id': current_reservation.id}}
+            )
+            await save_state(*args, **kwargs)
+
+        monkeypatch.setattr(items_api, '_save_state', save_state_with_concurrent_reservation)
+        update_item = ItemInWrite(
+            external_id='item_0', name="Item 0 Upd", condition=ItemCondition.Good, change_comment="Updated"
+        )
+        resp = client.put(
+            f'/api/v1/depot/items/{item_ids[0]}', data=update_item.json(), auth=MockAuth(sub='admin1', roles=['admin'])
+        )
+        assert resp.status_code == 200, resp.text
+        assert get_items()[item_ids[0]].name == "Item 0 Upd"
+        assert set(get_items('?available=false')) == {item_ids[0]}
+
+
+def test_item_reservation_status_backfill(monkeypatch, motor_mock):
+    from depot_server.helper.scheduler import scheduler
+
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+        loop = asyncio.get_event_loop()
+
+        # Items and reservations from before the status was denormalized
+        item_ids = [uuid4(), uuid4()]
+        loop.run_until_complete(collections.item_collection.collection.insert_many([
+            {'_id': item_id, 'name': f"Item {i}", 'condition': ItemCondition.Good.value, 'tags': []}
+            for i, item_id in enumerate(item_ids)
+        ]))
+        reservation = DbReservation(
+            id=uuid4(), type=ReservationType.PRIVATE, name="Existing", start=date.today() - timedelta(days=1),
+            end=date.today() + timedelta(days=1), user_id='user1', contact="12345", items=[item_ids[0]],
+        )
+        loop.run_until_complete(collections.reservation_collection.insert_one(reservation))
+
+        # The first registration runs the sweep right away, not only at the next slot
+        job = scheduler._jobs['item_reservation_status']
+        loop.run_until_complete(collections.scheduled_job_collection.delete_many({'_id': job.name}))
+        loop.run_until_complete(scheduler._register(job))
+        assert loop.run_until_complete(scheduler.try_run(job))
+        assert not loop.run_until_complete(scheduler.try_run(job))
+
+        resp = client.get('/api/v1/depot/items?available=false', auth=MockAuth(sub='user1'))
+        assert resp.status_code == 200, resp.text
+        items = [Item.validate(item) for item in resp.json()]
+        assert [item.id for item in items] == [item_ids[0]]
+        assert items[0].current_reservation_id == reservation.id
+
+
+def test_group_reservation(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+
+        item_ids = []
+        for i, condition in enumerate((ItemCondition.Good, ItemCondition.Good, ItemCondition.Ok, ItemCondition.Gone)):
+            resp = client.post(
+                '/api/v1/depot/items',
+                data=ReportItemInWrite(
+                    name=f"Harness {i}", condition=condition, group_id='harness', change_comment="Created",
+                    total_report_state=TotalReportState.Fit, report=[],
+                ).json(),
+                auth=MockAuth(sub='admin1', roles=['admin']),
+            )
+            assert resp.status_code == 201, resp.text
+            item_ids.append(Item.validate(resp.json()).id)
+
+        day = date.today() + timedelta(days=10)
+        resp = client.post(
+            '/api/v1/depot/reservations',
+            data=ReservationInWrite(
+                type=ReservationType.PRIVATE, name="Before", start=day, end=day + timedelta(days=2),
+                contact="12345", items=[item_ids[1]],
+            ).json(),
+            auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 201, resp.text
+
+        create_group_reservation = GroupReservationInWrite(
+            type=ReservationType.PRIVATE, name="Training", start=day + timedelta(days=3),
+            end=day + timedelta(days=4), contact="12345", group_id='harness', count=2,
+        )
+        resp = client.post(
+            '/api/v1/depot/reservations/group', data=create_group_reservation.json(), auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 201, resp.text
+        group_reservation = Reservation.validate(resp.json())
+        assert group_reservation.user_id == 'user1'
+        assert len(group_reservation.items) == 2
+        # Best fit: the item which is reserved right before is used
+        assert item_ids[1] in group_reservation.items
+        assert item_ids[3] not in group_reservation.items
+
+        resp = client.get(
+            '/api/v1/depot/reservations/groups/harness/availability',
+            params={'start': day.isoformat(), 'end': (day + timedelta(days=5)).isoformat()},
+            auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        availability = [GroupDayAvailability.validate(entry) for entry in resp.json()]
+        assert [entry.day for entry in availability] == [day + timedelta(days=offset) for offset in range(6)]
+        assert all(entry.total == 3 for entry in availability)
+        assert [entry.available for entry in availability] == [2, 2, 2, 1, 1, 3]
+
+        # Only one item is left
+        resp = client.post(
+            '/api/v1/depot/reservations/group', data=create_group_reservation.json(), auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 400, resp.text
+        create_group_reservation.group_id = 'unknown'
+        resp = client.post(
+            '/api/v1/depot/reservations/group', data=create_group_reservation.json(), auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 404, resp.text
+        assert asyncio.get_event_loop().run_until_complete(collections.group_lock_collection.count_documents({})) == 0
+
+
+def test_reservation_series(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+
+        item_ids = []
+        for i in range(2):
+            resp = client.post(
+                '/api/v1/depot/items',
+                data=ReportItemInWrite(
+                    name=f"Item {i}", condition=ItemCondition.Good, change_comment="Created",
+                    total_report_state=TotalReportState.Fit, report=[],
+                ).json(),
+                auth=MockAuth(sub='admin1', roles=['admin']),
+            )
+            assert resp.status_code == 201, resp.text
+            item_ids.append(Item.validate(resp.json()).id)
+
+        day = date.today() + timedelta(days=10)
+        resp = client.post(
+            '/api/v1/depot/reservations',
+            data=ReservationInWrite(
+                type=ReservationType.PRIVATE, name="Other", start=day + timedelta(days=15),
+                end=day + timedelta(days=15), contact="12345", items=[item_ids[0]],
+            ).json(),
+            auth=MockAuth(sub='user2'),
+        )
+        assert resp.status_code == 201, resp.text
+
+        create_series = ReservationInWrite(
+            type=ReservationType.PRIVATE, name="Training", start=day, end=day + timedelta(days=1),
+            contact="12345", items=[item_ids[0]],
+            recurrence=Recurrence(frequency=RecurrenceFrequency.Weekly, count=4),
+        )
+        resp = client.post('/api/v1/depot/reservations', data=create_series.json(), auth=MockAuth(sub='user1'))
+        assert resp.status_code == 400, resp.text
+
+        create_series.recurrence.count = 2
+        resp = client.post('/api/v1/depot/reservations', data=create_series.json(), auth=MockAuth(sub='user1'))
+        assert resp.status_code == 201, resp.text
+        first = Reservation.validate(resp.json())
+        assert first.series_id is not None
+        assert (first.start, first.end) == (day, day + timedelta(days=1))
+
+        resp = client.get(
+            '/api/v1/depot/reservations', params={'series_id': str(first.series_id)}, auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        assert sorted(Reservation.validate(occurrence).start for occurrence in resp.json()) == [
+            day, day + timedelta(days=7)
+        ]
+
+        resp = client.put(
+            f'/api/v1/depot/reservations/{first.id}',
+            data=ReservationInWrite(
+                type=ReservationType.PRIVATE, name="Moved", start=day, end=day, contact="12345", items=[item_ids[0]],
+            ).json(),
+            auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        assert Reservation.validate(resp.json()).series_id == first.series_id
+
+        update_series = ReservationInWrite(
+            type=ReservationType.PRIVATE, name="Training 2", start=day, end=day + timedelta(days=1),
+            contact="12345", items=[item_ids[1]],
+            recurrence=Recurrence(frequency=RecurrenceFrequency.Weekly, until=day + timedelta(days=21)),
+        )
+        resp = client.put(
+            f'/api/v1/depot/reservations/series/{first.series_id}', data=update_series.json(),
+            auth=MockAuth(sub='user2'),
+        )
+        assert resp.status_code == 403, resp.text
+        resp = client.put(
+            f'/api/v1/depot/reservations/series/{first.series_id}', data=update_series.json(),
+            auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        occurrences = [Reservation.validate(occurrence) for occurrence in resp.json()]
+        assert [occurrence.start for occurrence in occurrences] == [day + timedelta(days=7 * i) for i in range(4)]
+        assert all(occurrence.name == "Training 2" for occurrence in occurrences)
+        assert all(occurrence.items == [item_ids[1]] for occurrence in occurrences)
+        assert all(occurrence.series_id == first.series_id for occurrence in occurrences)
+
+        resp = client.delete(f'/api/v1/depot/reservations/series/{first.series_id}', auth=MockAuth(sub='user1'))
+        assert resp.status_code == 200, resp.text
+        resp = client.get(
+            '/api/v1/depot/reservations', params={'series_id': str(first.series_id)}, auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        assert resp.json() == []
+        resp = client.delete(f'/api/v1/depot/reservations/series/{first.series_id}', auth=MockAuth(sub='user1'))
+        assert resp.status_code == 404, resp.text
+
+
+def test_reservation_validation(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+
+        item_ids = []
+        for i in range(2):
+            resp = client.post(
+                '/api/v1/depot/items',
+                data=ReportItemInWrite(
+                    name=f"Item {i}", condition=ItemCondition.Good, change_comment="Created",
+                    total_report_state=TotalReportState.Fit, report=[],
+                ).json(),
+                auth=MockAuth(sub='admin1', roles=['admin']),
+            )
+            assert resp.status_code == 201, resp.text
+            item_ids.append(Item.validate(resp.json()).id)
+
+        day = date.today() + timedelta(days=10)
+        resp = client.post(
+            '/api/v1/depot/reservations',
+            data=ReservationInWrite(
+                type=ReservationType.PRIVATE, name="Other", start=day, end=day + timedelta(days=2), contact="12345",
+                items=[item_ids[0]],
+            ).json(),
+            auth=MockAuth(sub='user2'),
+        )
+        assert resp.status_code == 201, resp.text
+        other_reservation = Reservation.validate(resp.json())
+
+        create_reservation = ReservationInWrite(
+            type=ReservationType.PRIVATE, name="Mine", start=day + timedelta(days=1), end=day + timedelta(days=3),
+            contact="12345", items=item_ids,
+        )
+        resp = client.post(
+            '/api/v1/depot/reservations/validate', data=create_reservation.json(), auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        validation = ReservationValidation.validate(resp.json())
+        assert not validation.valid
+        assert validation.missing_items == []
+        assert validation.conflicts == [ReservationConflict(
+            reservation_id=other_reservation.id, item_ids=[item_ids[0]], start=day + timedelta(days=1),
+            end=day + timedelta(days=2),
+        )]
+
+        resp = client.post(
+            '/api/v1/depot/reservations/validate', data=create_reservation.json(),
+            auth=MockAuth(sub='admin1', roles=['admin']),
+        )
+        assert resp.status_code == 200, resp.text
+        assert ReservationValidation.validate(resp.json()).conflicts[0].user_id == 'user2'
+
+        resp = client.post('/api/v1/depot/reservations', data=create_reservation.json(), auth=MockAuth(sub='user1'))
+        assert resp.status_code == 400, resp.text
+        assert resp.json()['detail']['conflicts'][0]['reservationId'] == str(other_reservation.id)
+
+        # Updating the conflicting reservation itself
+        resp = client.post(
+            '/api/v1/depot/reservations/validate', data=create_reservation.json(),
+            params={'skip_reservation_id': str(other_reservation.id)}, auth=MockAuth(sub='user2'),
+        )
+        assert resp.status_code == 200, resp.text
+        assert ReservationValidation.validate(resp.json()) == ReservationValidation(valid=True)
+
+        missing_item_id = uuid4()
+        create_reservation.items = [missing_item_id]
+        resp = client.post(
+            '/api/v1/depot/reservations/validate', data=create_reservation.json(), auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 200, resp.text
+        assert ReservationValidation.validate(resp.json()) == ReservationValidation(
+            valid=False, missing_items=[missing_item_id]
+        )
+
+
+def test_free_windows(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+
+        item_ids = []
+        for i in range(3):
+            resp = client.post(
+                '/api/v1/depot/items',
+                data=ReportItemInWrite(
+                    name=f"Tent {i}", condition=ItemCondition.Good, group_id='tent', change_comment="Created",
+                    total_report_state=TotalReportState.Fit, report=[],
+                ).json(),
+                auth=MockAuth(sub='admin1', roles=['admin']),
+            )
+            assert resp.status_code == 201, resp.text
+            item_ids.append(Item.validate(resp.json()).id)
+
+        day = date.today() + timedelta(days=10)
+
+        def days(first: int, last: int) -> FreeWindow:
+            return FreeWindow(start=day + timedelta(days=first), end=day + timedelta(days=last))
+
+        for item_id, first, last in ((item_ids[0], 2, 4), (item_ids[1], 3, 6), (item_ids[0], 10, 11)):
+            resp = client.post(
+                '/api/v1/depot/reservations',
+                data=ReservationInWrite(
+                    type=ReservationType.PRIVATE, name="Trip", start=day + timedelta(days=first),
+                    end=day + timedelta(days=last), contact="12345", items=[item_id],
+                ).json(),
+                auth=MockAuth(sub='user1'),
+            )
+            assert resp.status_code == 201, resp.text
+
+        def free_windows(**params) -> list:
+            resp = client.get(
+                '/api/v1/depot/reservations/free-windows',
+                params={'start': day.isoformat(), 'horizon': 20, 'duration': 3, **params},
+                auth=MockAuth(sub='user1'),
+            )
+            assert resp.status_code == 200, resp.text
+            return [FreeWindow.validate(window) for window in resp.json()]
+
+        # Both items are busy on days 2-6 and 10-11, the gap of days 0-1 is too short
+        item_params = {'item_ids': [str(item_ids[0]), str(item_ids[1])]}
+        assert free_windows(**item_params) == [days(7, 9), days(12, 19)]
+        assert free_windows(**item_params, limit=1) == [days(7, 9)]
+        assert free_windows(**item_params, duration=4) == [days(12, 19)]
+
+        assert free_windows(group_id='tent', count=2) == [days(0, 2), days(5, 19)]
+        assert free_windows(group_id='tent', count=3) == [days(7, 9), days(12, 19)]
+
+        for params, status_code in (
+                ({}, 400),
+                ({**item_params, 'group_id': 'tent'}, 400),
+                ({'group_id': 'tent', 'count': 4}, 400),
+                ({'group_id': 'boat'}, 404),
+                ({'item_ids': [str(uuid4())]}, 404),
+        ):
+            resp = client.get(
+                '/api/v1/depot/reservations/free-windows', params={'duration': 3, **params},
+                auth=MockAuth(sub='user1'),
+            )
+            assert resp.status_code == status_code, resp.text
+
+
+def test_concurrent_reservation(monkeypatch, motor_mock):
+    from depot_server.api import reservations
+
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+        loop = asyncio.get_event_loop()
+
+        resp = client.post(
+            '/api/v1/depot/items',
+            data=ReportItemInWrite(
+                name="Tent", condition=ItemCondition.Good, change_comment="Created",
+                total_report_state=TotalReportState.Fit, report=[],
+            ).json(),
+            auth=MockAuth(sub='admin1', roles=['admin']),
+        )
+        assert resp.status_code == 201, resp.text
+        item_id = Item.validate(resp.json()).id
+
+        day = date.today() + timedelta(days=10)
+        create_reservation = ReservationInWrite(
+            type=ReservationType.PRIVATE, name="Mine", start=day, end=day + timedelta(days=2), contact="12345",
+            items=[item_id],
+        )
+        resp = client.post(
+            '/api/v1/depot/reservations', data=create_reservation.json(), auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 201, resp.text
+        reservation = Reservation.validate(resp.json())
+
+        # Another writer (e.g. a group reservation) inserts right after the checks passed
+        check_items = reservations._check_items
+        concurrent_reservations = []
+
+        async def check_items_then_concurrent_write(item_ids, occurrences, *args, **kwargs):
+            await check_items(item_ids, occurrences, *args, **kwargs)
+            (start, end), = occurrences
+            concurrent_reservation = DbReservation(
+                id=uuid4(), type=ReservationType.PRIVATE, name="Concurrent", start=start, end=end, user_id='user2',
+                contact="12345", items=item_ids,
+            )
+            await collections.reservation_collection.insert_one(concurrent_reservation)
+            concurrent_reservations.append(concurrent_reservation)
+
+        monkeypatch.setattr(reservations, '_check_items', check_items_then_concurrent_write)
+
+        create_reservation.start = day + timedelta(days=21)
+        create_reservation.end = day + timedelta(days=21)
+        resp = client.post(
+            '/api/v1/depot/reservations', data=create_reservation.json(), auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 409, resp.text
+
+        create_reservation.start = day + timedelta(days=30)
+        create_reservation.end = day + timedelta(days=31)
+        resp = client.put(
+            f'/api/v1/depot/reservations/{reservation.id}', data=create_reservation.json(),
+            auth=MockAuth(sub='user1'),
+        )
+        assert resp.status_code == 409, resp.text
+
+        # Only the concurrent reservations and the unchanged first reservation are left
+        stored = loop.run_until_complete(_all_reservations())
+        assert sorted(stored.keys()) == sorted(
+            [reservation.id] + [concurrent_reservation.id for concurrent_reservation in concurrent_reservations]
+        )
+        assert stored[reservation.id].start == day
+
+
+async def _all_reservations():
+    return {reservation.id: reservation async for reservation in collections.reservation_collection.find({})}
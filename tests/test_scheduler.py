@@ -0,0 +1,147 @@
+import asyncio
+from datetime import time, timedelta
+
+from fastapi.testclient import TestClient
+
+from depot_server.api import app
+from depot_server.config import config
+from depot_server.db import collections
+from depot_server.helper.auth import Authentication
+from depot_server.helper.scheduler import Scheduler, due_slot, next_slot
+from depot_server.helper.util import utc_now
+from depot_server.model import ScheduledJob
+from tests.db_helper import clear_all
+from tests.mock_auth import MockAuthentication, MockAuth
+
+
+def test_slots():
+    now = utc_now()
+    slot = due_slot(time(10, 0), now)
+    assert slot <= now < slot + timedelta(days=1)
+    # Daylight saving time may shift the next slot by an hour
+    assert now < next_slot(time(10, 0), now) <= slot + timedelta(days=1, hours=1)
+
+
+def test_scheduler(monkeypatch, motor_mock):
+    monkeypatch.setattr(Authentication, '__call__', MockAuthentication.__call__)
+
+    with TestClient(app) as client:
+        clear_all()
+        loop = asyncio.get_event_loop()
+
+        runs = []
+
+        async def task():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return {'sent': 3}
+
+        worker_1 = Scheduler('worker1')
+        worker_2 = Scheduler('worker2')
+        worker_1.add_daily_job('test_job', time(10, 0), task)
+        worker_2.add_daily_job('test_job', time(10, 0), task)
+        job = worker_1._jobs['test_job']
+        loop.run_until_complete(asyncio.gather(worker_1._register(job), worker_2._register(job)))
+
+        # Registered jobs do not run right away
+        assert not loop.run_until_complete(worker_1.try_run(job))
+
+        # A due job runs on exactly one worker
+        loop.run_until_complete(collections.scheduled_job_collection.update_one(
+            {'_id': 'test_job'}, {'$set': {'completed_slot': due_slot(job.time_of_day) - timedelta(days=1)}}
+        ))
+        ran = loop.run_until_complete(asyncio.gather(worker_1.try_run(job), worker_2.try_run(job)))
+        assert sorted(ran) == [False, True]
+        assert len(runs) == 1
+        assert not loop.run_until_complete(worker_2.try_run(job))
+
+        # Expired lease of a dead worker is taken over
+        loop.run_until_complete(collections.scheduled_job_collection.update_one(
+            {'_id': 'test_job'},
+            {'$set': {
+                'completed_slot': due_slot(job.time_of_day) - timedelta(days=1),
+                'lease_owner': 'dead_worker',
+                'lease_until': utc_now() + timedelta(minutes=1),
+            }}
+        ))
+        assert not loop.run_until_complete(worker_2.try_run(job))
+        loop.run_until_complete(collections.scheduled_job_collection.update_one(
+            {'_id': 'test_job'}, {'$set': {'lease_until': utc_now() - timedelta(seconds=1)}}
+        ))
+        assert loop.run_until_complete(worker_2.try_run(job))
+        assert len(runs) == 2
+
+        resp = client.get('/api/v1/depot/scheduler/jobs', auth=MockAuth(sub='admin1', roles=['admin']))
+        assert resp.status_code == 200, resp.text
+        jobs = {job.id: job for job in (ScheduledJob.validate(job) for job in resp.json())}
+        assert 'return_reservation_reminder' in jobs
+        assert jobs['test_job'].last_run_result == {'sent': 3}
+        assert jobs['test_job'].last_run_duration is not None
+        assert jobs['test_job'].lease_owner is None
+
+        # A triggered job runs before its next slot
+        assert loop.run_until_complete(worker_1.trigger('unknown_job')) is None
+        assert not loop.run_until_complete(worker_1.try_run(job))
+        triggered = loop.run_until_complete(worker_1.trigger('test_job'))
+        assert triggered is not None
+        assert loop.run_until_complete(worker_1.try_run(job))
+        assert len(runs) == 3
+        resp = client.get('/api/v1/depot/scheduler/jobs/test_job', auth=MockAuth(sub='admin1', roles=['admin']))
+        assert resp.status_code == 200, resp.text
+        assert ScheduledJob.validate(resp.json()).completed_slot > triggered.completed_slot
+        resp = client.get('/api/v1/depot/scheduler/jobs/unknown_job', auth=MockAuth(sub='admin1', roles=['admin']))
+        assert resp.status_code == 404, resp.text
+
+
+def test_scheduler_retry(monkeypatch, motor_mock):
+    monkeypatch.setattr(config.scheduler, 'max_attempts', 3)
+
+    with TestClient(app):
+        clear_all()
+        loop = asyncio.get_event_loop()
+
+        runs = []
+
+        async def task():
+            runs.append(1)
+            raise RuntimeError("Mail server down")
+
+        worker = Scheduler('worker1')
+        worker.add_daily_job('failing_job', time(10, 0), task)
+        job = worker._jobs['failing_job']
+        loop.run_until_complete(worker._register(job))
+        slot = due_slot(job.time_of_day)
+        loop.run_until_complete(collections.scheduled_job_collection.update_one(
+            {'_id': 'failing_job'}, {'$set': {'completed_slot': slot - timedelta(days=1)}}
+        ))
+        # Read back without timezone
+        naive_slot = slot.replace(tzinfo=None)
+
+        def expire_backoff():
+            loop.run_until_complete(collections.scheduled_job_collection.update_one(
+                {'_id': 'failing_job'}, {'$set': {'retry_after': utc_now() - timedelta(seconds=1)}}
+            ))
+
+        # A failed run keeps the slot due, but waits for the backoff
+        assert loop.run_until_complete(worker.try_run(job))
+        db_job = loop.run_until_complete(collections.scheduled_job_collection.find_one({'_id': 'failing_job'}))
+        assert db_job.completed_slot < naive_slot
+        assert db_job.failed_attempts == 1
+        assert db_job.retry_after > utc_now().replace(tzinfo=None)
+        assert db_job.lease_owner is None
+        assert "Mail server down" in db_job.last_run_error
+        assert not loop.run_until_complete(worker.try_run(job))
+
+        expire_backoff()
+        assert loop.run_until_complete(worker.try_run(job))
+        assert len(runs) == 2
+
+        # The slot is skipped after max_attempts
+        expire_backoff()
+        assert loop.run_until_complete(worker.try_run(job))
+        db_job = loop.run_until_complete(collections.scheduled_job_collection.find_one({'_id': 'failing_job'}))
+        assert db_job.completed_slot == naive_slot
+        assert db_job.failed_attempts == 0
+        assert db_job.retry_after is None
+        assert not loop.run_until_complete(worker.try_run(job))
+        assert len(runs) == 3